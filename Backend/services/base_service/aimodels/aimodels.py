@@ -1,9 +1,23 @@
 from google.cloud import firestore
+from common_code.single_flight import single_flight
 
 db = firestore.Client()
+AIMODELS_COLLECTION = "aimodels"
+catalog_version_ref = db.collection("collection_versions").document("aimodels")
 
+@single_flight
+def get_ai_models_version():
+    doc = catalog_version_ref.get()
+    return doc.to_dict().get("version") if doc.exists else None
+
+def bump_ai_models_version():
+    catalog_version_ref.set({"version": firestore.Increment(1)}, merge=True)
+    get_ai_models_version.forget_all()
+    get_all_ai_models.forget_all()
+
+@single_flight
 def get_all_ai_models():
-    aimodels_ref = db.collection("aimodels")
+    aimodels_ref = db.collection(AIMODELS_COLLECTION)
     docs = aimodels_ref.stream()
 
     models = []
@@ -12,4 +12,13 @@ class AIModel(BaseModel):
     metadata: Optional[Dict[str, Any]] = {}
     
 class AIModelsResponse(BaseModel):
-    ai_models: List[AIModel]
\ No newline at end of file
+    ai_models: List[AIModel]
+
+class CatalogModel(BaseModel):
+    """One entry of a catalog manifest, `model_id` is the document id"""
+    model_id: str
+    name: str
+    type: str
+    is_free: bool
+    description: str
+    metadata: Dict[str, Any] = {}
@@ -1,12 +1,17 @@
 # /aimodels/aimodels_router.py
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Request
+from common_code.fast_response import ValidatedModelRoute
 from get_user import get_current_user
 from aimodels.aimodels_model import AIModel, AIModelsResponse
-from aimodels.aimodels import get_all_ai_models 
+from aimodels.aimodels import get_all_ai_models, get_ai_models_version
+from common_code.http_cache import check_not_modified
 from common_code.common_exceptions import incorrect_auth_cred_exception
 
-router = APIRouter()
+router = APIRouter(route_class=ValidatedModelRoute)
 
-@router.get("/aimodels", response_model=AIModelsResponse, response_model_exclude_none=True, summary="Get all available AI models")
+def ai_models_not_modified(request: Request, uid: str = Depends(get_current_user)):
+    check_not_modified(request, get_ai_models_version())
+
+@router.get("/aimodels", response_model=AIModelsResponse, response_model_exclude_none=True, summary="Get all available AI models", dependencies=[Depends(ai_models_not_modified)])
 def get_all_ai_models_route(uid: str = Depends(get_current_user)):
     return get_all_ai_models()
@@ -0,0 +1,163 @@
+"""
+Syncs the `aimodels` catalog with a manifest file.
+
+The manifest is a YAML or JSON list of models (or an object with a `models` list), each with the
+fields of `CatalogModel`; `model_id` is the document id:
+
+    - model_id: gpt-4o-mini
+      name: GPT-4o mini
+      type: chat
+      is_free: true
+      description: Small, fast chat model
+      metadata: {context: 128000}
+
+The current catalog is read with one query and diffed field by field against the manifest. Only
+new and changed models are written, plus removed ones with `--prune`, through Firestore batches
+of `AIMODELS_SYNC_BATCH_SIZE`. A `count()` aggregation then checks that the collection holds the
+expected number of models. Finally the catalog version is bumped, which changes the ETag of
+`GET /aimodels/aimodels` and drops the catalog reads in flight.
+
+    python -m aimodels.catalog_sync catalog.yaml
+    python -m aimodels.catalog_sync catalog.json --dry-run   # print the changes only
+    python -m aimodels.catalog_sync catalog.yaml --prune     # also delete models missing from the manifest
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Tuple
+
+from pydantic import ValidationError
+
+from aimodels.aimodels import AIMODELS_COLLECTION, bump_ai_models_version, db
+from aimodels.aimodels_model import CatalogModel
+from config import get_ai_model_catalog_config
+from logconfig import get_logger
+
+try:
+    import yaml
+except ImportError:  # pragma: no cover
+    yaml = None
+
+logger = get_logger()
+
+MAX_BATCH_WRITES = 500
+
+
+class CatalogSyncError(RuntimeError):
+    pass
+
+
+class CatalogPlan(NamedTuple):
+    create: List[CatalogModel]
+    update: List[Tuple[str, Dict[str, Any]]]
+    delete: List[str]
+    unchanged: int
+    expected_count: int
+
+
+def load_manifest(path: str) -> List[CatalogModel]:
+    with open(path, encoding="utf-8") as manifest_file:
+        if Path(path).suffix.lower() in (".yaml", ".yml"):
+            if yaml is None:
+                raise CatalogSyncError("PyYAML is required to read YAML manifests")
+            entries = yaml.safe_load(manifest_file)
+        else:
+            entries = json.load(manifest_file)
+    if isinstance(entries, dict):
+        entries = entries.get("models")
+    if not isinstance(entries, list):
+        raise CatalogSyncError("The manifest must be a list of models or an object with a `models` list")
+
+    models, errors, seen = [], [], set()
+    for index, entry in enumerate(entries):
+        try:
+            model = CatalogModel.parse_obj(entry)
+        except ValidationError as e:
+            errors.append(f"entry {index}: {e}")
+            continue
+        if not model.model_id or "/" in model.model_id:
+            errors.append(f"entry {index}: invalid model_id {model.model_id!r}")
+        elif model.model_id in seen:
+            errors.append(f"entry {index}: duplicate model_id {model.model_id!r}")
+        seen.add(model.model_id)
+        models.append(model)
+    if errors:
+        raise CatalogSyncError("Invalid manifest:\n" + "\n".join(errors))
+    return models
+
+
+def plan_sync(models: List[CatalogModel], prune: bool = False) -> CatalogPlan:
+    current = {doc.id: doc.to_dict() for doc in db.collection(AIMODELS_COLLECTION).stream()}
+    create, update, unchanged = [], [], 0
+    for model in models:
+        stored = current.get(model.model_id)
+        if stored is None:
+            create.append(model)
+            continue
+        changes = {field: value for field, value in model.dict().items() if stored.get(field) != value}
+        if changes:
+            update.append((model.model_id, changes))
+        else:
+            unchanged += 1
+    listed = {model.model_id for model in models}
+    extra = sorted(model_id for model_id in current if model_id not in listed)
+    delete = extra if prune else []
+    return CatalogPlan(create, update, delete, unchanged, len(models) + len(extra) - len(delete))
+
+
+def apply_plan(plan: CatalogPlan, batch_size: int):
+    collection = db.collection(AIMODELS_COLLECTION)
+    now = int(time.time())
+    writes = [(collection.document(model.model_id), "set", {**model.dict(), "created_at": now, "updated_at": now}) for model in plan.create]
+    writes += [(collection.document(model_id), "update", {**changes, "updated_at": now}) for model_id, changes in plan.update]
+    writes += [(collection.document(model_id), "delete", None) for model_id in plan.delete]
+
+    batch_size = max(1, min(batch_size, MAX_BATCH_WRITES))
+    for start in range(0, len(writes), batch_size):
+        batch = db.batch()
+        for reference, op, data in writes[start:start + batch_size]:
+            if op == "delete":
+                batch.delete(reference)
+            else:
+                getattr(batch, op)(reference, data)
+        batch.commit()
+
+
+def count_models() -> int:
+    return db.collection(AIMODELS_COLLECTION).count().get()[0][0].value
+
+
+def sync_catalog(path: str, prune: bool = False, dry_run: bool = False) -> Dict[str, Any]:
+    started = time.perf_counter()
+    plan = plan_sync(load_manifest(path), prune)
+    summary = {
+        "created": len(plan.create), "updated": len(plan.update), "deleted": len(plan.delete),
+        "unchanged": plan.unchanged, "expected_count": plan.expected_count,
+    }
+    if dry_run:
+        summary["changes"] = {
+            "create": [model.model_id for model in plan.create],
+            "update": {model_id: sorted(changes) for model_id, changes in plan.update},
+            "delete": plan.delete,
+        }
+        return summary
+
+    if plan.create or plan.update or plan.delete:
+        apply_plan(plan, get_ai_model_catalog_config().sync_batch_size)
+        bump_ai_models_version()
+    count = count_models()
+    if count != plan.expected_count:
+        raise CatalogSyncError(f"The catalog holds {count} models after the sync, expected {plan.expected_count}")
+    summary["duration_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    logger.info("Synced AI model catalog", **summary)
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sync the AI model catalog with a YAML or JSON manifest")
+    parser.add_argument("manifest")
+    parser.add_argument("--prune", action="store_true", help="delete models that are not in the manifest")
+    parser.add_argument("--dry-run", action="store_true", help="print the changes without writing them")
+    args = parser.parse_args()
+    print(json.dumps(sync_catalog(args.manifest, prune=args.prune, dry_run=args.dry_run), indent=2))
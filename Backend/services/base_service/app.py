@@ -19,9 +19,20 @@ from starlette.exceptions import HTTPException as StarletteHTTPException
 from structlog.contextvars import clear_contextvars, bind_contextvars
 
 
-from config import get_config_sm, get_local_config, get_config
+from config import get_config_sm, get_local_config, get_config, get_response_config
 from environment import get_environment, Environment
-from logconfig import configure_logging, get_logger
+from logconfig import configure_logging, get_logger, shutdown_logging
+from common_code.outbound_http import close_outbound_pool
+from common_code.blocking import shutdown_blocking_executor
+from test_runner.sharding import shutdown_sharded_executor
+from common_code.fast_response import FastJSONResponse
+from common_code.compression import CompressionMiddleware
+from common_code.http_cache import NotModified, not_modified_handler
+from common_code.rate_limit import RateLimitMiddleware
+from common_code.profiling import ProfilingMiddleware
+from manage_user.manage_user import get_user_plan
+from projects.spec_sync import start_spec_sync_scheduler, stop_spec_sync_scheduler
+from projects.schedules import start_schedule_dispatcher, stop_schedule_dispatcher
 
 cloud_trace_context = contextvars.ContextVar('cloud_trace_context', default='')
 http_request_context = contextvars.ContextVar('http_request_context', default=dict({}))
@@ -32,7 +43,7 @@ def create_app(routers, root_path=''):
     configure_logging(env)
     logger = get_logger()
 
-    fastapi_app = FastAPI(openapi_url= f"{root_path}/openapi.json")
+    fastapi_app = FastAPI(openapi_url= f"{root_path}/openapi.json", default_response_class=FastJSONResponse)
     for key in routers:
         fastapi_app.include_router(routers[key], prefix= f"{root_path}{key}")
         
@@ -41,6 +52,20 @@ def create_app(routers, root_path=''):
         """r
         Things that should happen on app startup are defined here
         """
+        start_spec_sync_scheduler()
+        start_schedule_dispatcher()
+
+    @fastapi_app.on_event("shutdown")
+    async def app_shutdown():
+        """
+        Things that should happen on app shutdown are defined here
+        """
+        await stop_spec_sync_scheduler()
+        await stop_schedule_dispatcher()
+        await close_outbound_pool()
+        shutdown_sharded_executor()
+        shutdown_blocking_executor()
+        shutdown_logging()
 
     @fastapi_app.get("/", response_class=HTMLResponse, include_in_schema=False)
     async def home():
@@ -76,6 +101,8 @@ def create_app(routers, root_path=''):
             status_code=500,
         )
 
+    fastapi_app.add_exception_handler(NotModified, not_modified_handler)
+
     @fastapi_app.exception_handler(StarletteHTTPException)
     async def http_exception_handler(request, exc):
         headers = getattr(exc, "headers", None)
@@ -86,6 +113,9 @@ def create_app(routers, root_path=''):
         else:
             return JSONResponse({"error": exc.detail}, status_code=exc.status_code)
 
+    # Added before log_requests so rejected requests are logged with their request id
+    fastapi_app.add_middleware(RateLimitMiddleware, plan_resolver=get_user_plan)
+
     @fastapi_app.middleware("http")
     async def log_requests(request: Request, call_next):
         """
@@ -101,7 +131,13 @@ def create_app(routers, root_path=''):
         request.state.request_id = request_id
         bind_contextvars(request_id=request_id)
         response = await call_next(request)
-        response.headers['Cache-Control']= 'no-store'
+        if 200 <= response.status_code < 300 and request.method in ("GET", "HEAD"):
+            response.headers['Cache-Control'] = getattr(request.state, 'cache_control', 'no-store')
+            etag = getattr(request.state, 'etag', None)
+            if etag and 'etag' not in response.headers:
+                response.headers['ETag'] = etag
+        elif response.status_code != 304:
+            response.headers['Cache-Control']= 'no-store'
 
 
         if 200 <= response.status_code < 400:
@@ -119,6 +155,7 @@ def create_app(routers, root_path=''):
             async for data in response.body_iterator:
                 binary += data
             body = binary.decode()
+            original_headers = response.headers
             # if 'x-cloud-trace-context' in request.headers:
             trace_header = request.headers.get('x-cloud-trace-context')
             log.warning(
@@ -137,9 +174,21 @@ def create_app(routers, root_path=''):
                 response = JSONResponse(content=json_body, status_code=response.status_code)
             except Exception:
                 response = Response(content=body, status_code=response.status_code)
+            for header in ('Retry-After', 'X-RateLimit-Limit', 'X-RateLimit-Remaining'):
+                if header in original_headers:
+                    response.headers[header] = original_headers[header]
             response.headers['Cache-Control']= 'no-store'
             return response
-    
+
+    response_config = get_response_config()
+    fastapi_app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=response_config.compression_minimum_size,
+        gzip_level=response_config.gzip_level,
+        brotli_quality=response_config.brotli_quality,
+    )
+    # Outside of logging and compression, so a profile covers the whole request
+    fastapi_app.add_middleware(ProfilingMiddleware)
 
     if env == Environment.development:
         allowed_origins_config = ["http://localhost:8080", "http://localhost:5173", "https://apiverge-web-app.web.app", "https://apiverge-web-app.firebaseapp.com"]
@@ -0,0 +1,299 @@
+"""
+End-to-end API benchmark on the in-memory Firestore / Firebase Auth fakes (see `fake_gcp`).
+
+Every router is driven through the real app over an ASGI client, against seeded datasets of
+increasing size. Each route reports p50 / p95 latency, Firestore and Auth round trips per
+request, and the peak memory allocated while serving one request. Results are compared with
+`baseline_api.json`: the run fails when a route needs more round trips than the baseline, or
+its latency or memory grew by more than `--threshold`. Latencies are only compared against a
+baseline recorded with the same `--latency-ms` and `--iterations`.
+
+Run from the service directory:
+    python -m benchmarks.bench_api
+    python -m benchmarks.bench_api --sizes small medium --latency-ms 2 --threshold 0.25
+    python -m benchmarks.bench_api --update-baseline
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+from benchmarks import fake_gcp
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline_api.json")
+ROOT = "/b"
+BENCH_UID = "bench-user"
+HEADERS = {"Authorization": f"Bearer token-{BENCH_UID}"}
+
+DATASETS = {
+    "small": {"projects": 3, "endpoints": 20, "runs": 5, "results": 20, "models": 10, "users": 20},
+    "medium": {"projects": 10, "endpoints": 100, "runs": 20, "results": 100, "models": 50, "users": 200},
+    "large": {"projects": 25, "endpoints": 300, "runs": 50, "results": 250, "models": 200, "users": 1000},
+}
+
+# Absolute slack on top of the relative threshold, so sub-millisecond noise never fails a run
+MIN_LATENCY_SLACK_MS = 1.0
+MIN_MEMORY_SLACK_KIB = 64.0
+
+
+class Scenario(NamedTuple):
+    name: str
+    method: str
+    path: Callable[[Dict[str, Any]], str]
+    body: Optional[Callable[[Dict[str, Any]], Any]] = None
+    authenticated: bool = True
+
+
+SCENARIOS = [
+    Scenario("GET /user/users/me", "GET", lambda ids: "/user/users/me"),
+    Scenario("GET /user/users/{id}", "GET", lambda ids: f"/user/users/{ids['other_user']}"),
+    Scenario("GET /user/users/search", "GET", lambda ids: "/user/users/search?q=bench"),
+    Scenario("PUT /user/users/", "PUT", lambda ids: "/user/users/", lambda ids: {"country": "DE"}),
+    Scenario("POST /user/users/check-exists", "POST", lambda ids: "/user/users/check-exists", lambda ids: {"email": "user-1@bench.dev"}, False),
+    Scenario("GET /user_check_by_email_id/", "GET", lambda ids: "/user_check_by_email_id/?email_id=user-1@bench.dev", authenticated=False),
+    Scenario("GET /aimodels/aimodels", "GET", lambda ids: "/aimodels/aimodels"),
+    Scenario("GET /projects/", "GET", lambda ids: "/projects/"),
+    Scenario("GET /projects/{id}", "GET", lambda ids: f"/projects/{ids['project']}"),
+    Scenario("GET /projects/{id}/endpoints", "GET", lambda ids: f"/projects/{ids['project']}/endpoints"),
+    Scenario("GET /projects/{id}/endpoints/search", "GET", lambda ids: f"/projects/{ids['project']}/endpoints/search?q=items%20id"),
+    Scenario("GET /projects/{id}/test-history", "GET", lambda ids: f"/projects/{ids['project']}/test-history?limit=10"),
+    Scenario("GET /projects/{id}/test-runs/{run}", "GET", lambda ids: f"/projects/{ids['project']}/test-runs/{ids['run']}"),
+    Scenario("GET /projects/{id}/schedules", "GET", lambda ids: f"/projects/{ids['project']}/schedules"),
+    Scenario("GET /projects/{id}/export/test-runs", "GET", lambda ids: f"/projects/{ids['project']}/export/test-runs?format=ndjson"),
+    Scenario("POST /projects/{id}/run-tests", "POST", lambda ids: f"/projects/{ids['project']}/run-tests",
+             lambda ids: {"test_ids": ids["tests"], "execution": "inline"}),
+    Scenario("GET /projects/scheduler/metrics", "GET", lambda ids: "/projects/scheduler/metrics"),
+]
+
+
+def seed(size: Dict[str, int]) -> Dict[str, Any]:
+    """Writes a dataset straight into the fake store and returns ids the scenarios use"""
+    store = fake_gcp.STORE
+    now = datetime.now(timezone.utc)
+    epoch = int(now.timestamp())
+    subscription = {"plan": "enterprise", "status": "active", "started_at": epoch, "ends_at": None, "auto_renew": True}
+
+    def user_doc(uid: str, index: int) -> Dict[str, Any]:
+        from manage_user.manage_user import build_search_name, build_search_tokens
+
+        first, last = ("Bench", "User") if uid == BENCH_UID else (f"First{index}", f"Last{index}")
+        # The bench user is an organization account and everyone else one of its members
+        membership = {"account_type": "organization"} if uid == BENCH_UID else {"account_type": "individual", "organization_id": BENCH_UID}
+        return {
+            "uuid": uid, "uid": uid, "email": f"user-{index}@bench.dev", "first_name": first, "last_name": last,
+            "search_name": build_search_name(first, last), "search_tokens": build_search_tokens(first, last),
+            "created_at": epoch, "updated_at": epoch, "subscription": subscription, **membership,
+        }
+
+    for index in range(size["users"]):
+        uid = BENCH_UID if index == 0 else f"user-{index}"
+        store.put(("users", uid), user_doc(uid, index))
+        fake_gcp.AUTH.add_user(uid, f"user-{index}@bench.dev")
+
+    for index in range(size["models"]):
+        store.put(("aimodels", f"model-{index}"), {
+            "name": f"Model {index}", "type": "chat", "model_id": f"vendor/model-{index}", "is_free": index % 2 == 0,
+            "description": "Benchmark model", "created_at": epoch, "updated_at": epoch, "metadata": {"context": 8192},
+        })
+    store.put(("collection_versions", "aimodels"), {"version": 1})
+
+    project_ids, test_ids, run_ids = [], [], []
+    for p in range(size["projects"]):
+        project_id = f"project-{p}"
+        project_ids.append(project_id)
+        store.put(("projects", project_id), {
+            "user_id": BENCH_UID, "name": f"Project {p}", "description": "Benchmark project", "type": "url",
+            "account_type": "individual", "created_at": now - timedelta(minutes=p), "updated_at": now,
+            "status": "active", "openapi_url": None, "version": 1, "schema_version": 1,
+        })
+        for e in range(size["endpoints"]):
+            endpoint_id = f"{project_id}-endpoint-{e}"
+            store.put(("projects", project_id, "endpoints", endpoint_id), {
+                "id": endpoint_id, "project_id": project_id, "path": f"/v1/resource{e % 25}/{{itemId}}/sub{e}",
+                "method": ("GET", "POST", "PUT", "DELETE")[e % 4], "tag": f"tag{e % 7}", "description": "Reads items by id",
+                "parameters": [{"name": "itemId", "in": "path", "required": True, "type": "string"}],
+                "requestBody": None, "responses": {"200": {"description": "OK", "content": None}}, "status": "active",
+            })
+            test_id = f"{endpoint_id}-test"
+            store.put(("projects", project_id, "tests", test_id), {
+                "project_id": project_id, "endpoint_id": endpoint_id, "method": "GET", "path": f"/v1/resource{e}",
+                "status": "passed", "response_time": 20.0 + e % 50, "status_code": 200,
+                "assertions": [{"name": "status", "passed": e % 10 != 0}], "error": None,
+            })
+            if p == 0:
+                test_ids.append(test_id)
+        for r in range(size["runs"]):
+            run_id = f"{project_id}-run-{r}"
+            if p == 0:
+                run_ids.append(run_id)
+            store.put(("projects", project_id, "test_runs", run_id), {
+                "id": run_id, "project_id": project_id, "created_at": now - timedelta(hours=r), "duration": 1.5,
+                "total_tests": size["results"], "passed_tests": size["results"] - 1, "failed_tests": 1, "pass_rate": 0.95,
+            })
+            for i in range(size["results"]):
+                store.put(("projects", project_id, "test_runs", run_id, "results", f"result-{i}"), {
+                    "id": f"result-{i}", "run_id": run_id, "project_id": project_id, "endpoint_id": f"{project_id}-endpoint-0",
+                    "method": "GET", "path": "/v1/resource0", "status": "passed", "response_time": 25.0,
+                    "status_code": 200, "assertions": [], "error": None,
+                })
+        store.put(("test_schedules", f"{project_id}-schedule"), {
+            "project_id": project_id, "user_id": BENCH_UID, "cron": "0 * * * *", "timezone": "UTC", "test_config": {},
+            "enabled": True, "created_at": now, "updated_at": now, "next_run_at": now + timedelta(hours=1),
+        })
+    return {
+        "project": project_ids[0], "run": run_ids[0], "tests": test_ids[:20], "other_user": "user-1",
+        "documents": store.document_count(),
+    }
+
+
+def reset_service_caches():
+    from common_code import rate_limit
+    from projects import endpoint_search
+
+    with endpoint_search._indexes_lock:
+        endpoint_search._indexes.clear()
+    with rate_limit._plan_cache_lock:
+        rate_limit._plan_cache.clear()
+
+
+async def run_scenario(client, scenario: Scenario, ids: Dict[str, Any], iterations: int) -> Dict[str, Any]:
+    path = ROOT + scenario.path(ids)
+    kwargs: Dict[str, Any] = {"headers": HEADERS if scenario.authenticated else {}}
+    if scenario.body is not None:
+        kwargs["json"] = scenario.body(ids)
+
+    response = await client.request(scenario.method, path, **kwargs)
+    if response.status_code >= 400:
+        return {"error": f"{response.status_code} {response.text[:200]}"}
+
+    latencies: List[float] = []
+    rpcs: List[int] = []
+    for _ in range(iterations):
+        before = fake_gcp.STATS.total()
+        started = time.perf_counter()
+        response = await client.request(scenario.method, path, **kwargs)
+        latencies.append((time.perf_counter() - started) * 1000)
+        rpcs.append(fake_gcp.STATS.total() - before)
+        if response.status_code >= 400:
+            return {"error": f"{response.status_code} {response.text[:200]}"}
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    start_bytes = tracemalloc.get_traced_memory()[0]
+    await client.request(scenario.method, path, **kwargs)
+    peak_bytes = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        "p50_ms": round(statistics.median(latencies), 3),
+        "p95_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 3),
+        "rpcs": round(sum(rpcs) / len(rpcs), 2),
+        "peak_kib": round((peak_bytes - start_bytes) / 1024, 1),
+    }
+
+
+async def run_benchmark(app, sizes: List[str], iterations: int) -> Dict[str, Dict[str, Any]]:
+    import httpx
+
+    results: Dict[str, Dict[str, Any]] = {}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        for size_name in sizes:
+            fake_gcp.reset()
+            reset_service_caches()
+            ids = seed(DATASETS[size_name])
+            print(f"\n{size_name}: {ids['documents']} documents")
+            print(f"  {'route':<42} {'p50 ms':>9} {'p95 ms':>9} {'rpcs':>7} {'peak KiB':>9}")
+            results[size_name] = {}
+            for scenario in SCENARIOS:
+                result = await run_scenario(client, scenario, ids, iterations)
+                results[size_name][scenario.name] = result
+                if "error" in result:
+                    print(f"  {scenario.name:<42} ERROR {result['error']}")
+                else:
+                    print(f"  {scenario.name:<42} {result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f} {result['rpcs']:>7.1f} {result['peak_kib']:>9.1f}")
+    return results
+
+
+def find_regressions(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Any], settings: Dict[str, Any], threshold: float) -> List[str]:
+    regressions = []
+    compare_latency = baseline.get("settings") == settings
+    if not compare_latency:
+        print(f"\nBaseline was recorded with {baseline.get('settings')}, comparing round trips and memory only")
+    for size_name, routes in results.items():
+        for route, result in routes.items():
+            if "error" in result:
+                regressions.append(f"{size_name} {route}: {result['error']}")
+                continue
+            base = baseline.get("results", {}).get(size_name, {}).get(route)
+            if not base or "error" in base:
+                continue
+            if result["rpcs"] > base["rpcs"] + 0.01:
+                regressions.append(f"{size_name} {route}: round trips {base['rpcs']} -> {result['rpcs']}")
+            if compare_latency and result["p50_ms"] > base["p50_ms"] * (1 + threshold) + MIN_LATENCY_SLACK_MS:
+                regressions.append(f"{size_name} {route}: p50 {base['p50_ms']}ms -> {result['p50_ms']}ms")
+            if result["peak_kib"] > base["peak_kib"] * (1 + threshold) + MIN_MEMORY_SLACK_KIB:
+                regressions.append(f"{size_name} {route}: peak memory {base['peak_kib']}KiB -> {result['peak_kib']}KiB")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API benchmark on in-memory Firestore / Auth fakes")
+    parser.add_argument("--sizes", nargs="+", choices=list(DATASETS), default=list(DATASETS))
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=1.0, help="injected latency per round trip")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed relative latency / memory growth")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--verbose", action="store_true", help="keep the service's request logs")
+    args = parser.parse_args()
+
+    os.environ.setdefault("GCP_PROJECT", "bench")
+    os.environ.setdefault("ENV_TYPE", "development")
+    # The benchmark user would otherwise be throttled by its own traffic
+    os.environ["RATE_LIMIT_ENABLED"] = "false"
+    os.environ.setdefault("TEST_RUN_SCHEDULER_OPERATORS", json.dumps([BENCH_UID]))
+    # Steady state after the project layout migration; set it to true to measure the cutover
+    os.environ.setdefault("PROJECT_LAYOUT_DUAL_READ", "false")
+    fake_gcp.install(latency=args.latency_ms / 1000)
+
+    import structlog
+    from main import app
+
+    if not args.verbose:
+        def drop(*_):
+            raise structlog.DropEvent
+        structlog.configure(processors=[drop])
+
+    results = asyncio.run(run_benchmark(app, args.sizes, args.iterations))
+    settings = {"latency_ms": args.latency_ms, "iterations": args.iterations}
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as fp:
+            json.dump({"settings": settings, "results": results}, fp, indent=2, sort_keys=True)
+            fp.write("\n")
+        print(f"\nBaseline written to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print("\nNo baseline to compare with, run with --update-baseline first")
+        return
+    with open(args.baseline) as fp:
+        baseline = json.load(fp)
+    regressions = find_regressions(results, baseline, settings, args.threshold)
+    if regressions:
+        print("\nRegressions:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+    print("\nNo regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Seeding the AI model catalog one `set()` per model (what `add.py` does) against
+`aimodels.catalog_sync`, and a re-sync of the same manifest with a few models changed, which
+only writes the changed ones.
+
+Run from the service directory:
+    python -m benchmarks.bench_catalog_sync --models 5000 --latency-ms 20
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from benchmarks import fake_gcp
+
+
+def _manifest(count: int, revision: int = 0, changed_every: int = 0):
+    return [
+        {
+            "model_id": f"model-{i}", "name": f"Model {i}", "type": "chat", "is_free": i % 2 == 0,
+            "description": f"Catalog model {i}" + (f" rev {revision}" if changed_every and i % changed_every == 0 else ""),
+            "metadata": {"context": 8192, "vendor": f"vendor-{i % 20}"},
+        }
+        for i in range(count)
+    ]
+
+
+def _write_manifest(directory: str, models) -> str:
+    path = os.path.join(directory, f"catalog-{time.monotonic_ns()}.json")
+    with open(path, "w") as manifest_file:
+        json.dump(models, manifest_file)
+    return path
+
+
+def one_by_one(models, single_limit: int) -> float:
+    from aimodels.aimodels import AIMODELS_COLLECTION, db
+
+    started = time.perf_counter()
+    for model in models[:single_limit]:
+        now = int(time.time())
+        db.collection(AIMODELS_COLLECTION).document(model["model_id"]).set({**model, "created_at": now, "updated_at": now})
+    return time.perf_counter() - started
+
+
+def timed_sync(path: str):
+    from aimodels.catalog_sync import sync_catalog
+
+    before = fake_gcp.STATS.total()
+    started = time.perf_counter()
+    summary = sync_catalog(path)
+    return time.perf_counter() - started, fake_gcp.STATS.total() - before, summary
+
+
+def main(count: int, latency_ms: float, single_limit: int, changed_every: int):
+    os.environ.setdefault("GCP_PROJECT", "demo")
+    os.environ.setdefault("GOOGLE_CLOUD_PROJECT", "demo")
+    fake_gcp.install(latency=latency_ms / 1000)
+
+    models = _manifest(count)
+    single_count = min(count, single_limit)
+    fake_gcp.reset()
+    single_seconds = one_by_one(models, single_count)
+    single_rpcs = fake_gcp.STATS.total()
+
+    fake_gcp.reset()
+    with tempfile.TemporaryDirectory() as directory:
+        seed_seconds, seed_rpcs, seed = timed_sync(_write_manifest(directory, models))
+        resync_seconds, resync_rpcs, resync = timed_sync(_write_manifest(directory, _manifest(count, 1, changed_every)))
+
+    print(f"{count} models, {latency_ms:g} ms per round trip")
+    print(f"one by one: {single_count} models in {single_seconds:.2f} s, {single_rpcs} round trips (~{single_seconds / single_count * count:.1f} s for {count})")
+    print(f"sync:       {seed['created']} created in {seed_seconds:.2f} s, {seed_rpcs} round trips")
+    print(f"re-sync:    {resync['updated']} updated, {resync['unchanged']} unchanged in {resync_seconds:.2f} s, {resync_rpcs} round trips")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--models", type=int, default=5000)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--single-limit", type=int, default=200, help="one-by-one writes to time, extrapolated to --models")
+    parser.add_argument("--changed-every", type=int, default=100, help="every n-th model changes between the two syncs")
+    args = parser.parse_args()
+    main(args.models, args.latency_ms, args.single_limit, args.changed_every)
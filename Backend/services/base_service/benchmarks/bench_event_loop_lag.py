@@ -0,0 +1,96 @@
+"""
+Event loop lag under concurrent signups, with the Firebase Auth and Firestore calls made inline
+on the loop (as `create_new_user` used to) and through the bounded blocking executor.
+
+A ticker task sleeps for a fixed interval and records how late it wakes up; that delay is what
+every other request on the worker waits on top of its own work. Round trips sleep for the
+injected latency, like the real sync clients.
+
+Run from the service directory:
+    python -m benchmarks.bench_event_loop_lag --signups 200 --latency-ms 20
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import statistics
+import time
+from typing import Dict, List
+
+from benchmarks import fake_gcp
+
+TICK_SECONDS = 0.005
+
+
+async def _ticker(lags: List[float], stop: asyncio.Event):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + TICK_SECONDS
+        await asyncio.sleep(TICK_SECONDS)
+        lags.append(max(0.0, loop.time() - expected))
+
+
+async def _inline_signup(user_create):
+    from firebase_admin import auth
+    from manage_user.manage_user import USERS_COLLECTION, db
+
+    firebase_user = auth.create_user(email=user_create.email, password=user_create.password, display_name=user_create.first_name)
+    db.collection(USERS_COLLECTION).document(firebase_user.uid).set(user_create.dict(exclude={"password"}))
+
+
+async def _executor_signup(user_create):
+    from manage_user.manage_user import create_new_user
+
+    await create_new_user(user_create)
+
+
+async def measure(mode: str, signups: int) -> Dict[str, float]:
+    from manage_user.manage_user_model import UserCreate
+
+    fake_gcp.reset()
+    signup = _inline_signup if mode == "inline" else _executor_signup
+    users = [UserCreate(email=f"user{i}@example.com", password="secret-password", first_name=f"First{i}", last_name="Last") for i in range(signups)]
+    lags: List[float] = []
+    stop = asyncio.Event()
+    ticker = asyncio.ensure_future(_ticker(lags, stop))
+    await asyncio.sleep(TICK_SECONDS * 2)
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        await asyncio.gather(*(signup(user) for user in users))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await ticker
+    lags_ms = sorted(lag * 1000 for lag in lags) or [0.0]
+    return {
+        "signups_per_s": signups / elapsed,
+        "lag_p50_ms": statistics.median(lags_ms),
+        "lag_p99_ms": lags_ms[min(len(lags_ms) - 1, int(len(lags_ms) * 0.99))],
+        "lag_max_ms": lags_ms[-1],
+        "ticks": len(lags),
+    }
+
+
+def main(signups: int, latency_ms: float):
+    os.environ.setdefault("GCP_PROJECT", "demo")
+    os.environ.setdefault("GOOGLE_CLOUD_PROJECT", "demo")
+    fake_gcp.install(latency=latency_ms / 1000)
+    from common_code.blocking import get_blocking_stats, shutdown_blocking_executor
+
+    print(f"{signups} concurrent signups, {latency_ms:g} ms per round trip")
+    for mode in ("inline", "executor"):
+        result = asyncio.run(measure(mode, signups))
+        print(
+            f"{mode:9s} {result['signups_per_s']:8.1f} signups/s   loop lag p50 {result['lag_p50_ms']:7.1f} ms"
+            f"   p99 {result['lag_p99_ms']:7.1f} ms   max {result['lag_max_ms']:7.1f} ms   ({result['ticks']} ticks)"
+        )
+    print(get_blocking_stats())
+    shutdown_blocking_executor()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--signups", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    args = parser.parse_args()
+    main(args.signups, args.latency_ms)
@@ -0,0 +1,86 @@
+"""
+Throughput of the mock server: route resolution alone and full requests through the bare ASGI
+app, for a spec with many templated paths.
+
+Run from the service directory:
+    python -m benchmarks.bench_mock_server --endpoints 2000 --requests 50000
+"""
+import argparse
+import asyncio
+import random
+import time
+from typing import Any, Dict, List
+
+from mock_server.mock_server import MockServer, RouteTable
+
+
+def build_endpoints(count: int) -> List[Dict[str, Any]]:
+    body = {
+        "type": "object",
+        "required": ["id", "name"],
+        "properties": {
+            "id": {"type": "string", "format": "uuid"},
+            "name": {"type": "string", "minLength": 1, "maxLength": 40},
+            "tags": {"type": "array", "items": {"type": "string"}},
+        },
+    }
+    endpoints = []
+    for i in range(count):
+        path = f"/service{i % 20}/resources{i}/{{resource_id}}" if i % 2 else f"/service{i % 20}/resources{i}"
+        endpoints.append({
+            "id": f"endpoint-{i}", "path": path, "method": "GET" if i % 3 else "POST",
+            "responses": {"200": {"description": "OK", "content": body}, "404": {"description": "Not found"}},
+        })
+    return endpoints
+
+
+def request_paths(endpoints: List[Dict[str, Any]], count: int) -> List[Dict[str, str]]:
+    rng = random.Random(1)
+    chosen = [rng.choice(endpoints) for _ in range(count)]
+    return [{"method": endpoint["method"], "path": endpoint["path"].replace("{resource_id}", str(rng.randrange(10 ** 6)))} for endpoint in chosen]
+
+
+async def asgi_requests(server: MockServer, requests: List[Dict[str, str]]) -> int:
+    served = 0
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal served
+        if message["type"] == "http.response.body":
+            served += 1
+
+    for request in requests:
+        scope = {"type": "http", "method": request["method"], "path": request["path"], "headers": []}
+        await server(scope, receive, send)
+    return served
+
+
+def main(endpoint_count: int, request_count: int):
+    endpoints = build_endpoints(endpoint_count)
+    started = time.perf_counter()
+    table = RouteTable(endpoints)
+    build_ms = (time.perf_counter() - started) * 1000
+    requests = request_paths(endpoints, request_count)
+
+    started = time.perf_counter()
+    for request in requests:
+        table.resolve(request["method"], request["path"], {})
+    resolve_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    served = asyncio.run(asgi_requests(MockServer(table), requests))
+    asgi_seconds = time.perf_counter() - started
+
+    print(f"routes={table.size} table build: {build_ms:.1f} ms")
+    print(f"resolve:      {request_count / resolve_seconds:10.0f} requests/s")
+    print(f"ASGI request: {served / asgi_seconds:10.0f} requests/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--endpoints", type=int, default=2000)
+    parser.add_argument("--requests", type=int, default=50000)
+    args = parser.parse_args()
+    main(args.endpoints, args.requests)
@@ -0,0 +1,87 @@
+"""
+Outbound throughput with and without connection pooling against a local stand-in server.
+
+Run from the service directory:
+    python -m benchmarks.bench_outbound_pooling --requests 2000 --concurrency 50
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from common_code.outbound_http import OutboundHttpPool
+from config import OutboundHttpConfig
+
+RESPONSE = (
+    b"HTTP/1.1 200 OK\r\n"
+    b"Content-Type: application/json\r\n"
+    b"Content-Length: 11\r\n"
+    b"Connection: keep-alive\r\n\r\n"
+    b'{"ok":true}'
+)
+
+
+async def _handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        while True:
+            head = await reader.readuntil(b"\r\n\r\n")
+            if not head:
+                break
+            writer.write(RESPONSE)
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionResetError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_stand_in_server():
+    server = await asyncio.start_server(_handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    return server, f"http://127.0.0.1:{port}/ping"
+
+
+async def _drive(send, total: int, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            response = await send()
+            response.raise_for_status()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    return total / (time.perf_counter() - started)
+
+
+async def main(total: int, concurrency: int):
+    server, url = await start_stand_in_server()
+
+    async def fresh_client():
+        async with httpx.AsyncClient() as client:
+            return await client.get(url)
+
+    config = OutboundHttpConfig(requests_per_second=1e9, burst=10 ** 6, http2=False)
+    pool = OutboundHttpPool(config)
+
+    async def pooled():
+        return await pool.get(url)
+
+    unpooled_rps = await _drive(fresh_client, total, concurrency)
+    pooled_rps = await _drive(pooled, total, concurrency)
+    await pool.aclose()
+    server.close()
+    await server.wait_closed()
+
+    print(f"requests={total} concurrency={concurrency}")
+    print(f"fresh client per request: {unpooled_rps:10.1f} req/s")
+    print(f"pooled per-host client:   {pooled_rps:10.1f} req/s ({pooled_rps / unpooled_rps:.1f}x)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.concurrency))
@@ -0,0 +1,76 @@
+"""
+Provisioning an organization's seats: one `create_new_user` call per member (what onboarding
+through `POST /user/users` amounts to) against the bulk provisioning pipeline. Bulk imports hash
+passwords locally (PBKDF2, `PROVISION_PASSWORD_HASH_ROUNDS`), which is CPU bound and scales with
+cores; `--without-passwords` times the rest of the pipeline.
+
+Run from the service directory:
+    python -m benchmarks.bench_provisioning --users 2000 --latency-ms 20
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import time
+
+from benchmarks import fake_gcp
+
+
+def _rows(count: int, prefix: str, passwords: bool = True):
+    return [{"email": f"{prefix}{i}@example.com", "first_name": "Member", "last_name": str(i), "password": "initial-password" if passwords else None} for i in range(count)]
+
+
+async def one_by_one(count: int) -> float:
+    from manage_user.manage_user import create_new_user
+    from manage_user.manage_user_model import UserCreate
+
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for row in _rows(count, "single"):
+            await create_new_user(UserCreate(**row))
+    return time.perf_counter() - started
+
+
+async def bulk(count: int, passwords: bool) -> float:
+    from manage_user.manage_user_model import AccountType, UserResponse
+    from manage_user.provisioning import provision_users
+
+    organization = UserResponse(
+        email="owner@example.com", first_name="Owner", last_name="Org", uuid="org", uid="org",
+        search_name="owner org", account_type=AccountType.ORGANIZATION, organization_name="Example",
+    )
+    started = time.perf_counter()
+    async for event in provision_users(organization, _rows(count, "bulk", passwords)):
+        if event["event"] == "summary" and event["failed"]:
+            raise RuntimeError(f"{event['failed']} rows failed")
+    return time.perf_counter() - started
+
+
+def main(count: int, latency_ms: float, single_limit: int, passwords: bool):
+    os.environ.setdefault("GCP_PROJECT", "demo")
+    os.environ.setdefault("GOOGLE_CLOUD_PROJECT", "demo")
+    fake_gcp.install(latency=latency_ms / 1000)
+
+    single_count = min(count, single_limit)
+    fake_gcp.reset()
+    single_seconds = asyncio.run(one_by_one(single_count))
+    single_rpcs = fake_gcp.STATS.total()
+    fake_gcp.reset()
+    bulk_seconds = asyncio.run(bulk(count, passwords))
+    bulk_rpcs = fake_gcp.STATS.total()
+
+    per_user = single_seconds / single_count
+    print(f"{latency_ms:g} ms per round trip, {os.cpu_count()} CPUs, {'with' if passwords else 'without'} passwords")
+    print(f"one by one: {single_count} users in {single_seconds:.2f} s, {single_rpcs / single_count:.2f} round trips per user (~{per_user * count:.1f} s for {count})")
+    print(f"bulk:       {count} users in {bulk_seconds:.2f} s, {bulk_rpcs / count:.3f} round trips per user")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--single-limit", type=int, default=200, help="one-by-one users to time, extrapolated to --users")
+    parser.add_argument("--without-passwords", action="store_true")
+    args = parser.parse_args()
+    main(args.users, args.latency_ms, args.single_limit, not args.without_passwords)
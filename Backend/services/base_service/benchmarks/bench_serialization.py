@@ -0,0 +1,93 @@
+"""
+Serialization cost of the heaviest payload (a project's endpoint list with full request and
+response schemas): FastAPI's default response path vs the fast path, plus compression.
+
+Run from the service directory:
+    python -m benchmarks.bench_serialization --endpoints 1000
+"""
+import argparse
+import asyncio
+import gzip
+import time
+from typing import List
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from common_code.fast_response import dumps
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from projects.projects_model import EndpointResponse
+
+
+def _schema(depth: int = 3):
+    if depth == 0:
+        return {"type": "string", "format": "uuid", "description": "Identifier of the nested resource"}
+    return {
+        "type": "object",
+        "required": ["id", "name"],
+        "properties": {
+            "id": {"type": "string", "format": "uuid"},
+            "name": {"type": "string", "minLength": 1, "maxLength": 120},
+            "count": {"type": "integer", "minimum": 0},
+            "tags": {"type": "array", "items": {"type": "string"}},
+            "child": _schema(depth - 1),
+        },
+    }
+
+
+def build_endpoints(count: int) -> List[EndpointResponse]:
+    return [
+        EndpointResponse(
+            id=f"endpoint-{i}", project_id="project", path=f"/resources/{i}/{{id}}", method="POST",
+            tag="resources", description="Creates a nested resource " * 4,
+            parameters=[{"name": "id", "in": "path", "required": True, "type": "string"}],
+            requestBody=_schema(), responses={"200": {"description": "OK", "content": _schema()}},
+        )
+        for i in range(count)
+    ]
+
+
+def _timed(fn, repeat: int):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - started) / repeat * 1000, result
+
+
+def main(count: int, repeat: int):
+    endpoints = build_endpoints(count)
+    field = create_response_field(name="Response", type_=List[EndpointResponse])
+
+    def default_path():
+        content = asyncio.run(serialize_response(field=field, response_content=endpoints, is_coroutine=True))
+        return JSONResponse(jsonable_encoder(content)).body
+
+    def fast_path():
+        return dumps([endpoint.dict(by_alias=True) for endpoint in endpoints])
+
+    default_ms, default_body = _timed(default_path, repeat)
+    fast_ms, fast_body = _timed(fast_path, repeat)
+    print(f"endpoints={count} body={len(fast_body) / 1024:.0f} KiB")
+    print(f"default response path: {default_ms:8.1f} ms")
+    print(f"fast response path:    {fast_ms:8.1f} ms ({default_ms / fast_ms:.1f}x)")
+
+    gzip_ms, gzipped = _timed(lambda: gzip.compress(fast_body, 6), repeat)
+    print(f"gzip level 6:          {gzip_ms:8.1f} ms -> {len(gzipped) / 1024:.0f} KiB")
+    if brotli is not None:
+        br_ms, brotlied = _timed(lambda: brotli.compress(fast_body, quality=4), repeat)
+        print(f"brotli quality 4:      {br_ms:8.1f} ms -> {len(brotlied) / 1024:.0f} KiB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--endpoints", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    main(args.endpoints, args.repeat)
@@ -0,0 +1,735 @@
+"""
+In-memory stand-ins for the parts of Firestore and Firebase Auth the service uses.
+
+`install(latency=...)` must run before any service module is imported: the modules create their
+`firestore.Client()` at import time. Every client shares one `FakeFirestore` store. Each call
+that would be a network round trip in the real SDKs (document get, query, `get_all`, batch or
+transaction commit, bulk-writer flush, auth lookups) sleeps for the injected latency (blocking,
+like the real sync clients) and is counted in `STATS`, so a benchmark can report round trips
+per request.
+
+Supported: collections, subcollections and collection groups, `where` (==, !=, <, <=, >, >=, in, array_contains),
+`order_by` (including `__name__`), `limit`, `start_after`, `select`, `count()`, dotted field paths,
+`Increment` and `DELETE_FIELD`, create-only writes, batches, bulk writers and
+`@firestore.transactional`.
+"""
+import copy
+import itertools
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+Path = Tuple[str, ...]
+
+_MISSING = object()
+
+
+class RpcStats:
+
+    def __init__(self):
+        self._counts: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, kind: str):
+        with self._lock:
+            self._counts[kind] += 1
+
+    def total(self) -> int:
+        with self._lock:
+            return sum(self._counts.values())
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counts)
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+
+
+STATS = RpcStats()
+
+
+class FakeFirestore:
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        # Documents indexed by their collection path, so a query only looks at its collection
+        self.collections: Dict[Path, Dict[str, Dict[str, Any]]] = {}
+        # Equality indexes (collection, field) -> value -> doc ids, built on first use like
+        # Firestore's single-field indexes, so the fake's own scans do not dominate the timings
+        self.indexes: Dict[Tuple[Path, str], Dict[Any, set]] = {}
+        self.lock = threading.RLock()
+
+    def round_trip(self, kind: str):
+        STATS.record(kind)
+        if self.latency:
+            time.sleep(self.latency)
+
+    def get(self, path: Path) -> Optional[Dict[str, Any]]:
+        return self.collections.get(path[:-1], {}).get(path[-1])
+
+    def put(self, path: Path, data: Dict[str, Any]):
+        data = _to_aware(data)
+        with self.lock:
+            documents = self.collections.setdefault(path[:-1], {})
+            self._index(path, documents.get(path[-1]), remove=True)
+            documents[path[-1]] = data
+            self._index(path, data)
+
+    def remove(self, path: Path):
+        with self.lock:
+            self._index(path, self.collections.get(path[:-1], {}).pop(path[-1], None), remove=True)
+
+    def _index(self, path: Path, data: Optional[Dict[str, Any]], remove: bool = False):
+        if data is None:
+            return
+        for (collection_path, field), index in self.indexes.items():
+            if collection_path != path[:-1]:
+                continue
+            value = _get_field(data, field)
+            if value is _MISSING or not _hashable(value):
+                continue
+            if remove:
+                index.get(value, set()).discard(path[-1])
+            else:
+                index.setdefault(value, set()).add(path[-1])
+
+    def equal(self, collection_path: Path, field: str, value: Any) -> List[Tuple[Path, Dict[str, Any]]]:
+        with self.lock:
+            key = (collection_path, field)
+            if key not in self.indexes:
+                index: Dict[Any, set] = {}
+                for doc_id, data in self.collections.get(collection_path, {}).items():
+                    indexed = _get_field(data, field)
+                    if indexed is not _MISSING and _hashable(indexed):
+                        index.setdefault(indexed, set()).add(doc_id)
+                self.indexes[key] = index
+            documents = self.collections.get(collection_path, {})
+            return [(collection_path + (doc_id,), documents[doc_id]) for doc_id in self.indexes[key].get(value, ())]
+
+    def group_children(self, collection_id: str) -> List[Tuple[Path, Dict[str, Any]]]:
+        with self.lock:
+            return [
+                (collection_path + (doc_id,), data)
+                for collection_path, documents in self.collections.items() if collection_path[-1] == collection_id
+                for doc_id, data in documents.items()
+            ]
+
+    def children(self, collection_path: Path) -> List[Tuple[Path, Dict[str, Any]]]:
+        with self.lock:
+            return [(collection_path + (doc_id,), data) for doc_id, data in self.collections.get(collection_path, {}).items()]
+
+    def document_count(self) -> int:
+        with self.lock:
+            return sum(len(documents) for documents in self.collections.values())
+
+    def clear(self):
+        with self.lock:
+            self.collections.clear()
+            self.indexes.clear()
+
+
+STORE = FakeFirestore()
+
+
+# Field paths and write transforms
+
+def _hashable(value: Any) -> bool:
+    try:
+        hash(value)
+    except TypeError:
+        return False
+    return True
+
+
+def _get_field(data: Dict[str, Any], field_path: str) -> Any:
+    if field_path == "__name__":
+        return _MISSING
+    value: Any = data
+    for part in field_path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+
+def _apply_field(data: Dict[str, Any], field_path: str, value: Any):
+    from google.cloud.firestore_v1 import DELETE_FIELD
+    from google.cloud.firestore_v1.transforms import Increment
+
+    parts = field_path.split(".")
+    target = data
+    for part in parts[:-1]:
+        target = target.setdefault(part, {})
+    leaf = parts[-1]
+    if value is DELETE_FIELD:
+        target.pop(leaf, None)
+    elif isinstance(value, Increment):
+        target[leaf] = (target.get(leaf) or 0) + value.value
+    else:
+        target[leaf] = copy.deepcopy(value)
+
+
+def _set_fields(document: Dict[str, Any], data: Dict[str, Any], merge: bool):
+    # set() keys are literal field names; with merge, nested maps merge instead of replacing
+    from google.cloud.firestore_v1 import DELETE_FIELD
+    from google.cloud.firestore_v1.transforms import Increment
+
+    for key, value in data.items():
+        if value is DELETE_FIELD:
+            document.pop(key, None)
+        elif isinstance(value, Increment):
+            document[key] = (document.get(key) or 0) + value.value
+        elif merge and isinstance(value, dict) and isinstance(document.get(key), dict):
+            _set_fields(document[key], value, merge)
+        else:
+            document[key] = copy.deepcopy(value)
+
+
+def _to_aware(value: Any) -> Any:
+    # Firestore hands back timestamps as UTC aware `DatetimeWithNanoseconds`, a datetime subclass
+    if isinstance(value, datetime):
+        from google.api_core.datetime_helpers import DatetimeWithNanoseconds
+
+        if type(value) is DatetimeWithNanoseconds and value.tzinfo is not None:
+            return value
+        return DatetimeWithNanoseconds(
+            value.year, value.month, value.day, value.hour, value.minute, value.second, value.microsecond,
+            tzinfo=value.tzinfo or timezone.utc,
+        )
+    if isinstance(value, dict):
+        return {key: _to_aware(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_to_aware(item) for item in value]
+    return value
+
+
+def _write(path: Path, op: str, data: Optional[Dict[str, Any]] = None, merge: bool = False):
+    from google.api_core.exceptions import AlreadyExists, NotFound
+
+    with STORE.lock:
+        current = STORE.get(path)
+        if op == "create" and current is not None:
+            raise AlreadyExists(f"Document already exists: {'/'.join(path)}")
+        if op == "delete":
+            STORE.remove(path)
+            return
+        if op == "update":
+            if current is None:
+                raise NotFound(f"No document to update: {'/'.join(path)}")
+            document = copy.deepcopy(current)
+            for key, value in data.items():
+                _apply_field(document, key, value)
+        else:
+            document = copy.deepcopy(current) if merge and current is not None else {}
+            _set_fields(document, data, merge)
+        STORE.put(path, _to_aware(document))
+
+
+# References, snapshots and queries
+
+class FakeDocumentSnapshot:
+
+    def __init__(self, reference: "FakeDocumentReference", data: Optional[Dict[str, Any]], fields: Optional[List[str]] = None):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self._data = data
+        self._fields = fields
+
+    def to_dict(self) -> Optional[Dict[str, Any]]:
+        if self._data is None:
+            return None
+        data = copy.deepcopy(self._data)
+        if self._fields is not None:
+            data = {key: value for key, value in data.items() if key in self._fields}
+        return data
+
+    def get(self, field_path: str) -> Any:
+        value = _get_field(self._data or {}, field_path)
+        return None if value is _MISSING else copy.deepcopy(value)
+
+
+class FakeDocumentReference:
+
+    def __init__(self, client: "FakeClient", path: Path):
+        self._client = client
+        self._path = path
+        self.id = path[-1]
+
+    @property
+    def path(self) -> str:
+        return "/".join(self._path)
+
+    @property
+    def parent(self) -> "FakeCollectionReference":
+        return FakeCollectionReference(self._client, self._path[:-1])
+
+    def collection(self, name: str) -> "FakeCollectionReference":
+        return FakeCollectionReference(self._client, self._path + (name,))
+
+    def _snapshot(self) -> FakeDocumentSnapshot:
+        with STORE.lock:
+            data = STORE.get(self._path)
+            return FakeDocumentSnapshot(self, copy.deepcopy(data) if data is not None else None)
+
+    def get(self, field_paths: Optional[List[str]] = None, transaction: Optional["FakeTransaction"] = None) -> FakeDocumentSnapshot:
+        if transaction is None:
+            STORE.round_trip("get")
+        return self._snapshot()
+
+    def set(self, data: Dict[str, Any], merge: bool = False):
+        STORE.round_trip("commit")
+        _write(self._path, "set", data, merge)
+
+    def create(self, data: Dict[str, Any]):
+        from google.api_core.exceptions import Conflict
+
+        STORE.round_trip("commit")
+        with STORE.lock:
+            if STORE.get(self._path) is not None:
+                raise Conflict(f"Document already exists: {self.path}")
+            _write(self._path, "set", data)
+
+    def update(self, data: Dict[str, Any]):
+        STORE.round_trip("commit")
+        _write(self._path, "update", data)
+
+    def delete(self):
+        STORE.round_trip("commit")
+        _write(self._path, "delete")
+
+    def __eq__(self, other):
+        return isinstance(other, FakeDocumentReference) and other._path == self._path
+
+    def __hash__(self):
+        return hash(self._path)
+
+
+def _order_value(value: Any) -> Tuple[int, Any]:
+    # Firestore orders by type first: null, booleans, numbers, timestamps, strings, then the rest
+    if value is _MISSING or value is None:
+        return (0, 0)
+    if isinstance(value, bool):
+        return (1, value)
+    if isinstance(value, (int, float)):
+        return (2, value)
+    if isinstance(value, datetime):
+        return (3, value)
+    if isinstance(value, str):
+        return (4, value)
+    return (5, repr(value))
+
+
+def _matches(data: Dict[str, Any], doc_id: str, field: str, op: str, value: Any) -> bool:
+    actual = doc_id if field == "__name__" else _get_field(data, field)
+    if field == "__name__" and isinstance(value, FakeDocumentReference):
+        value = value.id
+    if actual is _MISSING:
+        return False
+    value = _to_aware(value)
+    try:
+        if op == "==":
+            return actual == value
+        if op == "!=":
+            return actual != value and actual is not None
+        if op == "in":
+            return actual in value
+        if op == "not-in":
+            return actual not in value
+        if op == "array_contains":
+            return isinstance(actual, list) and value in actual
+        if op == "array_contains_any":
+            return isinstance(actual, list) and any(item in actual for item in value)
+        if actual is None:
+            return False
+        if op == "<":
+            return actual < value
+        if op == "<=":
+            return actual <= value
+        if op == ">":
+            return actual > value
+        if op == ">=":
+            return actual >= value
+    except TypeError:
+        return False
+    raise ValueError(f"Unsupported operator {op}")
+
+
+class FakeQuery:
+
+    ASCENDING = "ASCENDING"
+    DESCENDING = "DESCENDING"
+
+    def __init__(self, client: "FakeClient", collection_path: Path, filters=(), orders=(), limit_count=None, cursor=None, fields=None, all_descendants=False):
+        self._client = client
+        self._collection_path = collection_path
+        # Collection group query: every collection whose id is the last element of the path
+        self._all_descendants = all_descendants
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit_count
+        self._cursor = cursor
+        self._fields = fields
+
+    def _copy(self, **changes) -> "FakeQuery":
+        state = {
+            "filters": self._filters, "orders": self._orders, "limit_count": self._limit,
+            "cursor": self._cursor, "fields": self._fields, "all_descendants": self._all_descendants,
+        }
+        state.update(changes)
+        return FakeQuery(self._client, self._collection_path, **state)
+
+    def where(self, field: str, op: str, value: Any) -> "FakeQuery":
+        return self._copy(filters=self._filters + ((field, op, value),))
+
+    def order_by(self, field: str, direction: str = ASCENDING) -> "FakeQuery":
+        return self._copy(orders=self._orders + ((field, direction),))
+
+    def limit(self, count: int) -> "FakeQuery":
+        return self._copy(limit_count=count)
+
+    def start_after(self, document_fields_or_snapshot) -> "FakeQuery":
+        return self._copy(cursor=document_fields_or_snapshot)
+
+    def select(self, field_paths: List[str]) -> "FakeQuery":
+        return self._copy(fields=list(field_paths))
+
+    def _run(self) -> List[Tuple[Path, Dict[str, Any]]]:
+        equality = next(((field, value) for field, op, value in self._filters if op == "==" and field != "__name__" and _hashable(value)), None)
+        if self._all_descendants:
+            candidates = STORE.group_children(self._collection_path[-1])
+        else:
+            candidates = STORE.equal(self._collection_path, *equality) if equality else STORE.children(self._collection_path)
+        rows = [
+            (path, data) for path, data in candidates
+            if all(_matches(data, path[-1], field, op, value) for field, op, value in self._filters)
+        ]
+        # Like Firestore, documents without an order_by field are not returned
+        rows = [(path, data) for path, data in rows if all(field == "__name__" or _get_field(data, field) is not _MISSING for field, _ in self._orders)]
+        orders = self._orders + (("__name__", self._orders[-1][1] if self._orders else self.ASCENDING),)
+        for field, direction in reversed(orders):
+            rows.sort(
+                key=lambda row: _order_value(row[0][-1] if field == "__name__" else _get_field(row[1], field)),
+                reverse=direction == self.DESCENDING,
+            )
+        if self._cursor is not None:
+            cursor_path = self._cursor.reference._path if isinstance(self._cursor, FakeDocumentSnapshot) else None
+            for index, (path, _) in enumerate(rows):
+                if path == cursor_path:
+                    rows = rows[index + 1:]
+                    break
+        if self._limit is not None:
+            rows = rows[:self._limit]
+        return rows
+
+    def stream(self, transaction: Optional["FakeTransaction"] = None) -> Iterator[FakeDocumentSnapshot]:
+        STORE.round_trip("query")
+        rows = self._run()
+        for path, data in rows:
+            yield FakeDocumentSnapshot(FakeDocumentReference(self._client, path), copy.deepcopy(data), self._fields)
+
+    def get(self, transaction: Optional["FakeTransaction"] = None) -> List[FakeDocumentSnapshot]:
+        return list(self.stream(transaction))
+
+    def count(self, alias: Optional[str] = None) -> "FakeAggregationQuery":
+        return FakeAggregationQuery(self, alias)
+
+
+class FakeAggregationResult:
+
+    def __init__(self, alias: Optional[str], value: int):
+        self.alias = alias
+        self.value = value
+
+
+class FakeAggregationQuery:
+
+    def __init__(self, query: FakeQuery, alias: Optional[str]):
+        self._query = query
+        self._alias = alias
+
+    def get(self, transaction: Optional["FakeTransaction"] = None, **kwargs) -> List[List[FakeAggregationResult]]:
+        STORE.round_trip("aggregation")
+        return [[FakeAggregationResult(self._alias, len(self._query._run()))]]
+
+
+class FakeCollectionReference(FakeQuery):
+
+    def __init__(self, client: "FakeClient", path: Path):
+        super().__init__(client, path)
+        self.id = path[-1]
+
+    @property
+    def parent(self) -> Optional[FakeDocumentReference]:
+        return FakeDocumentReference(self._client, self._collection_path[:-1]) if len(self._collection_path) > 1 else None
+
+    def document(self, document_id: Optional[str] = None) -> FakeDocumentReference:
+        return FakeDocumentReference(self._client, self._collection_path + (document_id or uuid.uuid4().hex[:20],))
+
+    def add(self, data: Dict[str, Any]):
+        reference = self.document()
+        reference.set(data)
+        return datetime.now(timezone.utc), reference
+
+    def list_documents(self) -> List[FakeDocumentReference]:
+        STORE.round_trip("list_documents")
+        return [FakeDocumentReference(self._client, path) for path, _ in STORE.children(self._collection_path)]
+
+
+# Writes
+
+class FakeWriteBatch:
+
+    def __init__(self, client: "FakeClient"):
+        self._client = client
+        self._writes: List[Tuple[Path, str, Optional[Dict[str, Any]], bool]] = []
+
+    def set(self, reference: FakeDocumentReference, data: Dict[str, Any], merge: bool = False):
+        self._writes.append((reference._path, "set", data, merge))
+
+    def update(self, reference: FakeDocumentReference, data: Dict[str, Any]):
+        self._writes.append((reference._path, "update", data, False))
+
+    def delete(self, reference: FakeDocumentReference):
+        self._writes.append((reference._path, "delete", None, False))
+
+    def create(self, reference: FakeDocumentReference, data: Dict[str, Any]):
+        self._writes.append((reference._path, "create", data, False))
+
+    def commit(self):
+        STORE.round_trip("commit")
+        with STORE.lock:
+            for path, op, data, merge in self._writes:
+                _write(path, op, data, merge)
+        self._writes = []
+
+
+class _BulkFailure:
+
+    def __init__(self, reference: FakeDocumentReference, error: Exception):
+        self.operation = type("Operation", (), {"reference": reference})()
+        status = getattr(error, "grpc_status_code", None)
+        self.code = status.value[0] if status is not None else getattr(error, "code", None)
+        self.message = str(error)
+        self.attempts = 1
+
+
+class FakeBulkWriter:
+    """Applies writes in batches of 20, like the real BulkWriter, one round trip each"""
+
+    BATCH_SIZE = 20
+
+    def __init__(self, client: "FakeClient"):
+        self._client = client
+        self._pending: List[Tuple[FakeDocumentReference, str, Optional[Dict[str, Any]], bool]] = []
+        self._on_error = None
+
+    def on_write_error(self, callback):
+        self._on_error = callback
+
+    def set(self, reference, data, merge=False):
+        self._enqueue(reference, "set", data, merge)
+
+    def create(self, reference, data):
+        self._enqueue(reference, "create", data, False)
+
+    def update(self, reference, data):
+        self._enqueue(reference, "update", data, False)
+
+    def delete(self, reference):
+        self._enqueue(reference, "delete", None, False)
+
+    def _enqueue(self, reference, op, data, merge):
+        self._pending.append((reference, op, data, merge))
+        if len(self._pending) >= self.BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        pending, self._pending = self._pending, []
+        for start in range(0, len(pending), self.BATCH_SIZE):
+            STORE.round_trip("bulk_commit")
+            for reference, op, data, merge in pending[start:start + self.BATCH_SIZE]:
+                try:
+                    _write(reference._path, op, data, merge)
+                except Exception as e:
+                    if self._on_error is not None:
+                        self._on_error(_BulkFailure(reference, e), self)
+
+    def close(self):
+        self.flush()
+
+
+class FakeTransaction(FakeWriteBatch):
+    pass
+
+
+def fake_transactional(fn):
+    """Runs the function and commits its writes atomically with respect to other fake writers"""
+
+    def wrapper(transaction: FakeTransaction, *args, **kwargs):
+        with STORE.lock:
+            STORE.round_trip("begin_transaction")
+            result = fn(transaction, *args, **kwargs)
+            transaction.commit()
+            return result
+
+    return wrapper
+
+
+class FakeClient:
+
+    def __init__(self, project: Optional[str] = None, **kwargs):
+        self.project = project
+
+    def collection(self, *path: str) -> FakeCollectionReference:
+        return FakeCollectionReference(self, tuple("/".join(path).split("/")))
+
+    def document(self, *path: str) -> FakeDocumentReference:
+        return FakeDocumentReference(self, tuple("/".join(path).split("/")))
+
+    def collection_group(self, collection_id: str) -> FakeQuery:
+        return FakeQuery(self, (collection_id,), all_descendants=True)
+
+    def batch(self) -> FakeWriteBatch:
+        return FakeWriteBatch(self)
+
+    def bulk_writer(self, **kwargs) -> FakeBulkWriter:
+        return FakeBulkWriter(self)
+
+    def transaction(self, **kwargs) -> FakeTransaction:
+        return FakeTransaction(self)
+
+    def get_all(self, references, field_paths=None, transaction=None) -> Iterator[FakeDocumentSnapshot]:
+        references = list(references)
+        if not references:
+            return iter(())
+        STORE.round_trip("get_all")
+        return iter([reference._snapshot() for reference in references])
+
+
+# Firebase Auth
+
+class FakeUserRecord:
+
+    def __init__(self, uid: str, email: str, display_name: Optional[str] = None):
+        self.uid = uid
+        self.email = email
+        self.display_name = display_name
+
+
+class FakeGetUsersResult:
+
+    def __init__(self, users: List[FakeUserRecord]):
+        self.users = users
+
+
+class FakeAuth:
+    """ID tokens are "token-<uid>"; anything else fails verification"""
+
+    def __init__(self):
+        self.users_by_email: Dict[str, FakeUserRecord] = {}
+        self.users_by_uid: Dict[str, FakeUserRecord] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def add_user(self, uid: str, email: str, display_name: Optional[str] = None) -> FakeUserRecord:
+        record = FakeUserRecord(uid, email, display_name)
+        with self._lock:
+            self.users_by_email[email] = record
+            self.users_by_uid[uid] = record
+        return record
+
+    def verify_id_token(self, token: str, *args, **kwargs) -> Dict[str, Any]:
+        # Verification is local in the real SDK once the signing keys are cached, no round trip
+        if not token.startswith("token-"):
+            raise ValueError("Invalid ID token")
+        return {"uid": token[len("token-"):], "exp": time.time() + 3600}
+
+    def create_user(self, email: str, password: Optional[str] = None, display_name: Optional[str] = None, **kwargs) -> FakeUserRecord:
+        STORE.round_trip("auth")
+        with self._lock:
+            if email in self.users_by_email:
+                raise ValueError(f"User with email {email} already exists")
+        return self.add_user(f"uid-{next(self._ids)}", email, display_name)
+
+    def get_user_by_email(self, email: str) -> FakeUserRecord:
+        from firebase_admin import auth
+
+        STORE.round_trip("auth")
+        with self._lock:
+            record = self.users_by_email.get(email)
+        if record is None:
+            raise auth.UserNotFoundError(f"No user record found for the provided email: {email}")
+        return record
+
+    def delete_user(self, uid: str):
+        STORE.round_trip("auth")
+        with self._lock:
+            record = self.users_by_uid.pop(uid, None)
+            if record is not None:
+                self.users_by_email.pop(record.email, None)
+
+    def import_users(self, users, hash_alg=None, **kwargs):
+        from firebase_admin._user_import import UserImportResult
+
+        if len(users) > 1000:
+            raise ValueError("Users must be a non-empty list with no more than 1000 elements.")
+        STORE.round_trip("auth")
+        errors = []
+        for index, user in enumerate(users):
+            with self._lock:
+                duplicate = user.email in self.users_by_email and self.users_by_email[user.email].uid != user.uid
+            if duplicate:
+                errors.append({"index": index, "message": "email exists in other account in database"})
+            else:
+                self.add_user(user.uid, user.email, user.display_name)
+        return UserImportResult({"error": errors}, len(users))
+
+    def get_users(self, identifiers, **kwargs):
+        if len(identifiers) > 100:
+            raise ValueError("`identifiers` parameter must have <= 100 entries.")
+        STORE.round_trip("auth")
+        with self._lock:
+            users = [self.users_by_email[identifier.email] for identifier in identifiers if identifier.email in self.users_by_email]
+        return FakeGetUsersResult(users)
+
+    def delete_users(self, uids, **kwargs):
+        STORE.round_trip("auth")
+        with self._lock:
+            for uid in uids:
+                record = self.users_by_uid.pop(uid, None)
+                if record is not None:
+                    self.users_by_email.pop(record.email, None)
+
+    def clear(self):
+        with self._lock:
+            self.users_by_email.clear()
+            self.users_by_uid.clear()
+
+
+AUTH = FakeAuth()
+
+
+def install(latency: float = 0.0):
+    """Routes `firestore.Client`, `@firestore.transactional` and Firebase Auth to the fakes"""
+    import firebase_admin
+    from firebase_admin import auth
+    from google.cloud import firestore
+
+    STORE.latency = latency
+    firestore.Client = FakeClient
+    firestore.transactional = fake_transactional
+    firebase_admin.initialize_app = lambda *args, **kwargs: None
+    for name in ("verify_id_token", "create_user", "get_user_by_email", "delete_user", "import_users", "get_users", "delete_users"):
+        setattr(auth, name, getattr(AUTH, name))
+
+
+def reset():
+    STORE.clear()
+    AUTH.clear()
+    STATS.reset()
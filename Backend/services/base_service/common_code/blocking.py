@@ -0,0 +1,229 @@
+"""
+Bounded execution of blocking SDK calls from async code.
+
+Firebase Admin, the sync Firestore client and object storage block the calling thread for a
+network round trip. Called directly from an `async def` they stall the event loop, and with it
+every other request on the worker. `run_blocking(backend, fn, *args)` runs the call in a shared
+thread pool instead, behind a per-backend concurrency limit and timeout from
+`BlockingExecutorConfig`:
+
+    firebase_user = await run_blocking(FIREBASE_AUTH, auth.create_user, email=email)
+
+The timeout covers waiting for a slot as well as the call itself, and surfaces as a 504. A call
+that times out keeps its slot until the thread actually returns, so a hanging backend cannot
+grow past its limit. The caller's context variables (request id, log context) are carried into
+the thread.
+
+Inside `record_blocking_calls()` every call also adds its backend, time in the thread and wait
+for a slot to a `BlockingCallLog`. The profiler only sees the event loop thread, so this is how a
+profiled request accounts for the RPCs it moved to the pool.
+"""
+import asyncio
+import contextvars
+import functools
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from fastapi import HTTPException, status
+
+from config import BlockingExecutorConfig, get_blocking_executor_config
+
+FIREBASE_AUTH = "firebase_auth"
+FIRESTORE = "firestore"
+# Bulk writes with their own retries, kept apart so they neither starve nor time out interactive reads
+FIRESTORE_BULK = "firestore_bulk"
+STORAGE = "storage"
+
+
+class BlockingCallTimeout(HTTPException):
+
+    def __init__(self, backend: str, timeout: float):
+        super().__init__(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail=f"{backend} did not respond within {timeout:g}s")
+        self.backend = backend
+
+
+class _BackendStats:
+
+    __slots__ = ("calls", "timeouts", "errors", "in_flight", "waiting", "wait_seconds", "max_wait_seconds")
+
+    def __init__(self):
+        self.calls = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.waiting = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "avg_wait_ms": round(self.wait_seconds / self.calls * 1000, 2) if self.calls else 0.0,
+            "max_wait_ms": round(self.max_wait_seconds * 1000, 2),
+        }
+
+
+class BlockingCallLog:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._backends: Dict[str, list] = {}
+
+    def record(self, backend: str, seconds: float, waited: float):
+        with self._lock:
+            totals = self._backends.setdefault(backend, [0, 0.0, 0.0])
+            totals[0] += 1
+            totals[1] += seconds
+            totals[2] += waited
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {
+                backend: {"calls": calls, "ms": round(seconds * 1000, 2), "wait_ms": round(waited * 1000, 2)}
+                for backend, (calls, seconds, waited) in self._backends.items()
+            }
+
+
+_call_log: contextvars.ContextVar[Optional[BlockingCallLog]] = contextvars.ContextVar("blocking_call_log", default=None)
+
+
+@contextmanager
+def record_blocking_calls() -> Iterator[BlockingCallLog]:
+    """Logs the blocking calls made from the current context, including tasks it starts"""
+    log = BlockingCallLog()
+    token = _call_log.set(log)
+    try:
+        yield log
+    finally:
+        _call_log.reset(token)
+
+
+def _timed(log: BlockingCallLog, backend: str, waited: float, fn: Callable) -> Any:
+    started = time.perf_counter()
+    try:
+        return fn()
+    finally:
+        log.record(backend, time.perf_counter() - started, waited)
+
+
+class BlockingExecutor:
+    """
+    One thread pool shared by all backends. Slots are asyncio semaphores, one per backend and
+    event loop, so waiting for a slot never blocks the loop.
+    """
+
+    def __init__(self, config: Optional[BlockingExecutorConfig] = None):
+        self.config = config or get_blocking_executor_config()
+        workers = sum(self.config.limits.values()) + self.config.default_limit
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="blocking")
+        self._semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Semaphore]]" = weakref.WeakKeyDictionary()
+        self._stats: Dict[str, _BackendStats] = {}
+        self._lock = threading.Lock()
+
+    def limit(self, backend: str) -> int:
+        return self.config.limits.get(backend, self.config.default_limit)
+
+    def timeout(self, backend: str) -> float:
+        return self.config.timeouts.get(backend, self.config.default_timeout)
+
+    def _semaphore(self, loop: asyncio.AbstractEventLoop, backend: str) -> asyncio.Semaphore:
+        with self._lock:
+            semaphores = self._semaphores.setdefault(loop, {})
+            if backend not in semaphores:
+                semaphores[backend] = asyncio.Semaphore(self.limit(backend))
+            return semaphores[backend]
+
+    def _backend_stats(self, backend: str) -> _BackendStats:
+        stats = self._stats.get(backend)
+        if stats is None:
+            stats = self._stats.setdefault(backend, _BackendStats())
+        return stats
+
+    async def run(self, backend: str, fn: Callable, *args, **kwargs) -> Any:
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphore(loop, backend)
+        stats = self._backend_stats(backend)
+        timeout = self.timeout(backend)
+        started = time.monotonic()
+
+        stats.waiting += 1
+        try:
+            await asyncio.wait_for(semaphore.acquire(), timeout)
+        except asyncio.TimeoutError:
+            stats.timeouts += 1
+            raise BlockingCallTimeout(backend, timeout)
+        finally:
+            stats.waiting -= 1
+        waited = time.monotonic() - started
+        stats.calls += 1
+        stats.in_flight += 1
+        stats.wait_seconds += waited
+        stats.max_wait_seconds = max(stats.max_wait_seconds, waited)
+
+        def release(_):
+            stats.in_flight -= 1
+            semaphore.release()
+
+        context = contextvars.copy_context()
+        call = functools.partial(context.run, fn, *args, **kwargs)
+        log = _call_log.get()
+        if log is not None:
+            call = functools.partial(_timed, log, backend, waited, call)
+        try:
+            future = loop.run_in_executor(self._pool, call)
+        except BaseException:
+            release(None)
+            raise
+        # The slot is given back when the thread is done, not when the caller stops waiting
+        future.add_done_callback(release)
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), max(0.0, timeout - waited))
+        except asyncio.TimeoutError:
+            stats.timeouts += 1
+            raise BlockingCallTimeout(backend, timeout)
+        except Exception:
+            stats.errors += 1
+            raise
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {backend: {"limit": self.limit(backend), **stats.as_dict()} for backend, stats in self._stats.items()}
+
+    def shutdown(self, wait: bool = True):
+        self._pool.shutdown(wait=wait, cancel_futures=True)
+
+
+_executor: Optional[BlockingExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_blocking_executor() -> BlockingExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = BlockingExecutor()
+    return _executor
+
+
+async def run_blocking(backend: str, fn: Callable, *args, **kwargs) -> Any:
+    return await get_blocking_executor().run(backend, fn, *args, **kwargs)
+
+
+def get_blocking_stats() -> Dict[str, Dict[str, Any]]:
+    return get_blocking_executor().stats() if _executor is not None else {}
+
+
+def shutdown_blocking_executor():
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=False)
@@ -0,0 +1,138 @@
+"""
+Response compression negotiated through `Accept-Encoding`.
+
+Brotli is preferred when the `brotli` package is installed and the client accepts it, gzip
+otherwise. Bodies below `minimum_size` are sent as is. Streaming responses are compressed chunk
+by chunk, so exports stay streamed.
+"""
+import zlib
+from typing import List, Optional, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/", "application/javascript", "application/xml")
+
+
+def _accepted_encodings(accept_encoding: str) -> List[Tuple[str, float]]:
+    encodings = []
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            encodings.append((name.strip().lower(), quality))
+    return encodings
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    accepted = {name: quality for name, quality in _accepted_encodings(accept_encoding)}
+    wildcard = accepted.get("*", 0.0)
+    candidates = (["br"] if brotli is not None else []) + ["gzip"]
+    best, best_quality = None, 0.0
+    for encoding in candidates:
+        quality = accepted.get(encoding, wildcard)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+class _Compressor:
+
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=brotli_quality)
+            self._compress, self._flush = self._compressor.process, self._compressor.finish
+        else:
+            self._compressor = zlib.compressobj(gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            self._compress, self._flush = self._compressor.compress, self._compressor.flush
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compress(data)
+
+    def finish(self) -> bytes:
+        return self._flush()
+
+
+class CompressionMiddleware:
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        responder = _CompressionResponder(self, encoding, send)
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressionResponder:
+
+    def __init__(self, middleware: CompressionMiddleware, encoding: str, send: Send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self._send = send
+        self._start: Optional[Message] = None
+        self._compressor: Optional[_Compressor] = None
+        self._passthrough = False
+
+    def _eligible(self, headers: Headers) -> bool:
+        content_type = headers.get("content-type", "")
+        return "content-encoding" not in headers and content_type.startswith(COMPRESSIBLE_TYPES)
+
+    async def send(self, message: Message):
+        if message["type"] == "http.response.start":
+            self._start = message
+            self._passthrough = not self._eligible(Headers(raw=message["headers"]))
+            if self._passthrough:
+                await self._send(message)
+            return
+        if message["type"] != "http.response.body" or self._passthrough:
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self._compressor is None:
+            if not more_body and len(body) < self.middleware.minimum_size:
+                await self._send(self._start)
+                await self._send(message)
+                self._passthrough = True
+                return
+            self._compressor = _Compressor(self.encoding, self.middleware.gzip_level, self.middleware.brotli_quality)
+            headers = MutableHeaders(raw=self._start["headers"])
+            headers["Content-Encoding"] = self.encoding
+            headers.add_vary_header("Accept-Encoding")
+            if more_body:
+                del headers["Content-Length"]
+            else:
+                compressed = self._compressor.compress(body) + self._compressor.finish()
+                headers["Content-Length"] = str(len(compressed))
+                await self._send(self._start)
+                await self._send({"type": "http.response.body", "body": compressed})
+                return
+            await self._send(self._start)
+
+        chunk = self._compressor.compress(body)
+        if not more_body:
+            chunk += self._compressor.finish()
+        await self._send({"type": "http.response.body", "body": chunk, "more_body": more_body})
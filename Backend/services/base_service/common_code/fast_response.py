@@ -0,0 +1,108 @@
+"""
+Fast JSON response path.
+
+`FastJSONResponse` renders with orjson when it is installed. `ValidatedModelRoute` short-circuits
+FastAPI's response handling when a handler already returns exactly the declared `response_model`
+(or a list of it): the models were validated when they were built, so they are dumped straight to
+JSON instead of being converted, re-validated and run through `jsonable_encoder` again. Any other
+return value (dicts, subclasses that may carry extra fields, ...) takes the regular path.
+
+Dates and times are rendered with `isoformat()` like `jsonable_encoder` does, including datetime
+subclasses such as Firestore's `DatetimeWithNanoseconds`, which orjson refuses natively.
+"""
+import asyncio
+import functools
+import json
+from datetime import date, datetime, time
+from typing import Any, Callable, Optional, Type, get_args, get_origin
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+def _default(value: Any):
+    if isinstance(value, BaseModel):
+        return value.dict()
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _json_default(value: Any):
+    try:
+        return _default(value)
+    except TypeError:
+        return str(value)
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME)
+    return json.dumps(content, default=_json_default, separators=(",", ":")).encode()
+
+
+class FastJSONResponse(JSONResponse):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def _model_types(response_model: Any):
+    """Returns (model, is_list) for `Model` and `List[Model]` response models"""
+    if isinstance(response_model, type) and issubclass(response_model, BaseModel):
+        return response_model, False
+    if get_origin(response_model) is list:
+        args = get_args(response_model)
+        if len(args) == 1 and isinstance(args[0], type) and issubclass(args[0], BaseModel):
+            return args[0], True
+    return None, False
+
+
+class ValidatedModelRoute(APIRoute):
+
+    def get_route_handler(self) -> Callable:
+        model, is_list = _model_types(self.response_model)
+        call = self.dependant.call
+        if model is not None and call is not None and not getattr(call, "_fast_response", False):
+            self.dependant.call = self._wrap(call, model, is_list)
+        return super().get_route_handler()
+
+    def _to_response(self, result: Any, model: Type[BaseModel], is_list: bool) -> Optional[FastJSONResponse]:
+        options = dict(
+            include=self.response_model_include,
+            exclude=self.response_model_exclude,
+            by_alias=self.response_model_by_alias,
+            exclude_unset=self.response_model_exclude_unset,
+            exclude_defaults=self.response_model_exclude_defaults,
+            exclude_none=self.response_model_exclude_none,
+        )
+        if is_list:
+            if not isinstance(result, list) or any(type(item) is not model for item in result):
+                return None
+            content = [item.dict(**options) for item in result]
+        elif type(result) is model:
+            content = result.dict(**options)
+        else:
+            return None
+        return FastJSONResponse(content, status_code=self.status_code or 200)
+
+    def _wrap(self, call: Callable, model: Type[BaseModel], is_list: bool) -> Callable:
+        if asyncio.iscoroutinefunction(call):
+            @functools.wraps(call)
+            async def endpoint(*args, **kwargs):
+                result = await call(*args, **kwargs)
+                return self._to_response(result, model, is_list) or result
+        else:
+            @functools.wraps(call)
+            def endpoint(*args, **kwargs):
+                result = call(*args, **kwargs)
+                return self._to_response(result, model, is_list) or result
+        endpoint._fast_response = True
+        return endpoint
@@ -0,0 +1,69 @@
+"""
+ETag / conditional GET support.
+
+Route dependencies compute a cheap validator (a maintained version counter) before the handler
+runs and call `check_not_modified`. When the client's `If-None-Match` matches, `NotModified` is
+raised and the app answers `304` without running the handler. Otherwise the ETag and the route's
+`Cache-Control` policy are stashed on `request.state`, and `log_requests` puts them on the
+response.
+"""
+import hashlib
+from typing import Any, Optional
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+from config import get_http_cache_config
+
+
+class NotModified(Exception):
+
+    def __init__(self, etag: str, cache_control: str):
+        self.etag = etag
+        self.cache_control = cache_control
+
+
+def route_name(request: Request) -> Optional[str]:
+    endpoint = request.scope.get("endpoint")
+    return getattr(endpoint, "__name__", None)
+
+
+def make_etag(*parts: Any) -> str:
+    digest = hashlib.sha1(":".join(str(part) for part in parts).encode()).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison, as required for If-None-Match
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def check_not_modified(request: Request, *validator: Any):
+    """
+    Applies the route's cache policy and raises `NotModified` when the client already has the
+    representation identified by `validator`. Pass no validator to only apply the policy.
+    """
+    name = route_name(request)
+    cache_control = get_http_cache_config().policy_for(name)
+    request.state.cache_control = cache_control
+    if not validator or any(part is None for part in validator):
+        return
+    etag = make_etag(name, *validator)
+    request.state.etag = etag
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        raise NotModified(etag, cache_control)
+
+
+async def not_modified_handler(request: Request, exc: NotModified) -> Response:
+    return Response(status_code=304, headers={"ETag": exc.etag, "Cache-Control": exc.cache_control})
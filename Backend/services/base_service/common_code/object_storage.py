@@ -0,0 +1,122 @@
+"""
+Minimal object storage abstraction: a GCS bucket in deployed environments and a local directory
+for development and tests. Objects are read and written as binary streams so callers never
+need to hold a whole object in memory.
+"""
+import os
+from typing import BinaryIO, Iterator, Optional
+
+from google.api_core.exceptions import NotFound
+
+from config import ArchiveConfig, get_archive_config, get_storage_bucket
+
+
+class ObjectStorage:
+
+    def open_write(self, key: str) -> BinaryIO:
+        raise NotImplementedError
+
+    def open_read(self, key: str) -> BinaryIO:
+        raise NotImplementedError
+
+    def exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        """Deleting an object that does not exist is not an error"""
+        raise NotImplementedError
+
+    def list(self, prefix: str = "") -> Iterator[str]:
+        raise NotImplementedError
+
+    def uri(self, key: str) -> str:
+        raise NotImplementedError
+
+
+class GcsObjectStorage(ObjectStorage):
+
+    def __init__(self, bucket_name: str):
+        self.bucket = get_storage_bucket(bucket_name)
+        if self.bucket is None:
+            raise RuntimeError(f"Storage bucket '{bucket_name}' not found")
+
+    def open_write(self, key: str) -> BinaryIO:
+        return self.bucket.blob(key).open("wb")
+
+    def open_read(self, key: str) -> BinaryIO:
+        return self.bucket.blob(key).open("rb")
+
+    def exists(self, key: str) -> bool:
+        return self.bucket.blob(key).exists()
+
+    def delete(self, key: str):
+        try:
+            self.bucket.blob(key).delete()
+        except NotFound:
+            pass
+
+    def list(self, prefix: str = "") -> Iterator[str]:
+        for blob in self.bucket.list_blobs(prefix=prefix):
+            yield blob.name
+
+    def uri(self, key: str) -> str:
+        return f"gs://{self.bucket.name}/{key}"
+
+
+class LocalObjectStorage(ObjectStorage):
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+
+    def _path(self, key: str) -> str:
+        path = os.path.abspath(os.path.join(self.root, key))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f"Invalid object key '{key}'")
+        return path
+
+    def open_write(self, key: str) -> BinaryIO:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return open(path, "wb")
+
+    def open_read(self, key: str) -> BinaryIO:
+        return open(self._path(key), "rb")
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+    def delete(self, key: str):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def list(self, prefix: str = "") -> Iterator[str]:
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                key = os.path.relpath(os.path.join(directory, name), self.root).replace(os.sep, "/")
+                if key.startswith(prefix):
+                    yield key
+
+    def uri(self, key: str) -> str:
+        return f"file://{self._path(key)}"
+
+
+_storage: Optional[ObjectStorage] = None
+
+
+def get_object_storage(config: Optional[ArchiveConfig] = None) -> ObjectStorage:
+    global _storage
+    if config is not None:
+        return _build_storage(config)
+    if _storage is None:
+        _storage = _build_storage(get_archive_config())
+    return _storage
+
+
+def _build_storage(config: ArchiveConfig) -> ObjectStorage:
+    if config.archive_local_path:
+        return LocalObjectStorage(config.archive_local_path)
+    if config.archive_bucket:
+        return GcsObjectStorage(config.archive_bucket)
+    raise RuntimeError("No archive storage configured, set ARCHIVE_BUCKET or ARCHIVE_LOCAL_PATH")
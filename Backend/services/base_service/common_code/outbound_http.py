@@ -0,0 +1,226 @@
+"""
+Managed outbound HTTP layer.
+
+All traffic towards customer hosts (spec fetches, test requests) goes through one long-lived
+`httpx.AsyncClient` per target host, so connections are kept alive and reused. Each host also
+gets a token bucket that backs off when the host answers 429/503 and a circuit breaker that stops
+sending requests to a host that keeps failing.
+"""
+import asyncio
+import time
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from config import OutboundHttpConfig, get_outbound_http_config
+from logconfig import get_logger
+
+logger = get_logger()
+
+THROTTLE_STATUS_CODES = (429, 503)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of sending a request to a host whose circuit is open"""
+
+    def __init__(self, host: str, retry_in: float):
+        super().__init__(f"Circuit open for {host}, retry in {retry_in:.1f}s")
+        self.host = host
+        self.retry_in = retry_in
+
+
+class TokenBucket:
+    """
+    Async token bucket with AIMD rate adaptation: the refill rate is halved whenever the host
+    signals throttling and grows back additively on successful responses.
+    """
+
+    def __init__(self, rate: float, capacity: int, min_rate: float = 1.0):
+        self.max_rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.blocked_until = 0.0
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                wait = self.blocked_until - now
+                if wait <= 0 and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep(max(wait, (1 - self.tokens) / self.rate))
+
+    def penalize(self, retry_after: Optional[float] = None):
+        self.rate = max(self.min_rate, self.rate / 2)
+        if retry_after:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+
+    def reward(self):
+        if self.rate < self.max_rate:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+
+class CircuitBreaker:
+    """
+    Classic closed / open / half-open breaker. After `failure_threshold` consecutive failures the
+    circuit opens for `reset_timeout` seconds, then a single probe request decides whether it
+    closes again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, host: str, failure_threshold: int, reset_timeout: float):
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+
+    def before_request(self):
+        if self.state == self.CLOSED:
+            return
+        elapsed = time.monotonic() - self.opened_at
+        if self.state == self.OPEN and elapsed >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return
+        raise CircuitOpenError(self.host, max(self.reset_timeout - elapsed, 0.0))
+
+    def release_probe(self):
+        """The request ended without a verdict on the host (cancelled, or failed before sending)"""
+        self._probe_in_flight = False
+
+    def record_success(self):
+        self.failures = 0
+        self._probe_in_flight = False
+        self.state = self.CLOSED
+
+    def record_failure(self):
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning("Opening circuit for outbound host", host=self.host, failures=self.failures)
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    value = response.headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+class _HostState:
+    def __init__(self, host: str, config: OutboundHttpConfig, http2: bool):
+        self.client = httpx.AsyncClient(
+            http2=http2,
+            timeout=config.timeout,
+            limits=httpx.Limits(
+                max_connections=config.max_connections_per_host,
+                max_keepalive_connections=config.max_keepalive_per_host,
+                keepalive_expiry=config.keepalive_expiry,
+            ),
+        )
+        self.bucket = TokenBucket(config.requests_per_second, config.burst, config.min_requests_per_second)
+        self.breaker = CircuitBreaker(host, config.breaker_failure_threshold, config.breaker_reset_timeout)
+
+
+class OutboundHttpPool:
+    """
+    Per-host clients, rate limiters and circuit breakers for outbound requests.
+    """
+
+    def __init__(self, config: Optional[OutboundHttpConfig] = None):
+        self.config = config or get_outbound_http_config()
+        self.http2 = self.config.http2 and _http2_available()
+        if self.config.http2 and not self.http2:
+            logger.warning("HTTP/2 requested for outbound traffic but 'h2' is not installed, using HTTP/1.1")
+        self._hosts: Dict[str, _HostState] = {}
+
+    @staticmethod
+    def host_key(url: str) -> str:
+        parts = urlsplit(str(url))
+        return f"{parts.scheme}://{parts.netloc}".lower()
+
+    def _host(self, url: str) -> _HostState:
+        key = self.host_key(url)
+        state = self._hosts.get(key)
+        if state is None:
+            state = self._hosts[key] = _HostState(key, self.config, self.http2)
+        return state
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        state = self._host(url)
+        state.breaker.before_request()
+        try:
+            await state.bucket.acquire()
+            response = await state.client.request(method, str(url), **kwargs)
+        except httpx.TransportError:
+            state.breaker.record_failure()
+            raise
+        except BaseException:
+            state.breaker.release_probe()
+            raise
+
+        if response.status_code in THROTTLE_STATUS_CODES:
+            state.bucket.penalize(_retry_after(response))
+        else:
+            state.bucket.reward()
+        if response.status_code >= 500:
+            state.breaker.record_failure()
+        else:
+            state.breaker.record_success()
+        return response
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def aclose(self):
+        hosts, self._hosts = self._hosts, {}
+        await asyncio.gather(*(state.client.aclose() for state in hosts.values()), return_exceptions=True)
+
+
+_pool: Optional[OutboundHttpPool] = None
+
+
+def get_outbound_pool() -> OutboundHttpPool:
+    global _pool
+    if _pool is None:
+        _pool = OutboundHttpPool()
+    return _pool
+
+
+async def close_outbound_pool():
+    global _pool
+    if _pool is not None:
+        pool, _pool = _pool, None
+        await pool.aclose()
@@ -0,0 +1,198 @@
+"""
+Per-user rate limiting by subscription plan.
+
+Every request takes tokens from a bucket keyed by the caller (the verified Firebase uid, or the
+client address for anonymous calls) and sized by the caller's plan. Behind proxies the client
+address is the `X-Forwarded-For` entry added by the outermost trusted proxy
+(`trusted_proxy_hops` from the right); entries left of it are client supplied. Expensive routes cost more
+than one token (see `RateLimitConfig.costs`). Plans are cached for `plan_cache_seconds`, so a
+limit check normally costs no Firestore read; `invalidate_user_plan` drops a cached plan when a
+subscription changes.
+
+Buckets live either in process (`InMemoryRateLimitBackend`) or in a shared store
+(`SharedRateLimitBackend`) so that several instances enforce one budget. The shared store only
+has to offer an atomic read-modify-write, see `SharedStore`; `LocalSharedStore` is an
+in-process stand-in for it.
+"""
+import asyncio
+import importlib
+import threading
+import time
+from fnmatch import fnmatchcase
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
+
+from cachetools import LRUCache, TTLCache
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from common_code.blocking import FIREBASE_AUTH, FIRESTORE, run_blocking
+from config import RateLimitConfig, get_rate_limit_config
+from get_user import bearer_token, cached_token_uid, verify_token_uid
+
+DEFAULT_PLAN = "free"
+
+BucketState = Tuple[float, float]
+
+
+class RateLimitDecision(NamedTuple):
+    allowed: bool
+    remaining: int
+    retry_after: float
+
+
+def take_tokens(state: Optional[BucketState], rate: float, burst: float, cost: float, now: float) -> Tuple[BucketState, RateLimitDecision]:
+    """Refills a `(tokens, updated_at)` bucket up to `now` and tries to take `cost` tokens"""
+    tokens, updated_at = state if state else (burst, now)
+    tokens = min(burst, tokens + max(now - updated_at, 0.0) * rate)
+    cost = min(cost, burst)
+    if tokens >= cost:
+        tokens -= cost
+        return (tokens, now), RateLimitDecision(True, int(tokens), 0.0)
+    return (tokens, now), RateLimitDecision(False, int(tokens), (cost - tokens) / rate)
+
+
+class RateLimitBackend:
+
+    async def consume(self, key: str, rate: float, burst: float, cost: float) -> RateLimitDecision:
+        raise NotImplementedError
+
+
+class InMemoryRateLimitBackend(RateLimitBackend):
+
+    def __init__(self, max_buckets: int = 100000):
+        self._buckets = LRUCache(maxsize=max_buckets)
+        self._lock = threading.Lock()
+
+    async def consume(self, key: str, rate: float, burst: float, cost: float) -> RateLimitDecision:
+        with self._lock:
+            state, decision = take_tokens(self._buckets.get(key), rate, burst, cost, time.monotonic())
+            self._buckets[key] = state
+        return decision
+
+
+class SharedStore:
+    """Atomically replaces the value under `key` with `update(current)` and returns the result of `update`"""
+
+    async def update(self, key: str, update: Callable[[Optional[BucketState]], Tuple[BucketState, RateLimitDecision]], ttl: float) -> RateLimitDecision:
+        raise NotImplementedError
+
+
+class LocalSharedStore(SharedStore):
+
+    def __init__(self):
+        self._values: Dict[str, Tuple[BucketState, float]] = {}
+        self._lock = asyncio.Lock()
+
+    async def update(self, key, update, ttl):
+        async with self._lock:
+            now = time.time()
+            current = self._values.get(key)
+            state, decision = update(current[0] if current and current[1] > now else None)
+            self._values[key] = (state, now + ttl)
+            return decision
+
+
+class SharedRateLimitBackend(RateLimitBackend):
+
+    def __init__(self, store: SharedStore):
+        self.store = store
+
+    async def consume(self, key: str, rate: float, burst: float, cost: float) -> RateLimitDecision:
+        # Wall clock, since the bucket is shared across processes; expire once it would be full again
+        ttl = burst / rate + 1
+        return await self.store.update(key, lambda state: take_tokens(state, rate, burst, cost, time.time()), ttl)
+
+
+def create_backend(config: RateLimitConfig) -> RateLimitBackend:
+    if config.backend == "shared":
+        if config.shared_store:
+            module_name, _, factory = config.shared_store.partition(":")
+            store = getattr(importlib.import_module(module_name), factory)()
+        else:
+            store = LocalSharedStore()
+        return SharedRateLimitBackend(store)
+    return InMemoryRateLimitBackend(config.max_buckets)
+
+
+_plan_cache = TTLCache(maxsize=100000, ttl=get_rate_limit_config().plan_cache_seconds)
+_plan_cache_lock = threading.Lock()
+
+
+def invalidate_user_plan(uid: str):
+    with _plan_cache_lock:
+        _plan_cache.pop(uid, None)
+
+
+def client_address(request: Request, trusted_proxy_hops: int) -> str:
+    forwarded = [
+        address.strip() for header in request.headers.getlist("x-forwarded-for") for address in header.split(",") if address.strip()
+    ]
+    if trusted_proxy_hops > 0 and forwarded:
+        return forwarded[-min(trusted_proxy_hops, len(forwarded))]
+    return request.client.host if request.client else "unknown"
+
+
+class RateLimitMiddleware:
+
+    def __init__(self, app: ASGIApp, plan_resolver: Callable[[str], str], config: Optional[RateLimitConfig] = None, backend: Optional[RateLimitBackend] = None):
+        self.app = app
+        self.plan_resolver = plan_resolver
+        self.config = config or get_rate_limit_config()
+        self.backend = backend or create_backend(self.config)
+
+    def request_cost(self, method: str, path: str) -> int:
+        target = f"{method} {path}"
+        for pattern, cost in self.config.costs.items():
+            if fnmatchcase(target, pattern):
+                return cost
+        return 1
+
+    async def resolve_plan(self, uid: str) -> str:
+        with _plan_cache_lock:
+            plan = _plan_cache.get(uid)
+        if plan is None:
+            try:
+                plan = await run_blocking(FIRESTORE, self.plan_resolver, uid)
+            except Exception:
+                plan = DEFAULT_PLAN
+            with _plan_cache_lock:
+                _plan_cache[uid] = plan
+        return plan
+
+    async def caller(self, request: Request) -> Tuple[str, str]:
+        token = bearer_token(request)
+        if token:
+            uid = cached_token_uid(token)
+            if uid is None:
+                try:
+                    uid = await run_blocking(FIREBASE_AUTH, verify_token_uid, token)
+                except Exception:
+                    uid = None
+            if uid:
+                return f"user:{uid}", await self.resolve_plan(uid)
+        return f"ip:{client_address(request, self.config.trusted_proxy_hops)}", DEFAULT_PLAN
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not self.config.enabled or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+        request = Request(scope)
+        key, plan = await self.caller(request)
+        limits = self.config.plan_limits.get(plan) or self.config.plan_limits[DEFAULT_PLAN]
+        rate, burst = float(limits["rate"]), float(limits["burst"])
+        decision = await self.backend.consume(key, rate, burst, self.request_cost(scope["method"], scope["path"]))
+        headers = {"X-RateLimit-Limit": str(int(burst)), "X-RateLimit-Remaining": str(decision.remaining)}
+        if not decision.allowed:
+            headers["Retry-After"] = str(max(1, int(decision.retry_after + 0.999)))
+            response = JSONResponse({"error": "Rate limit exceeded", "plan": plan}, status_code=429, headers=headers)
+            await response(scope, receive, send)
+            return
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(name.lower().encode(), value.encode()) for name, value in headers.items()]
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
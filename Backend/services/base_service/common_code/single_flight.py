@@ -0,0 +1,159 @@
+"""
+Single-flight coalescing of identical concurrent reads.
+
+A function decorated with `single_flight` runs at most once at a time per argument tuple:
+callers arriving while a call with the same arguments is in flight wait for it and get the same
+result (or exception). Read paths take the caller's user id as an argument, so the key covers
+both the query and the caller's permissions. Results are shared between callers and must be
+treated as read-only.
+
+Coroutine functions are coalesced per event loop, since a task can only be awaited on its own
+loop; plain functions (sync routes run in the threadpool) across threads. Writers call `forget` / `forget_all` after a write so that readers
+arriving afterwards start a fresh read instead of joining one that began before the write.
+"""
+import asyncio
+import functools
+import threading
+import weakref
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+def _call_key(args: Tuple[Any, ...], kwargs: Dict[str, Any]) -> Optional[Hashable]:
+    key = (args, tuple(sorted(kwargs.items())))
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+class _AsyncFlights:
+
+    def __init__(self, fn: Callable):
+        self.fn = fn
+        # In-flight tasks per event loop; a closed loop drops out with its tasks
+        self.loops: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Hashable, asyncio.Future]]" = weakref.WeakKeyDictionary()
+        # Writers may forget from another thread than the loop's
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, *args, **kwargs):
+        key = _call_key(args, kwargs)
+        if key is None:
+            return await self.fn(*args, **kwargs)
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            inflight = self.loops.setdefault(loop, {})
+            self.calls += 1
+            task = inflight.get(key)
+            if task is not None:
+                self.coalesced += 1
+            else:
+                task = inflight[key] = loop.create_task(self.fn(*args, **kwargs))
+                task.add_done_callback(lambda done, key=key: self._finished(inflight, key, done))
+        # Shielded, so one caller going away does not cancel the read for everyone else
+        return await asyncio.shield(task)
+
+    def _finished(self, inflight: Dict[Hashable, asyncio.Future], key: Hashable, task: asyncio.Future):
+        with self.lock:
+            if inflight.get(key) is task:
+                del inflight[key]
+        if not task.cancelled():
+            # Retrieve the exception so an unawaited failure is not logged as never retrieved
+            task.exception()
+
+    def forget(self, key: Optional[Hashable]):
+        if key is not None:
+            with self.lock:
+                for inflight in self.loops.values():
+                    inflight.pop(key, None)
+
+    def forget_all(self):
+        with self.lock:
+            for inflight in self.loops.values():
+                inflight.clear()
+
+    def in_flight(self) -> int:
+        with self.lock:
+            return sum(len(inflight) for inflight in self.loops.values())
+
+
+class _Call:
+
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class _ThreadFlights:
+
+    def __init__(self, fn: Callable):
+        self.fn = fn
+        self.inflight: Dict[Hashable, _Call] = {}
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.coalesced = 0
+
+    def do(self, *args, **kwargs):
+        key = _call_key(args, kwargs)
+        if key is None:
+            return self.fn(*args, **kwargs)
+        with self.lock:
+            self.calls += 1
+            call = self.inflight.get(key)
+            leader = call is None
+            if leader:
+                call = self.inflight[key] = _Call()
+            else:
+                self.coalesced += 1
+        if leader:
+            try:
+                call.result = self.fn(*args, **kwargs)
+            except BaseException as e:
+                call.error = e
+            finally:
+                with self.lock:
+                    if self.inflight.get(key) is call:
+                        del self.inflight[key]
+                call.done.set()
+        else:
+            call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def forget(self, key: Optional[Hashable]):
+        if key is not None:
+            with self.lock:
+                self.inflight.pop(key, None)
+
+    def forget_all(self):
+        with self.lock:
+            self.inflight.clear()
+
+    def in_flight(self) -> int:
+        with self.lock:
+            return len(self.inflight)
+
+
+def single_flight(fn: Callable) -> Callable:
+    is_async = asyncio.iscoroutinefunction(fn)
+    flights = _AsyncFlights(fn) if is_async else _ThreadFlights(fn)
+
+    if is_async:
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            return await flights.do(*args, **kwargs)
+    else:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            return flights.do(*args, **kwargs)
+
+    wrapper.forget = lambda *args, **kwargs: flights.forget(_call_key(args, kwargs))
+    wrapper.forget_all = flights.forget_all
+    wrapper.flight_stats = lambda: {"calls": flights.calls, "coalesced": flights.coalesced, "in_flight": flights.in_flight()}
+    return wrapper
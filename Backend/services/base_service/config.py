@@ -5,6 +5,8 @@ Configuration settings for the Base API
 from logging import Logger
 import os
 import json 
+from functools import lru_cache
+from typing import Dict, List, Optional
 from google.cloud import storage
 from pydantic import Field, BaseSettings
 from fastapi import Depends
@@ -21,6 +23,313 @@ class BaseConfig(BaseSettings):
     environment: Environment = Field(..., env="ENVIRONMENT")
 
 
+class OutboundHttpConfig(BaseSettings):
+    """
+    Limits for outbound traffic (spec fetches, test requests) towards customer APIs
+    """
+
+    max_connections_per_host: int = Field(100, env="OUTBOUND_MAX_CONNECTIONS_PER_HOST")
+    max_keepalive_per_host: int = Field(20, env="OUTBOUND_MAX_KEEPALIVE_PER_HOST")
+    keepalive_expiry: float = Field(30.0, env="OUTBOUND_KEEPALIVE_EXPIRY")
+    timeout: float = Field(30.0, env="OUTBOUND_TIMEOUT")
+    http2: bool = Field(True, env="OUTBOUND_HTTP2")
+    requests_per_second: float = Field(50.0, env="OUTBOUND_REQUESTS_PER_SECOND")
+    min_requests_per_second: float = Field(1.0, env="OUTBOUND_MIN_REQUESTS_PER_SECOND")
+    burst: int = Field(20, env="OUTBOUND_BURST")
+    breaker_failure_threshold: int = Field(5, env="OUTBOUND_BREAKER_FAILURE_THRESHOLD")
+    breaker_reset_timeout: float = Field(30.0, env="OUTBOUND_BREAKER_RESET_TIMEOUT")
+
+
+def get_outbound_http_config() -> OutboundHttpConfig:
+    return OutboundHttpConfig()
+
+
+class TestRunnerConfig(BaseSettings):
+    """
+    Execution settings for project test runs
+    """
+
+    shard_threshold: int = Field(500, env="TEST_RUN_SHARD_THRESHOLD")
+    max_workers: int = Field(os.cpu_count() or 1, env="TEST_RUN_MAX_WORKERS")
+    read_batch_size: int = Field(100, env="TEST_RUN_READ_BATCH_SIZE")
+    shard_inbox_size: int = Field(64, env="TEST_RUN_SHARD_INBOX_SIZE")
+    sink_batch_size: int = Field(500, env="TEST_RESULT_SINK_BATCH_SIZE")
+    sink_flush_interval: float = Field(1.0, env="TEST_RESULT_SINK_FLUSH_INTERVAL")
+    sink_max_pending: int = Field(5000, env="TEST_RESULT_SINK_MAX_PENDING")
+    sink_max_retries: int = Field(5, env="TEST_RESULT_SINK_MAX_RETRIES")
+    scheduler_slots: int = Field(os.cpu_count() or 1, env="TEST_RUN_SCHEDULER_SLOTS")
+    scheduler_unit_size: int = Field(250, env="TEST_RUN_SCHEDULER_UNIT_SIZE")
+    small_run_threshold: int = Field(50, env="TEST_RUN_SMALL_RUN_THRESHOLD")
+    plan_weights: Dict[str, float] = Field({"free": 1, "basic": 2, "pro": 4, "enterprise": 8}, env="TEST_RUN_PLAN_WEIGHTS")
+    selection_sample_rate: float = Field(0.05, env="TEST_RUN_SELECTION_SAMPLE_RATE")
+    scenario_max_steps: int = Field(100, env="TEST_SCENARIO_MAX_STEPS")
+    scenario_max_parallel_steps: int = Field(8, env="TEST_SCENARIO_MAX_PARALLEL_STEPS")
+    scenario_concurrency: int = Field(4, env="TEST_SCENARIO_CONCURRENCY")
+    # UIDs allowed to read the cross-tenant scheduler metrics, as a JSON list
+    scheduler_operators: List[str] = Field([], env="TEST_RUN_SCHEDULER_OPERATORS")
+
+
+def get_test_runner_config() -> TestRunnerConfig:
+    return TestRunnerConfig()
+
+
+class ArchiveConfig(BaseSettings):
+    """
+    Cold storage of old test runs. `archive_local_path` replaces the bucket with a local
+    directory, for development and tests.
+    """
+
+    archive_bucket: Optional[str] = Field(None, env="ARCHIVE_BUCKET")
+    archive_local_path: Optional[str] = Field(None, env="ARCHIVE_LOCAL_PATH")
+    retention_days: int = Field(90, env="TEST_RUN_RETENTION_DAYS")
+    page_size: int = Field(200, env="ARCHIVE_PAGE_SIZE")
+
+
+def get_archive_config() -> ArchiveConfig:
+    return ArchiveConfig()
+
+
+class ResponseConfig(BaseSettings):
+    """
+    Response encoding settings
+    """
+
+    compression_minimum_size: int = Field(1024, env="COMPRESSION_MINIMUM_SIZE")
+    gzip_level: int = Field(6, env="COMPRESSION_GZIP_LEVEL")
+    brotli_quality: int = Field(4, env="COMPRESSION_BROTLI_QUALITY")
+
+
+def get_response_config() -> ResponseConfig:
+    return ResponseConfig()
+
+
+class SpecSyncConfig(BaseSettings):
+    """
+    Scheduled re-import of specs for projects created from an `openapi_url`
+    """
+
+    enabled: bool = Field(False, env="SPEC_SYNC_ENABLED")
+    interval_seconds: int = Field(3600, env="SPEC_SYNC_INTERVAL_SECONDS")
+    jitter_ratio: float = Field(0.2, env="SPEC_SYNC_JITTER_RATIO")
+    max_concurrency: int = Field(10, env="SPEC_SYNC_MAX_CONCURRENCY")
+    batch_size: int = Field(100, env="SPEC_SYNC_BATCH_SIZE")
+    lease_seconds: int = Field(300, env="SPEC_SYNC_LEASE_SECONDS")
+    poll_seconds: float = Field(30.0, env="SPEC_SYNC_POLL_SECONDS")
+
+
+def get_spec_sync_config() -> SpecSyncConfig:
+    return SpecSyncConfig()
+
+
+class TestScheduleConfig(BaseSettings):
+    """
+    Recurring test runs. Fire times are spread by up to `jitter_ratio` of the schedule's
+    interval, capped at `max_jitter_seconds`
+    """
+
+    enabled: bool = Field(False, env="TEST_SCHEDULES_ENABLED")
+    min_interval_seconds: int = Field(300, env="TEST_SCHEDULES_MIN_INTERVAL_SECONDS")
+    jitter_ratio: float = Field(0.1, env="TEST_SCHEDULES_JITTER_RATIO")
+    max_jitter_seconds: int = Field(300, env="TEST_SCHEDULES_MAX_JITTER_SECONDS")
+    max_concurrency: int = Field(20, env="TEST_SCHEDULES_MAX_CONCURRENCY")
+    batch_size: int = Field(100, env="TEST_SCHEDULES_BATCH_SIZE")
+    lease_seconds: int = Field(1800, env="TEST_SCHEDULES_LEASE_SECONDS")
+    poll_seconds: float = Field(15.0, env="TEST_SCHEDULES_POLL_SECONDS")
+
+
+def get_test_schedule_config() -> TestScheduleConfig:
+    return TestScheduleConfig()
+
+
+class EndpointSearchConfig(BaseSettings):
+    """
+    In-memory endpoint search indexes, bounded by their estimated size in bytes
+    """
+
+    cache_bytes: int = Field(64 * 1024 * 1024, env="ENDPOINT_SEARCH_CACHE_BYTES")
+
+
+def get_endpoint_search_config() -> EndpointSearchConfig:
+    return EndpointSearchConfig()
+
+
+class MockServerConfig(BaseSettings):
+    """
+    Mock responses served from stored endpoints. Route tables are cached per project and
+    re-checked against the project's schema version after `cache_ttl_seconds`
+    """
+
+    latency_ms: float = Field(0.0, env="MOCK_LATENCY_MS")
+    jitter_ms: float = Field(0.0, env="MOCK_JITTER_MS")
+    max_latency_ms: float = Field(30000.0, env="MOCK_MAX_LATENCY_MS")
+    error_rate: float = Field(0.0, env="MOCK_ERROR_RATE")
+    error_status: int = Field(500, env="MOCK_ERROR_STATUS")
+    seed: int = Field(0, env="MOCK_SEED")
+    cache_size: int = Field(256, env="MOCK_CACHE_SIZE")
+    cache_ttl_seconds: float = Field(5.0, env="MOCK_CACHE_TTL_SECONDS")
+
+
+def get_mock_server_config() -> MockServerConfig:
+    return MockServerConfig()
+
+
+class ProfilingConfig(BaseSettings):
+    """
+    Opt-in request profiling. Requests are profiled when they send `header` with the value of
+    `token`, or at random with `sample_rate`. Profiles go to the archive object storage
+    """
+
+    enabled: bool = Field(True, env="PROFILING_ENABLED")
+    token: Optional[str] = Field(None, env="PROFILING_TOKEN")
+    header: str = Field("X-Profile", env="PROFILING_HEADER")
+    sample_rate: float = Field(0.0, env="PROFILING_SAMPLE_RATE")
+    top_frames: int = Field(15, env="PROFILING_TOP_FRAMES")
+    storage_prefix: str = Field("profiles", env="PROFILING_STORAGE_PREFIX")
+
+
+def get_profiling_config() -> ProfilingConfig:
+    return ProfilingConfig()
+
+
+class ProjectLayoutConfig(BaseSettings):
+    """
+    Endpoints, tests and test runs live under their project document. `dual_read` also reads
+    the legacy top-level collections while `projects.migrate_layout` copies them over; turn it
+    off once the migration reports every project as migrated.
+    """
+
+    dual_read: bool = Field(True, env="PROJECT_LAYOUT_DUAL_READ")
+    migration_page_size: int = Field(500, env="PROJECT_LAYOUT_MIGRATION_PAGE_SIZE")
+
+
+def get_project_layout_config() -> ProjectLayoutConfig:
+    return ProjectLayoutConfig()
+
+
+class UserProvisioningConfig(BaseSettings):
+    """
+    Bulk user provisioning. `auth_batch_size` is capped at 1000 by `auth.import_users` and
+    `write_batch_size` at 500 by Firestore batches. Passwords are imported as PBKDF2-SHA256 hashes
+    with `password_hash_rounds` rounds; rows without a password get an account without one.
+    """
+
+    max_rows: int = Field(10000, env="PROVISION_MAX_ROWS")
+    auth_batch_size: int = Field(1000, env="PROVISION_AUTH_BATCH_SIZE")
+    write_batch_size: int = Field(500, env="PROVISION_WRITE_BATCH_SIZE")
+    password_hash_rounds: int = Field(10000, env="PROVISION_PASSWORD_HASH_ROUNDS")
+
+
+def get_user_provisioning_config() -> UserProvisioningConfig:
+    return UserProvisioningConfig()
+
+
+class AIModelCatalogConfig(BaseSettings):
+    """`aimodels.catalog_sync`: writes per Firestore batch, at most 500"""
+
+    sync_batch_size: int = Field(500, env="AIMODELS_SYNC_BATCH_SIZE")
+
+
+def get_ai_model_catalog_config() -> AIModelCatalogConfig:
+    return AIModelCatalogConfig()
+
+
+DEFAULT_BLOCKING_LIMITS = {
+    "firebase_auth": 8,
+    "firestore": 32,
+    "firestore_bulk": 4,
+    "storage": 4,
+}
+
+DEFAULT_BLOCKING_TIMEOUTS = {
+    "firebase_auth": 10.0,
+    "firestore": 30.0,
+    "firestore_bulk": 300.0,
+    "storage": 60.0,
+}
+
+
+class BlockingExecutorConfig(BaseSettings):
+    """
+    Thread pool for blocking SDK calls made from async code. Every backend gets its own
+    concurrency limit and timeout (queueing included); backends that are not listed use the
+    defaults. The pool is sized to the sum of the limits, so one slow backend cannot take the
+    threads of the others.
+    """
+
+    limits: Dict[str, int] = Field(DEFAULT_BLOCKING_LIMITS, env="BLOCKING_LIMITS")
+    timeouts: Dict[str, float] = Field(DEFAULT_BLOCKING_TIMEOUTS, env="BLOCKING_TIMEOUTS")
+    default_limit: int = Field(8, env="BLOCKING_DEFAULT_LIMIT")
+    default_timeout: float = Field(30.0, env="BLOCKING_DEFAULT_TIMEOUT")
+
+
+def get_blocking_executor_config() -> BlockingExecutorConfig:
+    return BlockingExecutorConfig()
+
+
+DEFAULT_PLAN_LIMITS = {
+    "free": {"rate": 2.0, "burst": 20},
+    "basic": {"rate": 5.0, "burst": 50},
+    "pro": {"rate": 20.0, "burst": 200},
+    "enterprise": {"rate": 100.0, "burst": 1000},
+}
+
+DEFAULT_REQUEST_COSTS = {
+    "POST */projects/*/run-tests": 10,
+    "POST */projects/*/import-schema": 5,
+}
+
+
+class RateLimitConfig(BaseSettings):
+    """
+    Per-user token buckets sized by subscription plan. Request costs are keyed by
+    "METHOD path-glob"; anything unmatched costs 1 token. `backend` is `memory` (per instance)
+    or `shared`, in which case `shared_store` names a `module:factory` returning the store.
+    `trusted_proxy_hops` is the number of proxies that append to `X-Forwarded-For` (Cloud Run's
+    front end is one); 0 keys anonymous callers by the socket address.
+    """
+
+    enabled: bool = Field(True, env="RATE_LIMIT_ENABLED")
+    backend: str = Field("memory", env="RATE_LIMIT_BACKEND")
+    shared_store: Optional[str] = Field(None, env="RATE_LIMIT_SHARED_STORE")
+    plan_limits: Dict[str, Dict[str, float]] = Field(DEFAULT_PLAN_LIMITS, env="RATE_LIMIT_PLAN_LIMITS")
+    costs: Dict[str, int] = Field(DEFAULT_REQUEST_COSTS, env="RATE_LIMIT_COSTS")
+    plan_cache_seconds: int = Field(300, env="RATE_LIMIT_PLAN_CACHE_SECONDS")
+    max_buckets: int = Field(100000, env="RATE_LIMIT_MAX_BUCKETS")
+    trusted_proxy_hops: int = Field(1, env="RATE_LIMIT_TRUSTED_PROXY_HOPS")
+
+
+def get_rate_limit_config() -> RateLimitConfig:
+    return RateLimitConfig()
+
+
+DEFAULT_CACHE_POLICIES = {
+    "get_all_projects": "private, no-cache",
+    "get_project": "private, no-cache",
+    "get_project_endpoints": "private, no-cache",
+    "get_project_test_history": "private, no-cache",
+    "get_all_ai_models_route": "private, max-age=300",
+}
+
+
+class HttpCacheConfig(BaseSettings):
+    """
+    `Cache-Control` per route handler name, e.g.
+    HTTP_CACHE_POLICIES='{"get_project": "private, max-age=30"}'. Routes that are not listed
+    are sent with `no-store`.
+    """
+
+    policies: Dict[str, str] = Field(DEFAULT_CACHE_POLICIES, env="HTTP_CACHE_POLICIES")
+    default_policy: str = Field("no-store", env="HTTP_CACHE_DEFAULT_POLICY")
+
+    def policy_for(self, route_name: Optional[str]) -> str:
+        return self.policies.get(route_name, self.default_policy) if route_name else self.default_policy
+
+
+@lru_cache()
+def get_http_cache_config() -> HttpCacheConfig:
+    return HttpCacheConfig()
+
+
 def get_config(env: Environment = Depends(get_environment)) -> BaseConfig:
     return BaseConfig(
         environment=env,
@@ -1,21 +1,59 @@
 # get_user.py
+import threading
+import time
+from typing import Optional
+
 import firebase_admin
+from cachetools import LRUCache, TTLCache
 from firebase_admin import auth
 
 firebase_admin.initialize_app()
 from fastapi import HTTPException, Request, status
 
+# Verified tokens, so the rate limiter and the route dependency verify each token only once
+_verified_tokens = LRUCache(maxsize=10000)
+# Tokens that failed verification, so a client repeating a bad token costs one check a minute
+_rejected_tokens = TTLCache(maxsize=10000, ttl=60)
+_verified_tokens_lock = threading.Lock()
+
+def bearer_token(req: Request) -> Optional[str]:
+    header = req.headers.get("Authorization")
+    return header.split(' ').pop() if header else None
+
+def cached_token_uid(token: str) -> Optional[str]:
+    """The uid of a token verified before, without a signature check"""
+    with _verified_tokens_lock:
+        cached = _verified_tokens.get(token)
+    return cached[0] if cached and cached[1] > time.time() else None
+
+def verify_token_uid(token: str) -> str:
+    now = time.time()
+    uid = cached_token_uid(token)
+    if uid:
+        return uid
+    with _verified_tokens_lock:
+        if token in _rejected_tokens:
+            raise ValueError("ID token was rejected recently")
+    try:
+        user = auth.verify_id_token(token)
+    except ValueError:
+        # Invalid, expired or revoked tokens; certificate fetch failures are not cached
+        with _verified_tokens_lock:
+            _rejected_tokens[token] = True
+        raise
+    with _verified_tokens_lock:
+        _verified_tokens[token] = (user['uid'], user.get('exp', now))
+    return user['uid']
+
 def get_current_user(req: Request):
     try:
-    
+
         token = req.headers["Authorization"].split(' ').pop()
         # print(f'token:{token}')
-        user = auth.verify_id_token(token)
-        # print(f'user:{user}')
-        return user['uid']
+        return verify_token_uid(token)
     except Exception as e:
         print(f'Error in token validation:{e}')
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect Authenticaiton credentials"
-        ) 
\ No newline at end of file
+        )
@@ -1,9 +1,52 @@
 # logconfig.py
+"""
+Logging setup.
+
+Events go through structlog's processors on the calling thread only as far as they depend on
+that thread (context variables, exception info, timestamp). The event dict is then handed to
+`LogShipper`, which renders and writes events on a background thread in batches, so request
+paths never wait on JSON rendering or stdout. The queue is bounded: when it is full, events are
+dropped according to `LOG_DROP_POLICY` and counted, and a summary of what was dropped is written
+with the next batch. `shutdown_logging` drains the queue.
+"""
+import atexit
+import hashlib
+import sys
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, TextIO
+
 import structlog
+from pydantic import BaseSettings, Field
 from structlog import BoundLogger
 
 from environment import Environment
 
+DROP_NEWEST = "drop_newest"
+DROP_OLDEST = "drop_oldest"
+BLOCK = "block"
+
+LARGE_FIELD_TRUNCATE = "truncate"
+LARGE_FIELD_HASH = "hash"
+
+
+class LogShippingConfig(BaseSettings):
+    """
+    Background log shipping. Declared here rather than in config.py, which logs through this
+    module. `large_field_mode` is `truncate`, `hash` or `off`
+    """
+
+    enabled: bool = Field(True, env="LOG_SHIPPING_ENABLED")
+    queue_size: int = Field(10000, env="LOG_QUEUE_SIZE")
+    batch_size: int = Field(256, env="LOG_BATCH_SIZE")
+    flush_interval: float = Field(0.2, env="LOG_FLUSH_INTERVAL")
+    drop_policy: str = Field(DROP_OLDEST, env="LOG_DROP_POLICY")
+    block_timeout: float = Field(0.05, env="LOG_BLOCK_TIMEOUT")
+    large_fields: List[str] = Field(["response_body"], env="LOG_LARGE_FIELDS")
+    large_field_mode: str = Field(LARGE_FIELD_TRUNCATE, env="LOG_LARGE_FIELD_MODE")
+    max_field_chars: int = Field(2048, env="LOG_MAX_FIELD_CHARS")
+
 
 def get_logger() -> BoundLogger:
     """
@@ -17,10 +60,147 @@ s
     return structlog.get_logger()
 
 
-def configure_logging(environment: Environment):
+class LargeFieldLimiter:
+    """
+    Processor that truncates or hashes string fields longer than `max_chars`
+    """
+
+    def __init__(self, fields: List[str], mode: str, max_chars: int):
+        self.fields = fields
+        self.mode = mode
+        self.max_chars = max_chars
+
+    def __call__(self, logger, method_name: str, event_dict: Dict[str, Any]) -> Dict[str, Any]:
+        for field in self.fields:
+            value = event_dict.get(field)
+            if isinstance(value, (bytes, bytearray)):
+                value = value.decode("utf-8", "replace")
+            if not isinstance(value, str) or len(value) <= self.max_chars:
+                continue
+            if self.mode == LARGE_FIELD_HASH:
+                event_dict[field] = f"sha256:{hashlib.sha256(value.encode()).hexdigest()} ({len(value)} chars)"
+            else:
+                event_dict[field] = f"{value[:self.max_chars]}... [{len(value) - self.max_chars} more chars]"
+        return event_dict
+
+
+class LogShipper:
+    """
+    Bounded queue of event dicts, rendered and written in batches by a daemon thread.
+    """
+
+    def __init__(self, render: Callable[[Dict[str, Any]], str], config: LogShippingConfig, stream: Optional[TextIO] = None):
+        self.render = render
+        self.config = config
+        self.stream = stream
+        self.dropped = {DROP_NEWEST: 0, DROP_OLDEST: 0}
+        self.shipped = 0
+        self.batches = 0
+        self.render_errors = 0
+        self._reported_drops = 0
+        self._queue: Deque[Dict[str, Any]] = deque()
+        self._changed = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="log-shipper", daemon=True)
+        self._thread.start()
+
+    def __call__(self, logger, method_name: str, event_dict: Dict[str, Any]):
+        """Last processor: queues the event and stops structlog from printing it"""
+        self.put(event_dict)
+        raise structlog.DropEvent
+
+    def put(self, event_dict: Dict[str, Any]):
+        with self._changed:
+            if self._closed:
+                self._write([self._render(event_dict)])
+                return
+            if len(self._queue) >= self.config.queue_size:
+                if self.config.drop_policy == BLOCK:
+                    self._changed.wait_for(lambda: len(self._queue) < self.config.queue_size, self.config.block_timeout)
+                if len(self._queue) >= self.config.queue_size:
+                    if self.config.drop_policy == DROP_OLDEST:
+                        self._queue.popleft()
+                        self.dropped[DROP_OLDEST] += 1
+                    else:
+                        self.dropped[DROP_NEWEST] += 1
+                        return
+            self._queue.append(event_dict)
+            if len(self._queue) >= self.config.batch_size:
+                self._changed.notify_all()
+
+    def _render(self, event_dict: Dict[str, Any]) -> str:
+        try:
+            return self.render(event_dict)
+        except Exception as e:
+            self.render_errors += 1
+            return f"Could not render log event {event_dict.get('event')!r}: {e!r}"
+
+    def _take_batch(self) -> List[Dict[str, Any]]:
+        with self._changed:
+            if not self._closed and len(self._queue) < self.config.batch_size:
+                self._changed.wait(self.config.flush_interval)
+            batch = [self._queue.popleft() for _ in range(min(len(self._queue), self.config.batch_size))]
+            dropped = sum(self.dropped.values())
+            if dropped != self._reported_drops:
+                batch.append({
+                    "event": "Log events dropped", "level": "warning", "timestamp": _timestamp(),
+                    "dropped_total": dict(self.dropped), "dropped_since_last_report": dropped - self._reported_drops,
+                })
+                self._reported_drops = dropped
+            if batch:
+                # Blocked producers may continue
+                self._changed.notify_all()
+            return batch
+
+    def _write(self, lines: List[str]):
+        stream = self.stream or sys.stdout
+        try:
+            stream.write("\n".join(lines) + "\n")
+            stream.flush()
+        except Exception:
+            pass
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if batch:
+                self._write([self._render(event_dict) for event_dict in batch])
+                self.shipped += len(batch)
+                self.batches += 1
+            elif self._closed:
+                return
+
+    def close(self, timeout: float = 5.0):
+        """Stops accepting queued events and waits for everything queued to be written"""
+        with self._changed:
+            self._closed = True
+            self._changed.notify_all()
+        self._thread.join(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"queued": len(self._queue), "shipped": self.shipped, "batches": self.batches, "dropped": dict(self.dropped), "render_errors": self.render_errors}
+
+
+def _capture_exc_info(logger, method_name: str, event_dict: Dict[str, Any]) -> Dict[str, Any]:
+    """The renderer runs on another thread, where `exc_info=True` would find no exception"""
+    if event_dict.get("exc_info") is True:
+        event_dict["exc_info"] = sys.exc_info()
+    return event_dict
+
+
+def _timestamp() -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime()) + "Z"
+
+
+_shipper: Optional[LogShipper] = None
+
+
+def configure_logging(environment: Environment, config: Optional[LogShippingConfig] = None):
     """
     Sets up the structlog processor pipeline
     """
+    global _shipper
+    config = config or LogShippingConfig()
     common_processors = [
         structlog.contextvars.merge_contextvars,
         structlog.processors.add_log_level,
@@ -29,17 +209,37 @@ def configure_logging(environment: Environment):
         structlog.processors.format_exc_info,
     ]
     if environment == environment.development:
-        structlog.configure(
-            processors=common_processors
-                       + [
-                           structlog.dev.set_exc_info,
-                           structlog.dev.ConsoleRenderer(),
-                       ]
-        )
+        common_processors += [structlog.dev.set_exc_info, _capture_exc_info]
+        renderer = structlog.dev.ConsoleRenderer()
     else:
-        structlog.configure(
-            processors=common_processors
-                       + [
-                           structlog.processors.JSONRenderer(),
-                       ]
-        )
+        renderer = structlog.processors.JSONRenderer()
+    background_processors = []
+    if config.large_field_mode in (LARGE_FIELD_TRUNCATE, LARGE_FIELD_HASH) and config.large_fields:
+        background_processors.append(LargeFieldLimiter(config.large_fields, config.large_field_mode, config.max_field_chars))
+
+    if not config.enabled:
+        structlog.configure(processors=common_processors + background_processors + [renderer])
+        return
+
+    def render(event_dict: Dict[str, Any]) -> str:
+        for processor in background_processors:
+            event_dict = processor(None, "", event_dict)
+        return renderer(None, "", event_dict)
+
+    if _shipper is not None:
+        _shipper.close()
+    _shipper = LogShipper(render, config)
+    structlog.configure(processors=common_processors + [_shipper])
+
+
+def shutdown_logging():
+    """Writes out everything still queued, later events are written synchronously"""
+    if _shipper is not None:
+        _shipper.close()
+
+
+def get_log_shipping_stats() -> Optional[Dict[str, Any]]:
+    return _shipper.stats() if _shipper is not None else None
+
+
+atexit.register(shutdown_logging)
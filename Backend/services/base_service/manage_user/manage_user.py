@@ -1,24 +1,61 @@
 from google.cloud import firestore
 from fastapi import HTTPException
 from uuid import uuid4
+from typing import List
+import argparse
 import time
 from firebase_admin import auth
-from manage_user.manage_user_model import Subscription, UserCreate, UserUpdate, UserResponse
+from common_code.common_exceptions import unauthorized_exception
+from common_code.blocking import FIREBASE_AUTH, FIRESTORE, run_blocking
+from common_code.rate_limit import invalidate_user_plan
+from common_code.single_flight import single_flight
+from manage_user.manage_user_model import AccountType, Subscription, SubscriptionPlan, SubscriptionStatus, UserCreate, UserUpdate, UserResponse, UserSearchResult
 
 db = firestore.Client()
 USERS_COLLECTION = "users"
+SEARCH_TOKEN_MAX_LENGTH = 20
+BACKFILL_PAGE_SIZE = 500
 
-async def create_new_user(user_create: UserCreate):
-    user_dict = user_create.dict(exclude={'password'})
-    user_id = str(uuid4())
-    user_dict["uuid"] = user_id
-    user_dict["search_name"] = f"{user_dict['first_name'].lower()} {user_dict['last_name'].lower()}".strip()
+def build_search_name(first_name: str, last_name: str) -> str:
+    return f"{first_name.lower()} {last_name.lower()}".strip()
+
+def build_search_tokens(first_name: str, last_name: str) -> List[str]:
+    """
+    Edge n-grams of each name word and of the full name in both orders, so an
+    `array_contains` query on any typed prefix ("jo", "smi", "john s") is one indexed read
+    """
+    words = build_search_name(first_name, last_name).split()
+    phrases = set(words)
+    if len(words) > 1:
+        phrases.add(" ".join(words))
+        phrases.add(" ".join(words[-1:] + words[:-1]))
+    tokens = set()
+    for phrase in phrases:
+        for end in range(1, min(len(phrase), SEARCH_TOKEN_MAX_LENGTH) + 1):
+            if not phrase[end - 1].isspace():
+                tokens.add(phrase[:end])
+    return sorted(tokens)
+
+def normalize_search_query(query: str) -> str:
+    return " ".join(query.lower().split())[:SEARCH_TOKEN_MAX_LENGTH].strip()
+
+def build_user_document(user_dict: dict) -> dict:
+    user_dict["uuid"] = str(uuid4())
+    user_dict["search_name"] = build_search_name(user_dict['first_name'], user_dict['last_name'])
+    user_dict["search_tokens"] = build_search_tokens(user_dict['first_name'], user_dict['last_name'])
     user_dict["created_at"] = user_dict["updated_at"] = int(time.time())
     user_dict["subscription"] = Subscription().dict()
+    return user_dict
+
+async def create_new_user(user_create: UserCreate):
+    user_dict = build_user_document(user_create.dict(exclude={'password'}))
+    user_id = user_dict["uuid"]
 
     try:
         # Create user in Firebase Authentication
-        firebase_user = auth.create_user(
+        firebase_user = await run_blocking(
+            FIREBASE_AUTH,
+            auth.create_user,
             email=user_dict['email'],
             password=user_create.password,
             display_name=f"{user_dict['first_name']} {user_dict['last_name']}"
@@ -27,16 +64,19 @@ async def create_new_user(user_create: UserCreate):
 
         # Create user in Firestore
         doc_ref = db.collection(USERS_COLLECTION).document(user_id)
-        doc_ref.set(user_dict)
+        await run_blocking(FIRESTORE, doc_ref.set, user_dict)
         
         print(f"User created with ID: {user_id}")
         return UserResponse(**user_dict)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to create user: {str(e)}")
 
+@single_flight
 async def get_existing_user(uid: str):
     user_ref = db.collection(USERS_COLLECTION).document(uid)
-    user_snapshot = user_ref.get()
+    user_snapshot = await run_blocking(FIRESTORE, user_ref.get)
     if user_snapshot.exists:
         return UserResponse(**user_snapshot.to_dict())
     raise HTTPException(status_code=404, detail="User not found")
@@ -49,24 +89,37 @@ async def update_existing_user(user_update: UserUpdate, uid: str):
     if "subscription" in update_data:
         update_data["subscription"] = Subscription(**update_data["subscription"]).dict()
 
-    user_ref.update(update_data)
+    if "first_name" in update_data or "last_name" in update_data:
+        current = (await run_blocking(FIRESTORE, user_ref.get)).to_dict() or {}
+        first_name = update_data.get("first_name", current.get("first_name") or "")
+        last_name = update_data.get("last_name", current.get("last_name") or "")
+        update_data["search_name"] = build_search_name(first_name, last_name)
+        update_data["search_tokens"] = build_search_tokens(first_name, last_name)
+
+    await run_blocking(FIRESTORE, user_ref.update, update_data)
+    get_existing_user.forget(uid)
+    if "subscription" in update_data:
+        invalidate_user_plan(uid)
     updated_user = await get_existing_user(uid)
     return updated_user
 
 async def delete_existing_user(uid: str):
     user_ref = db.collection(USERS_COLLECTION).document(uid)
-    user_data = user_ref.get().to_dict()
+    user_data = (await run_blocking(FIRESTORE, user_ref.get)).to_dict()
     
     if not user_data:
         raise HTTPException(status_code=404, detail="User not found")
 
     try:
         # Delete from Firebase Authentication
-        auth.delete_user(user_data.get('firebase_uid'))
+        await run_blocking(FIREBASE_AUTH, auth.delete_user, user_data.get('firebase_uid'))
         
         # Delete from Firestore
-        user_ref.delete()
+        await run_blocking(FIRESTORE, user_ref.delete)
+        get_existing_user.forget(uid)
         return {"message": "User deleted successfully"}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to delete user: {str(e)}")
 
@@ -74,18 +127,83 @@ async def check_user_exists(email: str) -> dict:
     try:
         email = email.lower().strip()
         try:
-            user = auth.get_user_by_email(email)
+            user = await run_blocking(FIREBASE_AUTH, auth.get_user_by_email, email)
             return {"exists": True, "user_id": user.uid}
         except auth.UserNotFoundError:
             return {"exists": False, "user_id": None}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error checking user existence: {str(e)}")
 
+def get_user_plan(uid: str) -> str:
+    """Plan the rate limiter sizes the user's bucket by; lapsed subscriptions fall back to free"""
+    user_snapshot = db.collection(USERS_COLLECTION).document(uid).get()
+    subscription = (user_snapshot.to_dict() or {}).get("subscription") if user_snapshot.exists else None
+    if not subscription or subscription.get("status") in (SubscriptionStatus.CANCELED.value, SubscriptionStatus.EXPIRED.value):
+        return SubscriptionPlan.FREE.value
+    return subscription.get("plan", SubscriptionPlan.FREE.value)
+
+async def get_search_organization(uid: str) -> str:
+    """Organization whose members the caller may search: their own, or the one they belong to"""
+    caller = await get_existing_user(uid)
+    if caller.organization_id:
+        return caller.organization_id
+    if caller.account_type == AccountType.ORGANIZATION:
+        return caller.uid
+    raise unauthorized_exception
+
+async def search_users(query: str, organization_id: str, limit: int = 20) -> List[UserSearchResult]:
+    token = normalize_search_query(query)
+    if not token:
+        return []
+    users_ref = db.collection(USERS_COLLECTION)
+    # No order_by, so a composite index on (organization_id, search_tokens) serves the query
+    query = users_ref.where("organization_id", "==", organization_id).where("search_tokens", "array_contains", token).limit(limit)
+    results = await run_blocking(FIRESTORE, query.get)
+    users = [UserSearchResult(**user_doc.to_dict()) for user_doc in results]
+    return sorted(users, key=lambda user: user.search_name)
+
+def backfill_search_tokens() -> int:
+    """Writes `search_name` / `search_tokens` for users created before the tokens existed"""
+    users_ref = db.collection(USERS_COLLECTION)
+    updated = 0
+    last_doc = None
+    while True:
+        query = users_ref.order_by("__name__").limit(BACKFILL_PAGE_SIZE)
+        if last_doc is not None:
+            query = query.start_after(last_doc)
+        page = list(query.stream())
+        if not page:
+            break
+        batch = db.batch()
+        pending = 0
+        for user_doc in page:
+            user_data = user_doc.to_dict()
+            first_name, last_name = user_data.get("first_name") or "", user_data.get("last_name") or ""
+            tokens = build_search_tokens(first_name, last_name)
+            if user_data.get("search_tokens") == tokens:
+                continue
+            batch.update(user_doc.reference, {"search_name": build_search_name(first_name, last_name), "search_tokens": tokens})
+            pending += 1
+        if pending:
+            batch.commit()
+            updated += pending
+        last_doc = page[-1]
+    return updated
+
 # Helper functions
 async def get_user_by_email(email: str):
     users_ref = db.collection(USERS_COLLECTION)
     query = users_ref.where("email", "==", email).limit(1)
-    results = query.stream()
+    results = await run_blocking(FIRESTORE, query.get)
     for user_doc in results:
         return UserResponse(**user_doc.to_dict())
-    return None
\ No newline at end of file
+    return None
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="User search token maintenance")
+    parser.add_argument("--backfill", action="store_true", help="write search tokens for existing users")
+    args = parser.parse_args()
+    if args.backfill:
+        print({"updated": backfill_search_tokens()})
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr, Field, validator
-from typing import Optional
+from typing import Any, Dict, List, Optional
 from datetime import datetime
 from enum import Enum
 import time
@@ -40,6 +40,12 @@ class UserCreate(UserBase):
     organization_name: Optional[str] = Field(None, description="Organization name if account_type is ORGANIZATION")
     password: str = Field(..., min_length=8, description="User's password")
 
+class ProvisionedUser(UserBase):
+    password: Optional[str] = Field(None, min_length=8, description="Initial password; without one the user signs in through a password reset")
+
+class BulkProvisionRequest(BaseModel):
+    users: List[Dict[str, Any]] = Field(..., min_items=1, description="Rows to provision; every row is validated on its own and failures are reported per row")
+
 class UserUpdate(BaseModel):
     first_name: Optional[str] = Field(None, description="User's first name")
     last_name: Optional[str] = Field(None, description="User's last name")
@@ -55,11 +61,19 @@ class UserResponse(UserBase):
     photo_url: Optional[str] = Field(None, description="User's photo URL")
     account_type: AccountType = AccountType.INDIVIDUAL
     organization_name: Optional[str] = Field(None, description="Organization name if account_type is ORGANIZATION")
+    organization_id: Optional[str] = Field(None, description="UID of the organization account that provisioned this user")
     search_name: str = Field(..., description="Searchable full name (lowercase)")
     created_at: int = Field(default_factory=lambda: int(time.time()), description="Unix timestamp of user creation")
     updated_at: Optional[int] = Field(None, description="Unix timestamp of last user update")
     subscription: Subscription = Field(default_factory=Subscription, description="User's subscription details")
 
+class UserSearchResult(BaseModel):
+    uid: str = Field(..., description="Firebase UID")
+    first_name: str = Field(..., description="User's first name")
+    last_name: str = Field(..., description="User's last name")
+    photo_url: Optional[str] = Field(None, description="User's photo URL")
+    search_name: str = Field(..., description="Searchable full name (lowercase)")
+
 class CheckUserExistsRequest(BaseModel):
     email: EmailStr
 
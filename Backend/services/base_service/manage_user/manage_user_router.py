@@ -1,22 +1,40 @@
-from fastapi import APIRouter, Depends, HTTPException, Body
+from fastapi import APIRouter, Depends, HTTPException, Body, Query
+from fastapi.responses import StreamingResponse
+from typing import List
+from common_code.fast_response import ValidatedModelRoute
 from pydantic import EmailStr
 from get_user import get_current_user
 from common_code.common_exceptions import incorrect_auth_cred_exception
-from manage_user.manage_user import create_new_user, get_existing_user, update_existing_user, delete_existing_user, check_user_exists
-from manage_user.manage_user_model import UserCreate, UserUpdate, UserResponse, UserExistsResponse, CheckUserExistsRequest
+from manage_user.manage_user import create_new_user, get_existing_user, update_existing_user, delete_existing_user, check_user_exists, get_search_organization, search_users
+from manage_user.manage_user_model import UserCreate, UserUpdate, UserResponse, UserExistsResponse, UserSearchResult, CheckUserExistsRequest, BulkProvisionRequest
+from manage_user.provisioning import encode_events, get_provisioning_organization, provision_users
 
-router = APIRouter()
+router = APIRouter(route_class=ValidatedModelRoute)
 
 @router.post("/users", response_model=UserResponse, response_model_exclude_none=True, summary="Create a new user")
 async def create_user_route(user: UserCreate):
     return await create_new_user(user)
 
+@router.post("/users/bulk", summary="Provision the members of an organization in bulk")
+async def bulk_provision_users_route(request: BulkProvisionRequest, uid: str = Depends(get_current_user)):
+    if not uid:
+        raise incorrect_auth_cred_exception
+    organization = await get_provisioning_organization(uid, len(request.users))
+    return StreamingResponse(encode_events(provision_users(organization, request.users)), media_type="application/x-ndjson")
+
 @router.get("/users/me", response_model=UserResponse, response_model_exclude_none=True, summary="Get details of the current user")
 async def get_me_route(uid: str = Depends(get_current_user)):
     if not uid:
         raise incorrect_auth_cred_exception
     return await get_existing_user(uid)
 
+@router.get("/users/search", response_model=List[UserSearchResult], response_model_exclude_none=True, summary="Search the members of your organization by name prefix")
+async def search_users_route(q: str = Query(..., min_length=1), limit: int = Query(20, ge=1, le=100), uid: str = Depends(get_current_user)):
+    if not uid:
+        raise incorrect_auth_cred_exception
+    organization_id = await get_search_organization(uid)
+    return await search_users(q, organization_id, limit)
+
 @router.get("/users/{user_id}", response_model=UserResponse, response_model_exclude_none=True, summary="Get user details by ID")
 async def get_user_by_id_route(user_id: str, uid: str = Depends(get_current_user)):
     if not uid:
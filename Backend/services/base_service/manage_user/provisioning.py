@@ -0,0 +1,226 @@
+"""
+Bulk provisioning of the members of an organization account. Members are individual accounts
+linked to the organization through `organization_id`, so only the organization account itself
+can provision more of them. Their user documents are keyed by their Auth uid.
+
+Rows are validated one by one, then handled in batches of `auth_batch_size`:
+
+1. emails that already have an account are looked up with `auth.get_users` (100 per call),
+2. the remaining rows become Auth accounts through one `auth.import_users` call, with passwords
+   hashed here as PBKDF2-SHA256,
+3. their user documents are written with Firestore batches of `write_batch_size`. When a commit
+   fails the Auth accounts of that batch are deleted again, so every row ends up either fully
+   provisioned or reported as failed.
+
+Progress is streamed as NDJSON, one event per line:
+
+    {"event": "row_error", "row": 3, "email": "a@example.com", "error": "email already has an account"}
+    {"event": "progress", "processed": 1000, "total": 5000, "created": 998, "failed": 2}
+    {"event": "summary", "total": 5000, "created": 4990, "failed": 10, "duration_ms": 5210.4}
+
+A batch that has started runs to completion even if the client goes away.
+"""
+import asyncio
+import hashlib
+import os
+import time
+from typing import Any, AsyncIterator, Dict, List, NamedTuple, Optional, Set, Tuple
+from uuid import uuid4
+
+from fastapi import HTTPException, status
+from firebase_admin import auth
+from pydantic import ValidationError
+
+from common_code.blocking import FIREBASE_AUTH, FIRESTORE, run_blocking
+from common_code.common_exceptions import unauthorized_exception
+from common_code.fast_response import dumps
+from config import UserProvisioningConfig, get_user_provisioning_config
+from logconfig import get_logger
+from manage_user.manage_user import USERS_COLLECTION, build_user_document, db, get_existing_user
+from manage_user.manage_user_model import AccountType, ProvisionedUser, UserResponse
+
+logger = get_logger()
+
+# CPU bound and releases the GIL, so hashing is spread over a few pool threads
+PASSWORD_HASH = "password_hash"
+PASSWORD_HASH_CHUNK = 100
+GET_USERS_LIMIT = 100
+
+
+class PendingUser(NamedTuple):
+    row: int
+    user: ProvisionedUser
+    uid: str
+
+
+def _row_error(row: int, email: Optional[str], error: str) -> Dict[str, Any]:
+    return {"event": "row_error", "row": row, "email": email, "error": error}
+
+
+def _validation_message(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(part) for part in item['loc'])}: {item['msg']}" for item in error.errors())
+
+
+def validate_rows(rows: List[Dict[str, Any]]) -> Tuple[List[PendingUser], List[Dict[str, Any]]]:
+    pending, errors, seen = [], [], set()
+    for row, data in enumerate(rows):
+        email = data.get("email") if isinstance(data, dict) else None
+        try:
+            user = ProvisionedUser.parse_obj(data)
+        except ValidationError as e:
+            errors.append(_row_error(row, email, _validation_message(e)))
+            continue
+        user = user.copy(update={"email": user.email.lower().strip()})
+        if user.email in seen:
+            errors.append(_row_error(row, user.email, "duplicate email in this import"))
+            continue
+        seen.add(user.email)
+        pending.append(PendingUser(row, user, uuid4().hex))
+    return pending, errors
+
+
+async def get_provisioning_organization(uid: str, row_count: int, config: Optional[UserProvisioningConfig] = None) -> UserResponse:
+    config = config or get_user_provisioning_config()
+    if row_count > config.max_rows:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=f"At most {config.max_rows} users can be provisioned per request")
+    caller = await get_existing_user(uid)
+    if caller.account_type != AccountType.ORGANIZATION or caller.organization_id:
+        raise unauthorized_exception
+    return caller
+
+
+def _hash_passwords(passwords: List[str], rounds: int) -> List[Tuple[bytes, bytes]]:
+    hashed = []
+    for password in passwords:
+        salt = os.urandom(16)
+        hashed.append((hashlib.pbkdf2_hmac("sha256", password.encode(), salt, rounds), salt))
+    return hashed
+
+
+async def _hash_batch(batch: List[PendingUser], rounds: int) -> Dict[int, Tuple[bytes, bytes]]:
+    with_password = [pending for pending in batch if pending.user.password]
+    chunks = [with_password[start:start + PASSWORD_HASH_CHUNK] for start in range(0, len(with_password), PASSWORD_HASH_CHUNK)]
+    hashed = await asyncio.gather(*(run_blocking(PASSWORD_HASH, _hash_passwords, [pending.user.password for pending in chunk], rounds) for chunk in chunks))
+    return {pending.row: value for chunk, values in zip(chunks, hashed) for pending, value in zip(chunk, values)}
+
+
+async def _existing_emails(emails: List[str]) -> Set[str]:
+    chunks = [emails[start:start + GET_USERS_LIMIT] for start in range(0, len(emails), GET_USERS_LIMIT)]
+    results = await asyncio.gather(*(run_blocking(FIREBASE_AUTH, auth.get_users, [auth.EmailIdentifier(email) for email in chunk]) for chunk in chunks))
+    return {user.email.lower() for result in results for user in result.users if user.email}
+
+
+def _import_accounts(batch: List[PendingUser], hashes: Dict[int, Tuple[bytes, bytes]], rounds: int) -> Tuple[List[PendingUser], Dict[int, str]]:
+    records, candidates, failures = [], [], {}
+    for pending in batch:
+        user = pending.user
+        password_hash, password_salt = hashes.get(pending.row, (None, None))
+        try:
+            records.append(auth.ImportUserRecord(
+                pending.uid,
+                email=user.email,
+                display_name=f"{user.first_name} {user.last_name}",
+                phone_number=user.phone_number,
+                password_hash=password_hash,
+                password_salt=password_salt,
+            ))
+        except ValueError as e:
+            failures[pending.row] = str(e)
+            continue
+        candidates.append(pending)
+    if not records:
+        return [], failures
+    result = auth.import_users(records, hash_alg=auth.UserImportHash.pbkdf2_sha256(rounds))
+    rejected = {error.index: error.reason for error in result.errors}
+    for index, pending in enumerate(candidates):
+        if index in rejected:
+            failures[pending.row] = rejected[index]
+    return [pending for index, pending in enumerate(candidates) if index not in rejected], failures
+
+
+def _user_document(pending: PendingUser, organization: UserResponse) -> Dict[str, Any]:
+    user_dict = pending.user.dict(exclude={"password"})
+    user_dict["uid"] = pending.uid
+    user_dict["account_type"] = AccountType.INDIVIDUAL.value
+    user_dict["organization_name"] = organization.organization_name
+    user_dict["organization_id"] = organization.uid
+    document = build_user_document(user_dict)
+    # The uid is chosen here, so the document can be keyed by it like every lookup by uid expects
+    document["uuid"] = pending.uid
+    return document
+
+
+async def _write_documents(created: List[PendingUser], organization: UserResponse, batch_size: int) -> Dict[int, str]:
+    async def commit(chunk: List[PendingUser]) -> Dict[int, str]:
+        batch = db.batch()
+        users_ref = db.collection(USERS_COLLECTION)
+        for pending in chunk:
+            batch.set(users_ref.document(pending.uid), _user_document(pending, organization))
+        try:
+            await run_blocking(FIRESTORE, batch.commit)
+            return {}
+        except Exception as e:
+            logger.warning("Provisioned user write failed, removing the accounts", users=len(chunk), error=str(e))
+            try:
+                await run_blocking(FIREBASE_AUTH, auth.delete_users, [pending.uid for pending in chunk])
+            except Exception as cleanup_error:
+                logger.error("Could not remove provisioned accounts", uids=[pending.uid for pending in chunk], error=str(cleanup_error))
+            return {pending.row: f"Failed to write user: {e}" for pending in chunk}
+
+    chunks = [created[start:start + batch_size] for start in range(0, len(created), batch_size)]
+    failures: Dict[int, str] = {}
+    for chunk_failures in await asyncio.gather(*(commit(chunk) for chunk in chunks)):
+        failures.update(chunk_failures)
+    return failures
+
+
+async def _provision_batch(batch: List[PendingUser], organization: UserResponse, config: UserProvisioningConfig) -> Tuple[int, List[Dict[str, Any]]]:
+    existing = await _existing_emails([pending.user.email for pending in batch])
+    errors = [_row_error(pending.row, pending.user.email, "email already has an account") for pending in batch if pending.user.email in existing]
+    batch = [pending for pending in batch if pending.user.email not in existing]
+    if not batch:
+        return 0, errors
+
+    hashes = await _hash_batch(batch, config.password_hash_rounds)
+    try:
+        created, failures = await run_blocking(FIREBASE_AUTH, _import_accounts, batch, hashes, config.password_hash_rounds)
+    except Exception as e:
+        # A timed out import may still complete, the error says so through its detail
+        created, failures = [], {pending.row: f"Failed to create account: {getattr(e, 'detail', e)}" for pending in batch}
+    failures.update(await _write_documents(created, organization, config.write_batch_size))
+
+    emails = {pending.row: pending.user.email for pending in batch}
+    errors.extend(_row_error(row, emails[row], reason) for row, reason in sorted(failures.items()))
+    return len(created) - sum(1 for pending in created if pending.row in failures), errors
+
+
+async def provision_users(organization: UserResponse, rows: List[Dict[str, Any]], config: Optional[UserProvisioningConfig] = None) -> AsyncIterator[Dict[str, Any]]:
+    config = config or get_user_provisioning_config()
+    started = time.perf_counter()
+    total = len(rows)
+    pending, errors = validate_rows(rows)
+    processed = total - len(pending)
+    created, failed = 0, len(errors)
+    for error in errors:
+        yield error
+
+    batch_size = max(1, min(config.auth_batch_size, 1000))
+    for start in range(0, len(pending), batch_size):
+        batch = pending[start:start + batch_size]
+        # Shielded, so a client going away never leaves accounts without their user documents
+        batch_created, batch_errors = await asyncio.shield(asyncio.ensure_future(_provision_batch(batch, organization, config)))
+        created += batch_created
+        failed += len(batch_errors)
+        processed += len(batch)
+        for error in batch_errors:
+            yield error
+        yield {"event": "progress", "processed": processed, "total": total, "created": created, "failed": failed}
+
+    duration_ms = round((time.perf_counter() - started) * 1000, 2)
+    logger.info("Provisioned users", organization_uid=organization.uid, total=total, created=created, failed=failed, duration_ms=duration_ms)
+    yield {"event": "summary", "total": total, "created": created, "failed": failed, "duration_ms": duration_ms}
+
+
+async def encode_events(events: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[bytes]:
+    async for event in events:
+        yield dumps(event) + b"\n"
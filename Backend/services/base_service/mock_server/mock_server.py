@@ -0,0 +1,270 @@
+"""
+Mock server generated from a project's stored endpoints.
+
+`RouteTable` compiles the endpoints once into a segment trie (static segments before
+`{param}` segments, backtracking when a static branch dead-ends) and pre-renders one example body
+per documented response: the schema's `example`, `examples` or `default` (also per property)
+where the spec has one, otherwise a value generated from the schema with a fixed seed. Responses
+whose schema cannot be satisfied that way are served without a body. Serving a request is a trie walk and a dict lookup, and the
+body bytes are reused for every request.
+
+Latency and errors are injected from `MockServerConfig` and can be overridden per request:
+
+    X-Mock-Latency-Ms: 250     added delay, on top of up to MOCK_JITTER_MS random jitter
+    X-Mock-Error-Rate: 0.1     share of requests answered with MOCK_ERROR_STATUS
+    X-Mock-Status: 404         serve the example of another documented response
+
+Projects are served at `/projects/{project_id}/mock/...`. `MockServer` is the same table as a
+bare ASGI app, for an in-process target (`httpx.ASGITransport(app=MockServer(table))`) or a
+local stand-alone server:
+
+    python -m mock_server.mock_server <project_id> --port 8081
+"""
+import argparse
+import asyncio
+import math
+import random
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Mapping, NamedTuple, Optional, Tuple
+
+from cachetools import LRUCache
+
+from common_code.fast_response import dumps
+from config import MockServerConfig, get_mock_server_config
+from test_runner.payload_generator import SchemaNotGeneratable, schema_example
+
+MOCK_METHODS = ["GET", "POST", "PUT", "PATCH", "DELETE", "HEAD", "OPTIONS"]
+
+_JSON_HEADERS = [(b"content-type", b"application/json")]
+
+
+class MockResponse(NamedTuple):
+    status: int
+    body: bytes
+    delay: float
+
+
+class MockRoute(NamedTuple):
+    endpoint_id: str
+    method: str
+    template: str
+    default_status: int
+    bodies: Dict[int, bytes]
+
+
+class _Node:
+
+    __slots__ = ("static", "param", "param_name", "routes")
+
+    def __init__(self):
+        self.static: Dict[str, "_Node"] = {}
+        self.param: Optional["_Node"] = None
+        self.param_name: Optional[str] = None
+        self.routes: Dict[str, MockRoute] = {}
+
+
+def _segments(path: str) -> List[str]:
+    return [segment for segment in path.split("/") if segment]
+
+
+def _param_name(segment: str) -> Optional[str]:
+    if len(segment) > 2 and segment[0] == "{" and segment[-1] == "}":
+        return segment[1:-1]
+    return None
+
+
+def _example(spec: Optional[Dict[str, Any]], seed: int) -> Any:
+    schema = (spec or {}).get("content")
+    if not isinstance(schema, dict):
+        return None
+    try:
+        return schema_example(schema, random.Random(seed))
+    except SchemaNotGeneratable:
+        return None
+
+
+def _status_code(code: str) -> Optional[int]:
+    try:
+        return int(code)
+    except (TypeError, ValueError):
+        # "default" and ranges like "2XX" have no concrete status to serve
+        return None
+
+
+def compile_route(endpoint: Dict[str, Any], seed: int = 0) -> MockRoute:
+    responses = endpoint.get("responses") or {}
+    bodies = {}
+    for code, spec in responses.items():
+        status = _status_code(code)
+        if status is not None:
+            example = _example(spec, seed)
+            bodies[status] = b"" if example is None or status in (204, 304) else dumps(example)
+    successes = sorted(status for status in bodies if 200 <= status < 300)
+    default_status = successes[0] if successes else 200
+    bodies.setdefault(default_status, b"")
+    return MockRoute(endpoint.get("id", ""), endpoint["method"].upper(), endpoint["path"], default_status, bodies)
+
+
+class RouteTable:
+    """
+    Compiled routes of one project, immutable once built and shared between requests.
+    """
+
+    def __init__(self, endpoints: Iterable[Dict[str, Any]], version: Any = None, seed: int = 0, config: Optional[MockServerConfig] = None):
+        self.version = version
+        self.config = config or get_mock_server_config()
+        self.size = 0
+        self._root = _Node()
+        for endpoint in endpoints:
+            self.add(compile_route(endpoint, seed))
+
+    def add(self, route: MockRoute):
+        node = self._root
+        for segment in _segments(route.template):
+            name = _param_name(segment)
+            if name is None:
+                node = node.static.setdefault(segment, _Node())
+            else:
+                if node.param is None:
+                    node.param = _Node()
+                    node.param_name = name
+                node = node.param
+        if route.method not in node.routes:
+            self.size += 1
+        node.routes[route.method] = route
+
+    def match(self, method: str, path: str) -> Tuple[Optional[MockRoute], Dict[str, str], bool]:
+        """(route, path params, whether the path exists for any method)"""
+        params: Dict[str, str] = {}
+        node = self._walk(self._root, _segments(path), 0, params)
+        if node is None:
+            return None, {}, False
+        route = node.routes.get(method) or (node.routes.get("GET") if method == "HEAD" else None)
+        return route, params, True
+
+    def _walk(self, node: _Node, segments: List[str], index: int, params: Dict[str, str]) -> Optional[_Node]:
+        if index == len(segments):
+            return node if node.routes else None
+        segment = segments[index]
+        child = node.static.get(segment)
+        if child is not None:
+            found = self._walk(child, segments, index + 1, params)
+            if found is not None:
+                return found
+        if node.param is not None:
+            found = self._walk(node.param, segments, index + 1, params)
+            if found is not None:
+                params[node.param_name] = segment
+                return found
+        return None
+
+    def resolve(self, method: str, path: str, headers: Mapping[str, str], rng: Optional[random.Random] = None) -> MockResponse:
+        config = self.config
+        rng = rng or random
+        route, _, path_exists = self.match(method.upper(), path)
+        if route is None:
+            status = 405 if path_exists else 404
+            return MockResponse(status, dumps({"error": "Method not allowed" if path_exists else "No mocked endpoint matches the path"}), 0.0)
+
+        latency = _header_float(headers, "x-mock-latency-ms", config.latency_ms)
+        delay = min(max(0.0, latency + rng.random() * config.jitter_ms), config.max_latency_ms) / 1000
+        if rng.random() < _header_float(headers, "x-mock-error-rate", config.error_rate):
+            return MockResponse(config.error_status, dumps({"error": "Injected mock error"}), delay)
+
+        status = _header_int(headers, "x-mock-status", route.default_status)
+        if not 100 <= status <= 599:
+            status = route.default_status
+        body = route.bodies.get(status)
+        if body is None:
+            return MockResponse(status, b"", delay)
+        return MockResponse(status, b"" if method.upper() == "HEAD" else body, delay)
+
+
+def _header_float(headers: Mapping[str, str], name: str, default: float) -> float:
+    value = headers.get(name)
+    if value is None:
+        return default
+    try:
+        parsed = float(value)
+    except ValueError:
+        return default
+    return parsed if math.isfinite(parsed) else default
+
+
+def _header_int(headers: Mapping[str, str], name: str, default: int) -> int:
+    value = headers.get(name)
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except (ValueError, OverflowError):
+        return default
+
+
+class MockServer:
+    """
+    Bare ASGI app serving one route table.
+    """
+
+    def __init__(self, table: RouteTable):
+        self.table = table
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        headers = {name.decode("latin-1"): value.decode("latin-1") for name, value in scope["headers"]}
+        response = self.table.resolve(scope["method"], scope["path"], headers)
+        if response.delay:
+            await asyncio.sleep(response.delay)
+        await send({"type": "http.response.start", "status": response.status, "headers": _JSON_HEADERS if response.body else []})
+        await send({"type": "http.response.body", "body": response.body})
+
+
+class CachedTable(NamedTuple):
+    owner_id: str
+    table: RouteTable
+    checked_at: float
+
+
+_tables = LRUCache(maxsize=get_mock_server_config().cache_size)
+_tables_lock = threading.Lock()
+
+
+def get_cached_table(project_id: str) -> Optional[CachedTable]:
+    with _tables_lock:
+        return _tables.get(project_id)
+
+
+def store_table(project_id: str, owner_id: str, table: RouteTable) -> CachedTable:
+    entry = CachedTable(owner_id, table, time.monotonic())
+    with _tables_lock:
+        _tables[project_id] = entry
+    return entry
+
+
+def invalidate_mock_table(project_id: str):
+    with _tables_lock:
+        _tables.pop(project_id, None)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a project's endpoints as a local mock server")
+    parser.add_argument("project_id")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    args = parser.parse_args()
+
+    import uvicorn
+    from projects.projects import list_project_endpoints
+
+    endpoints = list_project_endpoints(args.project_id)
+    table = RouteTable(endpoints, seed=get_mock_server_config().seed)
+    print({"project_id": args.project_id, "routes": table.size})
+    uvicorn.run(MockServer(table), host=args.host, port=args.port, log_level="warning")
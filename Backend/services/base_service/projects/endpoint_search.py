@@ -0,0 +1,164 @@
+"""
+In-memory endpoint search within a project.
+
+Each project gets an inverted index over path segments, tag, method, description words and
+parameter names. Indexes are built lazily on the first search, kept in a byte-bounded LRU and
+tagged with the project version they were built from, so a schema import (which bumps the
+version) makes the next search rebuild. Queries are answered entirely from memory.
+"""
+import bisect
+import math
+import re
+import sys
+import threading
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from cachetools import LRUCache
+
+from config import get_endpoint_search_config
+
+FIELD_WEIGHTS = {
+    "path": 3.0,
+    "param": 2.0,
+    "tag": 2.0,
+    "method": 1.5,
+    "description": 1.0,
+}
+PREFIX_MATCH_FACTOR = 0.6
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_CAMEL_RE = re.compile(r"(?<=[a-z0-9])(?=[A-Z])")
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    if not text:
+        return []
+    return _TOKEN_RE.findall(_CAMEL_RE.sub(" ", text).lower())
+
+
+def _endpoint_fields(endpoint: Dict[str, Any]) -> Iterable[Tuple[str, str]]:
+    for token in tokenize(endpoint.get("path")):
+        yield "path", token
+    for token in tokenize(endpoint.get("tag")):
+        yield "tag", token
+    for token in tokenize(endpoint.get("method")):
+        yield "method", token
+    for token in tokenize(endpoint.get("description")):
+        yield "description", token
+    for param in endpoint.get("parameters") or []:
+        for token in tokenize(param.get("name")):
+            yield "param", token
+
+
+class EndpointIndex:
+
+    def __init__(self, version: Any, endpoints: List[Dict[str, Any]]):
+        self.version = version
+        self.documents = [
+            {
+                "id": endpoint["id"],
+                "path": endpoint.get("path", ""),
+                "method": endpoint.get("method", ""),
+                "tag": endpoint.get("tag"),
+                "description": endpoint.get("description"),
+            }
+            for endpoint in endpoints
+        ]
+        postings: Dict[str, Dict[int, float]] = defaultdict(dict)
+        for doc_index, endpoint in enumerate(endpoints):
+            for field, token in _endpoint_fields(endpoint):
+                weights = postings[token]
+                weights[doc_index] = max(weights.get(doc_index, 0.0), FIELD_WEIGHTS[field])
+        doc_count = max(len(endpoints), 1)
+        # Pre-multiply field weights by IDF so scoring a query is only additions
+        self.postings = {
+            term: {doc: weight * (1 + math.log(doc_count / len(docs))) for doc, weight in docs.items()}
+            for term, docs in postings.items()
+        }
+        self.terms = sorted(self.postings)
+        self.size_bytes = self._estimate_size()
+
+    def _estimate_size(self) -> int:
+        size = sys.getsizeof(self.postings) + sys.getsizeof(self.terms)
+        for term, docs in self.postings.items():
+            # term string (in dict and sorted list) + posting dict with int keys and float values
+            size += 2 * sys.getsizeof(term) + sys.getsizeof(docs) + len(docs) * 56
+        for document in self.documents:
+            size += sys.getsizeof(document) + sum(sys.getsizeof(value) for value in document.values() if value)
+        return size
+
+    def _prefix_terms(self, prefix: str) -> List[str]:
+        start = bisect.bisect_left(self.terms, prefix)
+        matches = []
+        for term in self.terms[start:]:
+            if not term.startswith(prefix):
+                break
+            matches.append(term)
+        return matches
+
+    def search(self, query: str, method: Optional[str] = None, tag: Optional[str] = None, limit: int = 20) -> Tuple[int, List[Dict[str, Any]]]:
+        tokens = tokenize(query)
+        scores: Dict[int, float] = defaultdict(float)
+        if tokens:
+            matched_docs = None
+            for position, token in enumerate(tokens):
+                token_scores: Dict[int, float] = {}
+                for doc, weight in self.postings.get(token, {}).items():
+                    token_scores[doc] = weight
+                # The last token is treated as a prefix for type-ahead
+                if position == len(tokens) - 1:
+                    for term in self._prefix_terms(token):
+                        if term == token:
+                            continue
+                        for doc, weight in self.postings[term].items():
+                            token_scores[doc] = max(token_scores.get(doc, 0.0), weight * PREFIX_MATCH_FACTOR)
+                # Every query token has to match
+                docs = set(token_scores)
+                matched_docs = docs if matched_docs is None else matched_docs & docs
+                for doc, weight in token_scores.items():
+                    scores[doc] += weight
+            candidates = matched_docs or set()
+        else:
+            candidates = set(range(len(self.documents)))
+
+        method = method.upper() if method else None
+        tag = tag.lower() if tag else None
+        hits = [
+            doc for doc in candidates
+            if (method is None or self.documents[doc]["method"] == method)
+            and (tag is None or (self.documents[doc]["tag"] or "").lower() == tag)
+        ]
+        hits.sort(key=lambda doc: (-scores.get(doc, 0.0), self.documents[doc]["path"], self.documents[doc]["method"]))
+        return len(hits), [{**self.documents[doc], "score": round(scores.get(doc, 0.0), 4)} for doc in hits[:limit]]
+
+
+_indexes = LRUCache(maxsize=get_endpoint_search_config().cache_bytes, getsizeof=lambda index: index.size_bytes)
+_indexes_lock = threading.Lock()
+
+
+def get_cached_index(project_id: str, version: Any) -> Optional[EndpointIndex]:
+    with _indexes_lock:
+        index = _indexes.get(project_id)
+    if index is not None and index.version == version:
+        return index
+    return None
+
+
+def store_index(project_id: str, index: EndpointIndex):
+    with _indexes_lock:
+        try:
+            _indexes[project_id] = index
+        except ValueError:
+            # Larger than the whole cache; serve it this once without caching
+            pass
+
+
+def invalidate_endpoint_index(project_id: str):
+    with _indexes_lock:
+        _indexes.pop(project_id, None)
+
+
+def endpoint_index_stats() -> Dict[str, int]:
+    with _indexes_lock:
+        return {"projects": len(_indexes), "bytes": int(_indexes.currsize), "max_bytes": int(_indexes.maxsize)}
@@ -0,0 +1,144 @@
+"""
+Where a project's endpoints, tests and test runs are stored.
+
+Current layout, nested under the project document:
+
+    projects/{project_id}/endpoints/{endpoint_id}
+    projects/{project_id}/tests/{test_id}
+    projects/{project_id}/test_runs/{run_id}/results/{result_id}
+
+Legacy layout: the top-level `endpoints`, `test_results` (tests) and `test_runs` collections,
+filtered by `project_id`. Nested documents keep their `project_id` field, so collection group
+queries over both layouts still work.
+
+Writes only go to the nested layout. While `PROJECT_LAYOUT_DUAL_READ` is on (the cutover,
+until `projects.migrate_layout` has copied every project), reads also look at the legacy
+collections and return the legacy documents that have no nested copy yet. A write that changes
+part of a legacy-only document promotes it first, so no legacy data is left behind by a partial
+update.
+"""
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from config import ProjectLayoutConfig, get_project_layout_config
+
+PROJECTS = "projects"
+ENDPOINTS = "endpoints"
+TESTS = "tests"
+TEST_RUNS = "test_runs"
+RESULTS = "results"
+
+LEGACY_COLLECTIONS = {ENDPOINTS: "endpoints", TESTS: "test_results", TEST_RUNS: "test_runs"}
+
+# google.rpc.Code of a create that found the document already there
+_ALREADY_EXISTS = 6
+
+# Set on a project document once `migrate_layout` has copied all of its documents
+LAYOUT_FIELD = "layout"
+LAYOUT_NESTED = "nested"
+
+_config: Optional[ProjectLayoutConfig] = None
+
+
+def get_layout_config() -> ProjectLayoutConfig:
+    global _config
+    if _config is None:
+        _config = get_project_layout_config()
+    return _config
+
+
+def dual_read() -> bool:
+    return get_layout_config().dual_read
+
+
+def project_collection(db, project_id: str, kind: str):
+    return db.collection(PROJECTS).document(project_id).collection(kind)
+
+
+def legacy_collection(db, kind: str):
+    return db.collection(LEGACY_COLLECTIONS[kind])
+
+
+def collection_paths(project_id: str, kind: str) -> List[str]:
+    """Collection paths to look documents up in, in order of precedence"""
+    paths = [f"{PROJECTS}/{project_id}/{kind}"]
+    if dual_read():
+        paths.append(LEGACY_COLLECTIONS[kind])
+    return paths
+
+
+def _merge(nested: Iterable, legacy: Iterable) -> List:
+    snapshots = list(nested)
+    seen = {snapshot.id for snapshot in snapshots}
+    snapshots.extend(snapshot for snapshot in legacy if snapshot.id not in seen)
+    return snapshots
+
+
+def query_documents(db, project_id: str, kind: str, refine: Callable = lambda query: query) -> List:
+    """
+    Runs `refine(query)` over the project's documents of one kind, nested first, plus the legacy
+    documents without a nested copy during the cutover. Ordering and limits hold per layout
+    only, so callers that order or limit merge the results themselves.
+    """
+    nested = refine(project_collection(db, project_id, kind)).stream()
+    if not dual_read():
+        return list(nested)
+    return _merge(nested, refine(legacy_collection(db, kind).where("project_id", "==", project_id)).stream())
+
+
+def get_documents(db, project_id: str, kind: str, document_ids: List[str]) -> Dict[str, object]:
+    """Existing documents by id, one `get_all` per layout"""
+    if not document_ids:
+        return {}
+    collection = project_collection(db, project_id, kind)
+    found = {snapshot.id: snapshot for snapshot in db.get_all([collection.document(document_id) for document_id in document_ids]) if snapshot.exists}
+    missing = [document_id for document_id in document_ids if document_id not in found]
+    if missing and dual_read():
+        legacy = legacy_collection(db, kind)
+        for snapshot in db.get_all([legacy.document(document_id) for document_id in missing]):
+            if snapshot.exists and snapshot.get("project_id") == project_id:
+                found[snapshot.id] = snapshot
+    return found
+
+
+def get_document(db, project_id: str, kind: str, document_id: str):
+    return get_documents(db, project_id, kind, [document_id]).get(document_id)
+
+
+def is_nested(snapshot) -> bool:
+    return snapshot.reference.parent.parent is not None
+
+
+def promote_documents(db, project_id: str, kind: str, document_ids: List[str]) -> int:
+    """
+    Copies legacy-only documents to the nested layout before they are partially updated.
+    Copies are create-only, so a nested document that already exists is never overwritten.
+    """
+    if not dual_read() or not document_ids:
+        return 0
+    snapshots = get_documents(db, project_id, kind, document_ids)
+    legacy = [snapshot for snapshot in snapshots.values() if not is_nested(snapshot)]
+    if not legacy:
+        return 0
+    collection = project_collection(db, project_id, kind)
+    return copy_documents(db, [(collection.document(snapshot.id), snapshot.to_dict()) for snapshot in legacy])["copied"]
+
+
+def copy_documents(db, copies: Iterable[Tuple[Any, Dict[str, Any]]]) -> Dict[str, int]:
+    """
+    Create-only writes of `(target reference, data)` through a bulk writer. Targets that already
+    exist are left alone and counted as `existing`; other failed writes are counted as `failed`.
+    """
+    existing, failed = [], []
+    total = 0
+
+    def on_error(failure, _writer) -> bool:
+        (existing if failure.code == _ALREADY_EXISTS else failed).append(failure.operation.reference.path)
+        return False
+
+    writer = db.bulk_writer()
+    writer.on_write_error(on_error)
+    for reference, data in copies:
+        writer.create(reference, data)
+        total += 1
+    writer.close()
+    return {"copied": total - len(existing) - len(failed), "existing": len(existing), "failed": len(failed)}
@@ -0,0 +1,148 @@
+"""
+Online, resumable migration of endpoints, tests and test runs from the legacy top-level
+collections to the layout nested under their project (see `projects.layout`).
+
+Run it once every instance writes the nested layout. The service keeps serving throughout: it
+reads both layouts while `PROJECT_LAYOUT_DUAL_READ` is on. The legacy collections are walked in
+document id order, a page at a time, and every page is copied with create-only bulk writes, so a
+document the service has already written or promoted is never overwritten. Runs are copied with
+their `results` subcollection. The cursor (collection and last copied id) is saved after every
+page in `migrations/project_layout`, so an interrupted migration resumes after the last page it
+finished.
+
+`--verify` then checks, project by project, that every legacy document has a nested copy and
+marks the project `layout: "nested"`. Once every project is marked, turn dual-read off;
+`--delete-legacy` afterwards removes the legacy documents of marked projects.
+
+    python -m projects.migrate_layout                  # copy, resuming from the saved cursor
+    python -m projects.migrate_layout --verify
+    python -m projects.migrate_layout --delete-legacy
+    python -m projects.migrate_layout --restart        # copy from the start, ignoring the cursor
+"""
+import argparse
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from google.cloud import firestore
+
+from config import get_project_layout_config
+from logconfig import get_logger
+from projects.layout import (
+    ENDPOINTS, LAYOUT_FIELD, LAYOUT_NESTED, PROJECTS, RESULTS, TEST_RUNS, TESTS,
+    copy_documents, legacy_collection, project_collection,
+)
+
+logger = get_logger()
+
+db = firestore.Client()
+migration_state_ref = db.collection("migrations").document("project_layout")
+
+MIGRATED_KINDS = (ENDPOINTS, TESTS, TEST_RUNS)
+
+
+class MigrationError(RuntimeError):
+    pass
+
+
+def _copies(kind: str, page: List) -> List:
+    copies = []
+    for snapshot in page:
+        data = snapshot.to_dict()
+        target = project_collection(db, data["project_id"], kind).document(snapshot.id)
+        copies.append((target, data))
+        if kind == TEST_RUNS:
+            results = target.collection(RESULTS)
+            copies.extend((results.document(result.id), result.to_dict()) for result in snapshot.reference.collection(RESULTS).stream())
+    return copies
+
+
+def copy_legacy_documents(restart: bool = False, page_size: Optional[int] = None) -> Dict[str, Any]:
+    page_size = page_size or get_project_layout_config().migration_page_size
+    state = migration_state_ref.get()
+    cursor = state.to_dict() if state.exists and not restart else {}
+    totals = defaultdict(int)
+
+    for kind in MIGRATED_KINDS[MIGRATED_KINDS.index(cursor["kind"]) if cursor.get("kind") in MIGRATED_KINDS else 0:]:
+        legacy = legacy_collection(db, kind)
+        last_id = cursor.get("last_id") if cursor.get("kind") == kind else None
+        while True:
+            query = legacy.order_by("__name__")
+            if last_id is not None:
+                query = query.where("__name__", ">", legacy.document(last_id))
+            page = list(query.limit(page_size).stream())
+            if not page:
+                break
+            orphaned = [snapshot for snapshot in page if not snapshot.get("project_id")]
+            counts = copy_documents(db, _copies(kind, [snapshot for snapshot in page if snapshot.get("project_id")]))
+            if counts["failed"]:
+                # The cursor stays before this page, so the next invocation retries it
+                raise MigrationError(f"{counts['failed']} writes failed while copying {kind} after {last_id!r}")
+            for name, count in counts.items():
+                totals[f"{kind}_{name}"] += count
+            totals[f"{kind}_orphaned"] += len(orphaned)
+            last_id = page[-1].id
+            migration_state_ref.set({"kind": kind, "last_id": last_id, "updated_at": datetime.utcnow()})
+            logger.info("Copied legacy documents", kind=kind, last_id=last_id, **counts)
+            if len(page) < page_size:
+                break
+    migration_state_ref.set({"kind": None, "last_id": None, "completed_at": datetime.utcnow()})
+    return dict(totals)
+
+
+def _ids(query) -> set:
+    return {snapshot.id for snapshot in query.select([]).stream()}
+
+
+def verify_projects() -> Dict[str, Any]:
+    """Marks projects whose legacy documents all have nested copies; returns the ones that do not"""
+    migrated, pending = 0, {}
+    for project in db.collection(PROJECTS).stream():
+        missing = {}
+        for kind in MIGRATED_KINDS:
+            legacy_ids = _ids(legacy_collection(db, kind).where("project_id", "==", project.id))
+            absent = len(legacy_ids - _ids(project_collection(db, project.id, kind)))
+            if absent:
+                missing[kind] = absent
+        if missing:
+            pending[project.id] = missing
+        elif project.get(LAYOUT_FIELD) != LAYOUT_NESTED:
+            project.reference.update({LAYOUT_FIELD: LAYOUT_NESTED})
+            migrated += 1
+        else:
+            migrated += 1
+    logger.info("Verified project layout", migrated=migrated, pending=len(pending))
+    return {"migrated_projects": migrated, "pending_projects": pending}
+
+
+def delete_legacy_documents() -> Dict[str, int]:
+    if get_project_layout_config().dual_read:
+        raise MigrationError("Turn PROJECT_LAYOUT_DUAL_READ off before deleting the legacy documents")
+    deleted = defaultdict(int)
+    writer = db.bulk_writer()
+    for project in db.collection(PROJECTS).where(LAYOUT_FIELD, "==", LAYOUT_NESTED).stream():
+        for kind in MIGRATED_KINDS:
+            for snapshot in legacy_collection(db, kind).where("project_id", "==", project.id).select([]).stream():
+                if kind == TEST_RUNS:
+                    for result in snapshot.reference.collection(RESULTS).list_documents():
+                        writer.delete(result)
+                writer.delete(snapshot.reference)
+                deleted[kind] += 1
+    writer.close()
+    logger.info("Deleted legacy documents", **deleted)
+    return dict(deleted)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move endpoints, tests and test runs under their projects")
+    parser.add_argument("--restart", action="store_true", help="copy from the start instead of the saved cursor")
+    parser.add_argument("--page-size", type=int, default=None)
+    parser.add_argument("--verify", action="store_true", help="mark fully copied projects as migrated")
+    parser.add_argument("--delete-legacy", action="store_true", help="delete the legacy documents of migrated projects")
+    args = parser.parse_args()
+    if args.verify:
+        print(verify_projects())
+    elif args.delete_legacy:
+        print(delete_legacy_documents())
+    else:
+        print(copy_legacy_documents(restart=args.restart, page_size=args.page_size))
@@ -1,52 +1,111 @@
-from typing import List, Optional, Dict, Any
+import asyncio
+import time
+from collections import Counter
+from typing import List, Optional, Dict, Any, Tuple
 from fastapi import UploadFile
 from datetime import datetime
 import uuid
-import json
-import yaml
-import httpx
 from fastapi import HTTPException
 from google.cloud import firestore
-from projects.projects_model import ProjectResponse, EndpointResponse, ProjectEndpoint, ProjectEndpointParameter, TestRun, TestResult
+from projects.spec_fetch import SpecFetchResult, fetch_openapi_spec, parse_spec, next_sync_at
+from config import get_test_runner_config
+from test_runner.executor import STATUS_FAILED, TestRunAggregator, evaluate_test, execute_tests
+from test_runner.sharding import should_shard, get_sharded_executor
+from test_runner.result_sink import ResultSink, RESULTS_SUBCOLLECTION
+from test_runner.scheduler import RunTicket, get_test_run_scheduler
+from test_runner.archival import read_archived_results
+from test_runner.scenario_runner import ScenarioError, ScenarioPlan, run_scenario
+from test_runner.selection import SELECT_AFFECTED, SELECT_ALL, TestRef, endpoint_content_hash, select_affected, stale_tests
+from common_code.blocking import FIRESTORE, FIRESTORE_BULK, STORAGE, run_blocking
+from common_code.object_storage import get_object_storage
+from common_code.single_flight import single_flight
+from manage_user.manage_user import get_user_plan
+from mock_server.mock_server import CachedTable, RouteTable, get_cached_table, store_table, invalidate_mock_table
+from config import get_mock_server_config
+from projects.layout import ENDPOINTS, TESTS, TEST_RUNS, collection_paths, dual_read, get_document, get_documents, is_nested, legacy_collection, project_collection, promote_documents, query_documents
+from projects.endpoint_search import EndpointIndex, get_cached_index, store_index, invalidate_endpoint_index
+from projects.projects_model import ProjectResponse, EndpointResponse, EndpointSearchResponse, ProjectEndpoint, ProjectEndpointParameter, TestRun, TestResult
+from logconfig import get_logger
+
+logger = get_logger()
 
 db = firestore.Client()
 projects_collection = db.collection("projects")
-endpoints_collection = db.collection("endpoints")
-test_runs_collection = db.collection("test_runs")
-test_results_collection = db.collection("test_results")
+project_list_versions_collection = db.collection("project_list_versions")
+test_schedules_collection = db.collection("test_schedules")
+test_scenarios_collection = db.collection("test_scenarios")
 
+@single_flight
 async def get_all_projects_service(user_id: str) -> List[ProjectResponse]:
+    return await run_blocking(FIRESTORE, _list_projects, user_id)
+
+def _list_projects(user_id: str) -> List[ProjectResponse]:
     projects_ref = projects_collection.where("user_id", "==", user_id).order_by("created_at", direction="DESCENDING")
     projects = []
     for doc in projects_ref.stream():
-        project_data = doc.to_dict()
-        endpoints_count = sum(1 for _ in endpoints_collection.where("project_id", "==", doc.id).stream())
-        tests_count = sum(run.to_dict().get("total_tests", 0) for run in test_runs_collection.where("project_id", "==", doc.id).stream())
-        projects.append(ProjectResponse(**project_data, id=doc.id, endpoints_count=endpoints_count, tests_count=tests_count))
+        endpoints_count, tests_count = project_counts(doc.id)
+        projects.append(ProjectResponse(**doc.to_dict(), id=doc.id, endpoints_count=endpoints_count, tests_count=tests_count))
     return projects
 
+def project_counts(project_id: str) -> Tuple[int, int]:
+    """Number of endpoints and of tests run across the project's runs"""
+    endpoints_count = len(query_documents(db, project_id, ENDPOINTS, lambda query: query.select([])))
+    runs = query_documents(db, project_id, TEST_RUNS, lambda query: query.select(["total_tests"]))
+    return endpoints_count, sum(run.to_dict().get("total_tests", 0) for run in runs)
+
+@single_flight
 async def get_project_service(project_id: str, user_id: str) -> Optional[ProjectResponse]:
+    return await run_blocking(FIRESTORE, _read_project, project_id, user_id)
+
+def _read_project(project_id: str, user_id: str) -> Optional[ProjectResponse]:
     doc = projects_collection.document(project_id).get()
     if not doc.exists or doc.to_dict().get("user_id") != user_id:
         return None
-    project_data = doc.to_dict()
-    endpoints_count = sum(1 for _ in endpoints_collection.where("project_id", "==", project_id).stream())
-    tests_count = sum(run.to_dict().get("total_tests", 0) for run in test_runs_collection.where("project_id", "==", project_id).stream())
-    return ProjectResponse(**project_data, id=doc.id, endpoints_count=endpoints_count, tests_count=tests_count)
+    endpoints_count, tests_count = project_counts(project_id)
+    return ProjectResponse(**doc.to_dict(), id=doc.id, endpoints_count=endpoints_count, tests_count=tests_count)
+
+@single_flight
+async def get_project_version(project_id: str, user_id: str) -> Optional[int]:
+    doc = await run_blocking(FIRESTORE, projects_collection.document(project_id).get)
+    if not doc.exists or doc.to_dict().get("user_id") != user_id:
+        return None
+    return doc.to_dict().get("version", 0)
+
+@single_flight
+async def get_project_list_version(user_id: str) -> int:
+    doc = await run_blocking(FIRESTORE, project_list_versions_collection.document(user_id).get)
+    return doc.to_dict().get("version", 0) if doc.exists else 0
+
+async def bump_project_version(project_id: Optional[str], user_id: str):
+    """Invalidates cached representations of the project and of the user's project list"""
+    await run_blocking(FIRESTORE, _increment_project_versions, project_id, user_id)
+    forget_project_reads()
+
+def _increment_project_versions(project_id: Optional[str], user_id: str):
+    if project_id:
+        projects_collection.document(project_id).update({"version": firestore.Increment(1)})
+    project_list_versions_collection.document(user_id).set({"version": firestore.Increment(1)}, merge=True)
+
+def forget_project_reads():
+    """Reads started before a write must not be handed to callers arriving after it"""
+    for read in (get_all_projects_service, get_project_service, get_project_version, get_project_list_version,
+                 get_project_endpoints_service, get_project_test_history_service, get_test_run_details_service):
+        read.forget_all()
 
 async def create_project_service(user_id: str, name: str, description: Optional[str], type_: str, account_type: str, openapi_url: Optional[str], openapi_file: Optional[UploadFile]) -> ProjectResponse:
     project_id = str(uuid.uuid4())
     project_data = {
         "user_id": user_id, "name": name, "description": description, "type": type_, "account_type": account_type,
-        "created_at": datetime.utcnow(), "updated_at": datetime.utcnow(), "status": "active", "openapi_url": openapi_url
+        "created_at": datetime.utcnow(), "updated_at": datetime.utcnow(), "status": "active", "openapi_url": openapi_url, "version": 1
     }
-    projects_collection.document(project_id).set(project_data)
+    await run_blocking(FIRESTORE, projects_collection.document(project_id).set, project_data)
+    await bump_project_version(None, user_id)
     if openapi_url or openapi_file:
         await import_openapi_schema_service(project_id, user_id, openapi_url, await openapi_file.read() if openapi_file else None)
     return await get_project_service(project_id, user_id)
 
 async def update_project_service(project_id: str, user_id: str, name: Optional[str], description: Optional[str], type_: Optional[str], account_type: Optional[str], openapi_url: Optional[str], openapi_file: Optional[UploadFile]) -> ProjectResponse:
-    doc = projects_collection.document(project_id).get()
+    doc = await run_blocking(FIRESTORE, projects_collection.document(project_id).get)
     if not doc.exists or doc.to_dict().get("user_id") != user_id:
         raise HTTPException(403)
     update_data = {"updated_at": datetime.utcnow()}
@@ -55,134 +114,386 @@ async def update_project_service(project_id: str, user_id: str, name: Optional[s
     if type_: update_data["type"] = type_
     if account_type: update_data["account_type"] = account_type
     if openapi_url: update_data["openapi_url"] = openapi_url
-    doc.reference.update(update_data)
+    update_data["version"] = firestore.Increment(1)
+    await run_blocking(FIRESTORE, doc.reference.update, update_data)
+    await bump_project_version(None, user_id)
     if openapi_url or openapi_file:
         await import_openapi_schema_service(project_id, user_id, openapi_url, await openapi_file.read() if openapi_file else None)
     return await get_project_service(project_id, user_id)
 
 async def delete_project_service(project_id: str, user_id: str):
-    doc = projects_collection.document(project_id).get()
+    doc = await run_blocking(FIRESTORE, projects_collection.document(project_id).get)
     if not doc.exists or doc.to_dict().get("user_id") != user_id:
         raise HTTPException(403)
     await delete_project_endpoints_service(project_id)
     await delete_project_test_runs_service(project_id)
-    await doc.reference.delete()
+    await run_blocking(FIRESTORE_BULK, _delete_project_documents, project_id, TESTS)
+    await run_blocking(FIRESTORE_BULK, _delete_project_definitions, project_id)
+    await bump_project_version(None, user_id)
 
+def _delete_project_definitions(project_id: str):
+    """The project's schedules and scenarios, then the project itself"""
+    for schedule in test_schedules_collection.where("project_id", "==", project_id).stream():
+        schedule.reference.delete()
+    for scenario in test_scenarios_collection.where("project_id", "==", project_id).stream():
+        scenario.reference.delete()
+    projects_collection.document(project_id).delete()
+
+@single_flight
 async def get_project_endpoints_service(project_id: str, user_id: str) -> List[EndpointResponse]:
     if not await get_project_service(project_id, user_id):
         raise HTTPException(status_code=404)
-    
-    endpoints_ref = endpoints_collection.where("project_id", "==", project_id).order_by("path")
+    return await run_blocking(FIRESTORE, _read_project_endpoints, project_id)
+
+def _read_project_endpoints(project_id: str) -> List[EndpointResponse]:
+    snapshots = sorted(query_documents(db, project_id, ENDPOINTS), key=lambda snapshot: snapshot.get("path") or "")
+    # One read of the project's tests instead of a query per endpoint
+    test_counts = Counter(snapshot.get("endpoint_id") for snapshot in query_documents(db, project_id, TESTS, lambda query: query.select(["endpoint_id"])))
     endpoints = []
     
-    for doc in endpoints_ref.stream():
+    for doc in snapshots:
         endpoint_data = doc.to_dict()
         # Remove 'id' and 'test_count' from the dictionary to avoid conflicts
         endpoint_data.pop("id", None)
         endpoint_data.pop("test_count", None)  # Add this line
-        
-        test_count = sum(1 for _ in test_results_collection.where("endpoint_id", "==", doc.id).stream())
-        endpoints.append(EndpointResponse(**endpoint_data, id=doc.id, test_count=test_count))
+        endpoints.append(EndpointResponse(**endpoint_data, id=doc.id, test_count=test_counts[doc.id]))
     
     return endpoints
 
+async def search_project_endpoints_service(project_id: str, user_id: str, query: str, method: Optional[str], tag: Optional[str], limit: int) -> EndpointSearchResponse:
+    doc = await run_blocking(FIRESTORE, projects_collection.document(project_id).get)
+    if not doc.exists or doc.to_dict().get("user_id") != user_id:
+        raise HTTPException(status_code=404)
+    # schema_version only moves on schema changes, so test runs do not force a rebuild
+    schema_version = doc.to_dict().get("schema_version", 0)
+    index = get_cached_index(project_id, schema_version)
+    if index is None:
+        endpoints = await run_blocking(FIRESTORE, list_project_endpoints, project_id)
+        index = EndpointIndex(schema_version, endpoints)
+        store_index(project_id, index)
+    total, hits = index.search(query, method=method, tag=tag, limit=limit)
+    return EndpointSearchResponse(query=query, total=total, results=hits)
+
+def list_project_endpoints(project_id: str) -> List[Dict[str, Any]]:
+    return [{**snapshot.to_dict(), "id": snapshot.id} for snapshot in query_documents(db, project_id, ENDPOINTS)]
+
+def _refresh_mock_table(project_id: str, cached: Optional[CachedTable]) -> CachedTable:
+    doc = projects_collection.document(project_id).get()
+    if not doc.exists:
+        raise HTTPException(status_code=404)
+    schema_version = doc.to_dict().get("schema_version", 0)
+    table = cached.table if cached is not None and cached.table.version == schema_version else None
+    if table is None:
+        endpoints = list_project_endpoints(project_id)
+        config = get_mock_server_config()
+        table = RouteTable(endpoints, version=schema_version, seed=config.seed, config=config)
+    return store_table(project_id, doc.to_dict().get("user_id"), table)
+
+async def get_mock_table(project_id: str, user_id: str) -> RouteTable:
+    """
+    The project's compiled mock routes. Ownership and schema version are re-read at most every
+    `cache_ttl_seconds`, off the event loop, and the table is only rebuilt when the schema
+    version moved.
+    """
+    cached = get_cached_table(project_id)
+    if cached is None or time.monotonic() - cached.checked_at > cached.table.config.cache_ttl_seconds:
+        cached = await run_blocking(FIRESTORE, _refresh_mock_table, project_id, cached)
+    if cached.owner_id != user_id:
+        raise HTTPException(status_code=404)
+    return cached.table
+
 async def import_openapi_schema_service(project_id: str, user_id: str, openapi_url: Optional[str], openapi_file: Optional[bytes]) -> Dict[str, Any]:
     if not await get_project_service(project_id, user_id):
         raise HTTPException(404)
     openapi_data = None
     if openapi_url:
-        async with httpx.AsyncClient() as client:
-            res = await client.get(openapi_url)
-            res.raise_for_status()
-            openapi_data = res.json()
+        fetched = await fetch_openapi_spec(openapi_url)
+        openapi_data = fetched.data
     elif openapi_file:
-        try: openapi_data = yaml.safe_load(openapi_file)
-        except yaml.YAMLError:
-            try: openapi_data = json.loads(openapi_file)
-            except json.JSONDecodeError: raise HTTPException(400)
+        openapi_data = parse_spec(openapi_file)
     if not openapi_data: raise HTTPException(400)
 
+    result = await apply_openapi_schema(project_id, user_id, openapi_data)
+    if openapi_url:
+        await run_blocking(FIRESTORE, record_spec_sync, project_id, fetched, changed=True, next_sync_at=next_sync_at())
+    return result
+
+async def apply_openapi_schema(project_id: str, user_id: str, openapi_data: Dict[str, Any]) -> Dict[str, Any]:
+    # The writes run in the bulk pool; the in-process caches are dropped back on the event loop
+    result = await run_blocking(FIRESTORE_BULK, _write_openapi_schema, project_id, user_id, openapi_data)
+    invalidate_endpoint_index(project_id)
+    invalidate_mock_table(project_id)
+    forget_project_reads()
+    return result
+
+def _write_openapi_schema(project_id: str, user_id: str, openapi_data: Dict[str, Any]) -> Dict[str, Any]:
     endpoints = parse_openapi_endpoints(openapi_data)
     created_count = 0
     updated_count = 0
+    changed_count = 0
+    # One read of the stored endpoints instead of a lookup per operation
+    existing = {
+        (snapshot.get("path"), snapshot.get("method")): snapshot
+        for snapshot in query_documents(db, project_id, ENDPOINTS, lambda query: query.select(["path", "method", "content_hash"]))
+    }
+    parsed_keys = {(endpoint.path, endpoint.method) for endpoint in endpoints}
+    promote_documents(db, project_id, ENDPOINTS, [snapshot.id for key, snapshot in existing.items() if key in parsed_keys and not is_nested(snapshot)])
+    endpoints_collection = project_collection(db, project_id, ENDPOINTS)
     for endpoint in endpoints:
         endpoint_data = endpoint.dict()
         endpoint_data["project_id"] = project_id
         endpoint_data["created_at"] = datetime.utcnow()
         endpoint_data["updated_at"] = datetime.utcnow()
+        endpoint_data["content_hash"] = endpoint_content_hash(endpoint)
 
-        existing_endpoint = await get_endpoint_service(project_id, endpoint.path, endpoint.method)
+        existing_endpoint = existing.get((endpoint.path, endpoint.method))
         if existing_endpoint:
+            if existing_endpoint.to_dict().get("content_hash") != endpoint_data["content_hash"]:
+                changed_count += 1
             endpoints_collection.document(existing_endpoint.id).update(endpoint_data)
             updated_count += 1
         else:
             endpoints_collection.document(str(uuid.uuid4())).set(endpoint_data)
             created_count += 1
-    return {"endpoints_created": created_count, "endpoints_updated": updated_count, "schema_count": len(endpoints)}
+    projects_collection.document(project_id).update({"schema_version": firestore.Increment(1)})
+    _increment_project_versions(project_id, user_id)
+    return {"endpoints_created": created_count, "endpoints_updated": updated_count, "endpoints_changed": changed_count, "schema_count": len(endpoints)}
 
-async def run_project_tests_service(project_id: str, user_id: str, test_config: Dict[str, Any]) -> TestRun:
+def record_spec_sync(project_id: str, fetched: SpecFetchResult, changed: bool, next_sync_at: Optional[datetime] = None):
+    """Stores the HTTP validators and spec hash used by the scheduled spec sync"""
+    now = datetime.utcnow()
+    update = {"spec_sync.last_checked_at": now}
+    if not fetched.not_modified:
+        update.update({
+            "spec_sync.etag": fetched.etag,
+            "spec_sync.last_modified": fetched.last_modified,
+            "spec_sync.spec_hash": fetched.spec_hash,
+        })
+    if changed:
+        update["spec_sync.last_changed_at"] = now
+    if next_sync_at is not None:
+        update["spec_sync.next_sync_at"] = next_sync_at
+    projects_collection.document(project_id).update(update)
+
+async def run_project_tests_service(project_id: str, user_id: str, test_config: Dict[str, Any], trigger: Optional[Dict[str, Any]] = None) -> TestRun:
     if not await get_project_service(project_id, user_id): raise HTTPException(404)
+    shards = test_config.get("shards")
+    if shards is not None and (isinstance(shards, bool) or not isinstance(shards, int) or shards < 1):
+        raise HTTPException(status_code=400, detail="shards must be a positive integer")
     test_run_id = str(uuid.uuid4())
     start_time = datetime.utcnow()
-    test_run_data = {"id": test_run_id, "project_id": project_id, "created_at": start_time, "duration": 0, "total_tests": 0, "passed_tests": 0, "failed_tests": 0, "pass_rate": 0, "results": []}
-    tests_to_run = [doc.id for doc in test_results_collection.where("project_id", "==", project_id).stream()] if test_config.get("test_ids") == 'all' else test_config.get("test_ids", [])
+    test_run_data = {"id": test_run_id, "project_id": project_id, "created_at": start_time, "duration": 0, "total_tests": 0, "passed_tests": 0, "failed_tests": 0, "pass_rate": 0}
+    if trigger:
+        test_run_data["trigger"] = trigger
+    selection = test_config.get("test_ids", [])
+    project_tests: List[TestRef] = []
+    endpoint_hashes: Dict[str, str] = {}
+    if selection in (SELECT_ALL, SELECT_AFFECTED):
+        project_tests, endpoint_hashes = await run_blocking(FIRESTORE, load_test_refs, project_id)
+    if selection == SELECT_AFFECTED:
+        sample_rate = test_config.get("sample_rate", get_test_runner_config().selection_sample_rate)
+        tests_to_run, test_run_data["selection"] = select_affected(project_tests, endpoint_hashes, sample_rate, seed=test_run_id)
+    elif selection == SELECT_ALL:
+        tests_to_run = [test.test_id for test in project_tests]
+    else:
+        tests_to_run = selection
+
+    run_ref = project_collection(db, project_id, TEST_RUNS).document(test_run_id)
+    test_collections = collection_paths(project_id, TESTS)
+    aggregator = TestRunAggregator()
+    sink = ResultSink(db, run_ref, extra_fields={"run_id": test_run_id, "project_id": project_id})
+    sharded = should_shard(test_config, len(tests_to_run))
 
-    results = []
-    passed_tests = 0
-    for test_id in tests_to_run:
-        result = await run_test_service(test_id)
-        results.append(result.id)
-        if result.status: passed_tests += 1
+    async def execute_unit(unit_index: int, unit: List[str]):
+        if sharded:
+            await get_sharded_executor().run(f"{test_run_id}:{unit_index}", unit, aggregator, sink=sink, shard_count=1, collections=test_collections)
+        else:
+            # Every batch is a get_all round trip, so the generator is advanced in the pool
+            batches = execute_tests(db, test_collections, unit, get_test_runner_config().read_batch_size)
+            while True:
+                results = await run_blocking(FIRESTORE, next, batches, None)
+                if results is None:
+                    break
+                aggregator.extend(results)
+                await sink.put(results)
+
+    ticket = RunTicket(user_id, project_id, await run_blocking(FIRESTORE, get_user_plan, user_id), len(tests_to_run))
+    try:
+        # "shards" caps how many units of this run may hold executor slots at once
+        await get_test_run_scheduler().run(ticket, tests_to_run, execute_unit, max_parallel=shards)
+        if test_config.get("scenario_ids"):
+            test_run_data["scenarios"] = await run_test_scenarios(project_id, test_config["scenario_ids"], aggregator, sink)
+    finally:
+        await sink.close()
+
+    if project_tests:
+        await run_blocking(FIRESTORE_BULK, record_endpoint_hashes, project_id, stale_tests(project_tests, endpoint_hashes))
 
     end_time = datetime.utcnow()
     test_run_data["duration"] = (end_time - start_time).total_seconds()
-    test_run_data["total_tests"] = len(tests_to_run)
-    test_run_data["passed_tests"] = passed_tests
-    test_run_data["failed_tests"] = test_run_data["total_tests"] - test_run_data["passed_tests"]
-    test_run_data["pass_rate"] = (passed_tests / test_run_data["total_tests"] * 100) if test_run_data["total_tests"] > 0 else 0
-    test_run_data["results"] = results
-    test_runs_collection.document(test_run_id).set(test_run_data)
-    projects_collection.document(project_id).update({"last_run_at": datetime.utcnow()})
-    return TestRun(**test_run_data, results=[])
+    test_run_data.update(aggregator.summary())
+    await run_blocking(FIRESTORE, run_ref.set, test_run_data)
+    await run_blocking(FIRESTORE, projects_collection.document(project_id).update, {"last_run_at": datetime.utcnow(), "version": firestore.Increment(1)})
+    await bump_project_version(None, user_id)
+    return TestRun(**test_run_data)
+
+def load_test_refs(project_id: str) -> Tuple[List[TestRef], Dict[str, str]]:
+    """The project's tests with the endpoint hash each last ran against, and the current hashes"""
+    tests = [
+        TestRef(snapshot.id, snapshot.to_dict().get("endpoint_id"), snapshot.to_dict().get("endpoint_hash"))
+        for snapshot in query_documents(db, project_id, TESTS, lambda query: query.select(["endpoint_id", "endpoint_hash"]))
+    ]
+    endpoint_hashes = {
+        snapshot.id: snapshot.to_dict().get("content_hash") or ""
+        for snapshot in query_documents(db, project_id, ENDPOINTS, lambda query: query.select(["content_hash"]))
+    }
+    return tests, endpoint_hashes
+
+def record_endpoint_hashes(project_id: str, hashes: Dict[str, str]):
+    """Only tests that ran against a different endpoint version than last time are written"""
+    if not hashes:
+        return
+    promote_documents(db, project_id, TESTS, list(hashes))
+    tests_collection = project_collection(db, project_id, TESTS)
+    writer = db.bulk_writer()
+    for test_id, endpoint_hash in hashes.items():
+        writer.update(tests_collection.document(test_id), {"endpoint_hash": endpoint_hash})
+    writer.close()
+
+async def run_test_scenarios(project_id: str, scenario_ids, aggregator: TestRunAggregator, sink: ResultSink) -> List[Dict[str, Any]]:
+    """Runs the selected scenarios, a few at a time, and returns their summaries"""
+    config = get_test_runner_config()
+    snapshots = await run_blocking(FIRESTORE, _scenario_snapshots, project_id, scenario_ids)
+    limit = asyncio.Semaphore(max(1, config.scenario_concurrency))
 
+    async def run_one(scenario_id: str, snapshot) -> Dict[str, Any]:
+        scenario = snapshot.to_dict() if snapshot is not None and snapshot.exists else None
+        if scenario is None or scenario.get("project_id") != project_id:
+            results, summary = [evaluate_test(scenario_id, None)], {"scenario_id": scenario_id, "status": STATUS_FAILED, "duration": 0}
+        else:
+            try:
+                plan = ScenarioPlan(scenario["steps"], scenario.get("variables"))
+            except ScenarioError as e:
+                results = [{**evaluate_test(scenario_id, None), "error": str(e)}]
+                summary = {"scenario_id": scenario_id, "status": STATUS_FAILED, "duration": 0}
+            else:
+                async with limit:
+                    results, summary = await run_scenario(scenario_id, plan, scenario["base_url"], scenario.get("variables"), max_parallel=config.scenario_max_parallel_steps)
+            summary["name"] = scenario.get("name")
+        aggregator.extend(results)
+        await sink.put(results)
+        return summary
+
+    ids = [snapshot.id for snapshot in snapshots] if scenario_ids == "all" else list(scenario_ids)
+    return list(await asyncio.gather(*(run_one(scenario_id, snapshot) for scenario_id, snapshot in zip(ids, snapshots))))
+
+def _scenario_snapshots(project_id: str, scenario_ids) -> List:
+    if scenario_ids == "all":
+        return list(test_scenarios_collection.where("project_id", "==", project_id).stream())
+    found = {snapshot.id: snapshot for snapshot in db.get_all([test_scenarios_collection.document(scenario_id) for scenario_id in scenario_ids])}
+    return [found.get(scenario_id) for scenario_id in scenario_ids]
+
+def get_test_scheduler_metrics() -> Dict[str, Any]:
+    return get_test_run_scheduler().metrics()
+
+@single_flight
 async def get_project_test_history_service(project_id: str, user_id: str, limit: int) -> List[TestRun]:
     if not await get_project_service(project_id, user_id): raise HTTPException(404)
-    test_runs_ref = test_runs_collection.where("project_id", "==", project_id).order_by("created_at", direction="DESCENDING").limit(limit)
+    return await run_blocking(FIRESTORE, _read_test_history, project_id, limit)
+
+def _read_test_history(project_id: str, limit: int) -> List[TestRun]:
+    runs = query_documents(db, project_id, TEST_RUNS, lambda query: query.order_by("created_at", direction="DESCENDING").limit(limit))
+    if dual_read():
+        runs = sorted(runs, key=lambda run: run.get("created_at"), reverse=True)[:limit]
     history = []
-    for doc in test_runs_ref.stream():
+    for doc in runs:
         run_data = doc.to_dict()
-        history.append(TestRun(**run_data, id=doc.id, results=[]))
+        history.append(TestRun(**{**run_data, "id": doc.id, "results": []}))
     return history
 
+@single_flight
 async def get_test_run_details_service(project_id: str, run_id: str, user_id: str) -> Optional[TestRun]:
     if not await get_project_service(project_id, user_id): raise HTTPException(404)
-    doc = test_runs_collection.document(run_id).get()
-    if not doc.exists or doc.to_dict().get("project_id") != project_id: return None
+    doc = await run_blocking(FIRESTORE, get_document, db, project_id, TEST_RUNS, run_id)
+    if doc is None: return None
     run_data = doc.to_dict()
-    results = []
-    for result_id in run_data.get("results", []):
-        result_doc = test_results_collection.document(result_id).get()
-        if result_doc.exists: results.append(TestResult(**result_doc.to_dict(), id=result_doc.id))
+    # Runs persisted before results moved to a subcollection only carry an id array
+    legacy_result_ids = run_data.pop("results", None)
+    run_data.pop("id", None)
+    archive = run_data.pop("archive", None)
+    if archive:
+        results = await run_blocking(STORAGE, _read_archived_run, archive["key"])
+    else:
+        results = await run_blocking(FIRESTORE, _read_run_results, project_id, doc.reference, legacy_result_ids)
     return TestRun(**run_data, id=doc.id, results=results)
 
+def _read_archived_run(key: str) -> List[TestResult]:
+    return [TestResult(**result) for result in read_archived_results(key)]
+
+def _read_run_results(project_id: str, run_ref, legacy_result_ids: Optional[List[str]]) -> List[TestResult]:
+    if legacy_result_ids:
+        found = get_documents(db, project_id, TESTS, legacy_result_ids)
+        result_docs = [found[result_id] for result_id in legacy_result_ids if result_id in found]
+    else:
+        result_docs = run_ref.collection(RESULTS_SUBCOLLECTION).stream()
+    return [TestResult(**{**result_doc.to_dict(), "id": result_doc.id}) for result_doc in result_docs if result_doc.exists]
+
 async def get_project_performance_service(project_id: str, user_id: str, timeRange: str) -> Dict[str, Any]:
     if not await get_project_service(project_id, user_id): raise HTTPException(404)
     return {"average_response_time": 250, "throughput": 1000, "error_rate": 0.5, "timeRange": timeRange, "chart_data": []}
 
+def _project_documents(project_id: str, kind: str) -> List:
+    """Documents of both layouts, including legacy ones that also have a nested copy"""
+    snapshots = list(project_collection(db, project_id, kind).stream())
+    if dual_read():
+        snapshots.extend(legacy_collection(db, kind).where("project_id", "==", project_id).stream())
+    return snapshots
+
 async def delete_project_endpoints_service(project_id: str):
-    for doc in endpoints_collection.where("project_id", "==", project_id).stream():
-        await doc.reference.delete()
+    await run_blocking(FIRESTORE_BULK, _delete_project_documents, project_id, ENDPOINTS)
+    invalidate_endpoint_index(project_id)
+    invalidate_mock_table(project_id)
+
+def _delete_project_documents(project_id: str, kind: str):
+    writer = db.bulk_writer()
+    for doc in _project_documents(project_id, kind):
+        writer.delete(doc.reference)
+    writer.close()
 
 async def delete_project_test_runs_service(project_id: str):
-    for doc in test_runs_collection.where("project_id", "==", project_id).stream():
+    archive_keys = await run_blocking(FIRESTORE_BULK, _delete_test_run_documents, project_id)
+    # After the documents are gone, so a storage problem leaves an orphaned archive behind
+    # instead of a half deleted project
+    for key in archive_keys:
+        try:
+            await run_blocking(STORAGE, get_object_storage().delete, key)
+        except Exception as e:
+            logger.warning("Could not delete test run archive", project_id=project_id, key=key, error=str(e))
+
+def _delete_test_run_documents(project_id: str) -> List[str]:
+    """Deletes the project's runs and their results, returning the keys of their archives"""
+    writer = db.bulk_writer()
+    tests_collection = project_collection(db, project_id, TESTS)
+    archive_keys = []
+    for doc in _project_documents(project_id, TEST_RUNS):
         for result_id in doc.to_dict().get("results", []):
-            await test_results_collection.document(result_id).delete()
-        await doc.reference.delete()
+            writer.delete(tests_collection.document(result_id))
+            writer.delete(legacy_collection(db, TESTS).document(result_id))
+        for result_doc in doc.reference.collection(RESULTS_SUBCOLLECTION).list_documents():
+            writer.delete(result_doc)
+        if doc.to_dict().get("archive"):
+            archive_keys.append(doc.to_dict()["archive"]["key"])
+        writer.delete(doc.reference)
+    writer.close()
+    return archive_keys
 
 async def get_endpoint_service(project_id: str, path: str, method: str) -> Optional[EndpointResponse]:
-    for doc in endpoints_collection.where("project_id", "==", project_id).where("path", "==", path).where("method", "==", method).stream():
+    return await run_blocking(FIRESTORE, _read_endpoint, project_id, path, method)
+
+def _read_endpoint(project_id: str, path: str, method: str) -> Optional[EndpointResponse]:
+    for doc in query_documents(db, project_id, ENDPOINTS, lambda query: query.where("path", "==", path).where("method", "==", method)):
         endpoint_data = doc.to_dict()
-        test_count = sum(1 for _ in test_results_collection.where("endpoint_id", "==", doc.id).stream())
+        test_count = len(query_documents(db, project_id, TESTS, lambda query: query.where("endpoint_id", "==", doc.id).select([])))
         return EndpointResponse(**endpoint_data, id=doc.id, test_count=test_count)
     return None
 
@@ -206,9 +517,7 @@ def parse_openapi_endpoints(openapi_data: Dict[str, Any]) -> List[ProjectEndpoin
             ))
     return endpoints
 
-async def run_test_service(test_id: str) -> TestResult:
-    test_doc = test_results_collection.document(test_id).get()
-    if not test_doc.exists: raise HTTPException(404)
-    test_data = test_doc.to_dict()
-    passed = True
-    return TestResult(**test_data, id=test_id, status=passed)
\ No newline at end of file
+async def run_test_service(project_id: str, test_id: str) -> TestResult:
+    test_doc = await run_blocking(FIRESTORE, get_document, db, project_id, TESTS, test_id)
+    if test_doc is None: raise HTTPException(404)
+    return TestResult(**evaluate_test(test_id, test_doc.to_dict()))
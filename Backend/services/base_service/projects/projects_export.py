@@ -0,0 +1,137 @@
+"""
+Streaming export of a project's test history.
+
+Runs are read from Firestore page by page with a query cursor and results run by run, and every
+row is encoded as soon as it is read, so memory use does not grow with the size of the history.
+During the layout cutover the legacy runs follow the nested ones.
+The generators are synchronous; `StreamingResponse` drives them from its threadpool.
+"""
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List
+
+from google.cloud import firestore
+
+from projects.layout import TESTS, TEST_RUNS, dual_read, get_documents, legacy_collection, project_collection
+from test_runner.archival import read_archived_results
+from test_runner.executor import PERCENTILES
+from test_runner.result_sink import RESULTS_SUBCOLLECTION
+
+db = firestore.Client()
+
+EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+PAGE_SIZE = 500
+CSV_FLUSH_ROWS = 200
+
+RUN_COLUMNS = ["id", "project_id", "created_at", "duration", "total_tests", "passed_tests", "failed_tests", "pass_rate"] + [f"p{pct}" for pct in PERCENTILES]
+RESULT_COLUMNS = ["run_id", "id", "endpoint_id", "method", "path", "status", "response_time", "status_code", "error", "assertions"]
+
+
+def _json_default(value: Any):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def _iter_pages(query, page_size: int) -> Iterator[firestore.DocumentSnapshot]:
+    last = None
+    while True:
+        page_query = query.start_after(last) if last is not None else query
+        page = list(page_query.limit(page_size).stream())
+        yield from page
+        if len(page) < page_size:
+            return
+        last = page[-1]
+
+
+def iter_project_test_runs(project_id: str, page_size: int = PAGE_SIZE) -> Iterator[firestore.DocumentSnapshot]:
+    exported = set()
+    for run in _iter_pages(project_collection(db, project_id, TEST_RUNS).order_by("created_at"), page_size):
+        exported.add(run.id)
+        yield run
+    if dual_read():
+        legacy_query = legacy_collection(db, TEST_RUNS).where("project_id", "==", project_id).order_by("created_at")
+        for run in _iter_pages(legacy_query, page_size):
+            if run.id not in exported:
+                yield run
+
+
+def iter_run_results(run: firestore.DocumentSnapshot) -> Iterator[Dict[str, Any]]:
+    """Results of a run, wherever it is stored: the archive, legacy test ids or its subcollection"""
+    run_data = run.to_dict()
+    if run_data.get("archive"):
+        yield from read_archived_results(run_data["archive"]["key"])
+        return
+    legacy_result_ids = run_data.get("results")
+    if legacy_result_ids:
+        for start in range(0, len(legacy_result_ids), PAGE_SIZE):
+            page_ids = legacy_result_ids[start:start + PAGE_SIZE]
+            found = get_documents(db, run_data["project_id"], TESTS, page_ids)
+            for result_id in page_ids:
+                if result_id in found:
+                    yield {**found[result_id].to_dict(), "id": result_id}
+        return
+    for snapshot in run.reference.collection(RESULTS_SUBCOLLECTION).stream():
+        yield {**snapshot.to_dict(), "id": snapshot.id}
+
+
+def _run_row(run: firestore.DocumentSnapshot) -> Dict[str, Any]:
+    data = run.to_dict()
+    row = {column: data.get(column) for column in RUN_COLUMNS}
+    row["id"] = run.id
+    percentiles = data.get("latency_percentiles") or {}
+    for pct in PERCENTILES:
+        row[f"p{pct}"] = percentiles.get(f"p{pct}")
+    return row
+
+
+def _iter_run_rows(project_id: str) -> Iterator[Dict[str, Any]]:
+    for run in iter_project_test_runs(project_id):
+        yield _run_row(run)
+
+
+def _iter_result_rows(project_id: str) -> Iterator[Dict[str, Any]]:
+    for run in iter_project_test_runs(project_id):
+        for result in iter_run_results(run):
+            yield {**{column: result.get(column) for column in RESULT_COLUMNS}, "run_id": run.id}
+
+
+def _encode_ndjson(rows: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    for row in rows:
+        yield json.dumps(row, default=_json_default).encode() + b"\n"
+
+
+def _csv_cell(value: Any) -> Any:
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=_json_default)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _encode_csv(rows: Iterable[Dict[str, Any]], columns: List[str]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction="ignore")
+    writer.writeheader()
+    pending = 0
+    for row in rows:
+        writer.writerow({key: _csv_cell(value) for key, value in row.items()})
+        pending += 1
+        if pending >= CSV_FLUSH_ROWS:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    yield buffer.getvalue().encode()
+
+
+def export_test_runs(project_id: str, export_format: str) -> Iterator[bytes]:
+    rows = _iter_run_rows(project_id)
+    return _encode_csv(rows, RUN_COLUMNS) if export_format == "csv" else _encode_ndjson(rows)
+
+
+def export_test_results(project_id: str, export_format: str) -> Iterator[bytes]:
+    rows = _iter_result_rows(project_id)
+    return _encode_csv(rows, RESULT_COLUMNS) if export_format == "csv" else _encode_ndjson(rows)
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field, HttpUrl
+from pydantic import AnyHttpUrl, BaseModel, Field, HttpUrl
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 import uuid
@@ -57,6 +57,19 @@ class ProjectEndpoint(BaseModel):
 class EndpointResponse(ProjectEndpoint):
     pass
 
+class EndpointSearchHit(BaseModel):
+    id: str = Field(..., description="Endpoint ID")
+    path: str = Field(..., description="Path")
+    method: str = Field(..., description="Method")
+    tag: Optional[str] = Field(None, description="Tag")
+    description: Optional[str] = Field(None, description="Description")
+    score: float = Field(..., description="Relevance Score")
+
+class EndpointSearchResponse(BaseModel):
+    query: str = Field(..., description="Query")
+    total: int = Field(..., description="Total Matches")
+    results: List[EndpointSearchHit] = Field(..., description="Ranked Matches")
+
 class TestResult(BaseModel):
     id: str = Field(..., description="Test Result ID")
     endpoint_id: str = Field(..., description="Endpoint ID")
@@ -80,7 +93,76 @@ class TestRun(BaseModel):
     passed_tests: int = Field(..., description="Passed Tests")
     failed_tests: int = Field(..., description="Failed Tests")
     pass_rate: float = Field(..., description="Pass Rate")
+    latency_percentiles: Optional[Dict[str, float]] = Field(None, description="Response time percentiles (p50, p90, p95, p99)")
+    selection: Optional[Dict[str, Any]] = Field(None, description="Test selection stats of an \"affected\" run")
+    scenarios: Optional[List["ScenarioRunSummary"]] = Field(None, description="Scenario Outcomes")
     results: Optional[List[TestResult]] = Field(None, description="Results")
 
     class Config:
-        orm_mode = True
\ No newline at end of file
+        orm_mode = True
+
+class TestScheduleCreate(BaseModel):
+    cron: str = Field(..., description="Cron Expression (5 fields)")
+    timezone: str = Field("UTC", description="Timezone the cron expression is evaluated in")
+    test_config: Dict[str, Any] = Field(default_factory=dict, description="Test Config passed to run-tests")
+    enabled: bool = Field(True, description="Enabled")
+
+class TestScheduleUpdate(BaseModel):
+    cron: Optional[str] = Field(None, description="Cron Expression (5 fields)")
+    timezone: Optional[str] = Field(None, description="Timezone")
+    test_config: Optional[Dict[str, Any]] = Field(None, description="Test Config")
+    enabled: Optional[bool] = Field(None, description="Enabled")
+
+class TestScheduleResponse(TestScheduleCreate):
+    id: str = Field(..., description="Schedule ID")
+    project_id: str = Field(..., description="Project ID")
+    next_run_at: Optional[datetime] = Field(None, description="Next Run At")
+    last_run_at: Optional[datetime] = Field(None, description="Last Run At")
+    last_run_id: Optional[str] = Field(None, description="Last Test Run ID")
+    last_error: Optional[str] = Field(None, description="Last Error")
+    created_at: datetime = Field(..., description="Created At")
+    updated_at: Optional[datetime] = Field(None, description="Updated At")
+
+class ScenarioStep(BaseModel):
+    id: str = Field(..., description="Step ID, unique within the scenario")
+    method: str = Field(..., description="Method")
+    path: str = Field(..., description="Path relative to the scenario base URL, may use {{variables}}")
+    endpoint_id: Optional[str] = Field(None, description="Endpoint ID")
+    depends_on: List[str] = Field(default_factory=list, description="IDs of the steps that must pass first")
+    headers: Dict[str, str] = Field(default_factory=dict, description="Headers")
+    query: Dict[str, Any] = Field(default_factory=dict, description="Query Parameters")
+    body: Optional[Any] = Field(None, description="JSON Body")
+    extract: Dict[str, str] = Field(default_factory=dict, description="Variables to extract, e.g. {\"pet_id\": \"body.id\"}")
+    expect_status: Optional[List[int]] = Field(None, description="Accepted status codes, any 2xx by default")
+
+class ScenarioCreate(BaseModel):
+    name: str = Field(..., description="Name")
+    base_url: AnyHttpUrl = Field(..., description="Base URL of the API under test")
+    variables: Dict[str, Any] = Field(default_factory=dict, description="Initial Variables")
+    steps: List[ScenarioStep] = Field(..., description="Steps")
+
+class ScenarioUpdate(BaseModel):
+    name: Optional[str] = Field(None, description="Name")
+    base_url: Optional[AnyHttpUrl] = Field(None, description="Base URL of the API under test")
+    variables: Optional[Dict[str, Any]] = Field(None, description="Initial Variables")
+    steps: Optional[List[ScenarioStep]] = Field(None, description="Steps")
+
+class ScenarioResponse(ScenarioCreate):
+    id: str = Field(..., description="Scenario ID")
+    project_id: str = Field(..., description="Project ID")
+    created_at: datetime = Field(..., description="Created At")
+    updated_at: Optional[datetime] = Field(None, description="Updated At")
+
+class ScenarioRunSummary(BaseModel):
+    scenario_id: str = Field(..., description="Scenario ID")
+    name: Optional[str] = Field(None, description="Name")
+    status: str = Field(..., description="Status")
+    duration: float = Field(..., description="Wall time in ms")
+    steps_passed: int = Field(0, description="Passed Steps")
+    steps_failed: int = Field(0, description="Failed Steps")
+    steps_skipped: int = Field(0, description="Steps skipped after a dependency failed")
+    critical_path: List[str] = Field(default_factory=list, description="Step IDs that determined the duration")
+    critical_path_time: float = Field(0, description="Time spent in critical path steps in ms")
+    steps: Dict[str, Dict[str, float]] = Field(default_factory=dict, description="Start and finish per step in ms")
+
+TestRun.update_forward_refs()
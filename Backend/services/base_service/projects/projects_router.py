@@ -1,7 +1,9 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Path, Query
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Path, Query, Request
+from common_code.fast_response import ValidatedModelRoute
 from typing import List, Optional, Dict, Any
 from pydantic import HttpUrl
-from projects.projects_model import ProjectResponse, EndpointResponse, TestRun
+from projects.projects_model import ProjectResponse, EndpointResponse, EndpointSearchResponse, TestRun, TestScheduleCreate, TestScheduleUpdate, TestScheduleResponse, ScenarioCreate, ScenarioUpdate, ScenarioResponse
 from projects.projects import (
     get_all_projects_service,
     get_project_service,
@@ -9,21 +11,47 @@ from projects.projects import (
     update_project_service,
     delete_project_service,
     get_project_endpoints_service,
+    search_project_endpoints_service,
     import_openapi_schema_service,
     run_project_tests_service,
     get_project_test_history_service,
     get_test_run_details_service,
-    get_project_performance_service
+    get_project_performance_service,
+    get_project_version,
+    get_project_list_version,
+    get_test_scheduler_metrics,
+    get_mock_table
 )
+from mock_server.mock_server import MOCK_METHODS
+from projects.schedules import create_schedule_service, list_schedules_service, update_schedule_service, delete_schedule_service
+from projects.scenarios import create_scenario_service, list_scenarios_service, get_scenario_service, update_scenario_service, delete_scenario_service
+from projects.projects_export import EXPORT_FORMATS, export_test_runs, export_test_results
 from get_user import get_current_user
+from fastapi.responses import Response, StreamingResponse
+from common_code.http_cache import check_not_modified
+from common_code.common_exceptions import unauthorized_exception
+from config import get_test_runner_config
 
-router = APIRouter()
+router = APIRouter(route_class=ValidatedModelRoute)
 
-@router.get("/", response_model=List[ProjectResponse])
+async def project_list_not_modified(request: Request, current_user: str = Depends(get_current_user)):
+    check_not_modified(request, current_user, await get_project_list_version(current_user))
+
+async def project_not_modified(request: Request, project_uuid: str = Path(...), current_user: str = Depends(get_current_user)):
+    check_not_modified(request, current_user, project_uuid, await get_project_version(project_uuid, current_user), request.url.query)
+
+@router.get("/", response_model=List[ProjectResponse], dependencies=[Depends(project_list_not_modified)])
 async def get_all_projects(current_user: str = Depends(get_current_user)):
     return await get_all_projects_service(current_user)
 
-@router.get("/{project_uuid}", response_model=ProjectResponse)
+@router.get("/scheduler/metrics", response_model=Dict[str, Any])
+async def get_scheduler_metrics(current_user: str = Depends(get_current_user)):
+    # Queue depths and waits of every tenant, so only operators may read them
+    if current_user not in get_test_runner_config().scheduler_operators:
+        raise unauthorized_exception
+    return get_test_scheduler_metrics()
+
+@router.get("/{project_uuid}", response_model=ProjectResponse, dependencies=[Depends(project_not_modified)])
 async def get_project(project_uuid: str = Path(...), current_user: str = Depends(get_current_user)):
     project = await get_project_service(project_uuid, current_user)
     if not project:
@@ -70,13 +98,24 @@ async def delete_project(project_uuid: str = Path(...), current_user: str = Depe
     await delete_project_service(project_uuid, current_user)
     return {"message": "Project deleted"}
 
-@router.get("/{project_uuid}/endpoints", response_model=List[EndpointResponse])
+@router.get("/{project_uuid}/endpoints", response_model=List[EndpointResponse], dependencies=[Depends(project_not_modified)])
 async def get_project_endpoints(project_uuid: str = Path(...), current_user: str = Depends(get_current_user)):
     project = await get_project_service(project_uuid, current_user)
     if not project:
         raise HTTPException(404)
     return await get_project_endpoints_service(project_uuid, current_user)
 
+@router.get("/{project_uuid}/endpoints/search", response_model=EndpointSearchResponse)
+async def search_project_endpoints(
+    project_uuid: str = Path(...),
+    q: str = Query(""),
+    method: Optional[str] = Query(None),
+    tag: Optional[str] = Query(None),
+    limit: int = Query(20, ge=1, le=200),
+    current_user: str = Depends(get_current_user)
+):
+    return await search_project_endpoints_service(project_uuid, current_user, q, method, tag, limit)
+
 @router.post("/{project_uuid}/import-schema", response_model=Dict[str, Any])
 async def import_openapi_schema(
     project_uuid: str = Path(...),
@@ -102,7 +141,45 @@ async def run_project_tests(
         raise HTTPException(404)
     return await run_project_tests_service(project_uuid, current_user, test_config or {})
 
-@router.get("/{project_uuid}/test-history", response_model=List[TestRun])
+@router.get("/{project_uuid}/schedules", response_model=List[TestScheduleResponse])
+async def list_test_schedules(project_uuid: str = Path(...), current_user: str = Depends(get_current_user)):
+    return await list_schedules_service(project_uuid, current_user)
+
+@router.post("/{project_uuid}/schedules", response_model=TestScheduleResponse)
+async def create_test_schedule(schedule: TestScheduleCreate, project_uuid: str = Path(...), current_user: str = Depends(get_current_user)):
+    return await create_schedule_service(project_uuid, current_user, schedule)
+
+@router.put("/{project_uuid}/schedules/{schedule_id}", response_model=TestScheduleResponse)
+async def update_test_schedule(schedule: TestScheduleUpdate, project_uuid: str = Path(...), schedule_id: str = Path(...), current_user: str = Depends(get_current_user)):
+    return await update_schedule_service(project_uuid, schedule_id, current_user, schedule)
+
+@router.delete("/{project_uuid}/schedules/{schedule_id}", response_model=Dict[str, str])
+async def delete_test_schedule(project_uuid: str = Path(...), schedule_id: str = Path(...), current_user: str = Depends(get_current_user)):
+    await delete_schedule_service(project_uuid, schedule_id, current_user)
+    return {"message": "Schedule deleted"}
+
+@router.get("/{project_uuid}/scenarios", response_model=List[ScenarioResponse])
+async def list_test_scenarios(project_uuid: str = Path(...), current_user: str = Depends(get_current_user)):
+    return await list_scenarios_service(project_uuid, current_user)
+
+@router.post("/{project_uuid}/scenarios", response_model=ScenarioResponse)
+async def create_test_scenario(scenario: ScenarioCreate, project_uuid: str = Path(...), current_user: str = Depends(get_current_user)):
+    return await create_scenario_service(project_uuid, current_user, scenario)
+
+@router.get("/{project_uuid}/scenarios/{scenario_id}", response_model=ScenarioResponse)
+async def get_test_scenario(project_uuid: str = Path(...), scenario_id: str = Path(...), current_user: str = Depends(get_current_user)):
+    return await get_scenario_service(project_uuid, scenario_id, current_user)
+
+@router.put("/{project_uuid}/scenarios/{scenario_id}", response_model=ScenarioResponse)
+async def update_test_scenario(scenario: ScenarioUpdate, project_uuid: str = Path(...), scenario_id: str = Path(...), current_user: str = Depends(get_current_user)):
+    return await update_scenario_service(project_uuid, scenario_id, current_user, scenario)
+
+@router.delete("/{project_uuid}/scenarios/{scenario_id}", response_model=Dict[str, str])
+async def delete_test_scenario(project_uuid: str = Path(...), scenario_id: str = Path(...), current_user: str = Depends(get_current_user)):
+    await delete_scenario_service(project_uuid, scenario_id, current_user)
+    return {"message": "Scenario deleted"}
+
+@router.get("/{project_uuid}/test-history", response_model=List[TestRun], dependencies=[Depends(project_not_modified)])
 async def get_project_test_history(
     project_uuid: str = Path(...),
     limit: int = Query(10),
@@ -136,4 +213,42 @@ async def get_project_performance(
     project = await get_project_service(project_uuid, current_user)
     if not project:
         raise HTTPException(404)
-    return await get_project_performance_service(project_uuid, current_user, timeRange)
\ No newline at end of file
+    return await get_project_performance_service(project_uuid, current_user, timeRange)
+
+@router.get("/{project_uuid}/export/test-runs")
+async def export_project_test_runs(
+    project_uuid: str = Path(...),
+    format: str = Query("ndjson", regex="^(ndjson|csv)$"),
+    current_user: str = Depends(get_current_user)
+):
+    project = await get_project_service(project_uuid, current_user)
+    if not project:
+        raise HTTPException(404)
+    return StreamingResponse(
+        export_test_runs(project_uuid, format),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{project_uuid}-test-runs.{format}"'}
+    )
+
+@router.get("/{project_uuid}/export/test-results")
+async def export_project_test_results(
+    project_uuid: str = Path(...),
+    format: str = Query("ndjson", regex="^(ndjson|csv)$"),
+    current_user: str = Depends(get_current_user)
+):
+    project = await get_project_service(project_uuid, current_user)
+    if not project:
+        raise HTTPException(404)
+    return StreamingResponse(
+        export_test_results(project_uuid, format),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{project_uuid}-test-results.{format}"'}
+    )
+
+@router.api_route("/{project_uuid}/mock/{mock_path:path}", methods=MOCK_METHODS, include_in_schema=False)
+async def mock_request(request: Request, project_uuid: str = Path(...), mock_path: str = Path(...), current_user: str = Depends(get_current_user)):
+    table = await get_mock_table(project_uuid, current_user)
+    mocked = table.resolve(request.method, "/" + mock_path, request.headers)
+    if mocked.delay:
+        await asyncio.sleep(mocked.delay)
+    return Response(mocked.body, status_code=mocked.status, media_type="application/json" if mocked.body else None)
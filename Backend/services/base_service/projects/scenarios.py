@@ -0,0 +1,89 @@
+"""
+Test scenario definitions.
+
+Scenarios live in the top-level `test_scenarios` collection next to schedules, keyed by a uuid
+and carrying `project_id`. Every write is validated by building the `ScenarioPlan`, so a stored
+scenario always has an acyclic graph and only uses variables its steps can rely on. Runs pick
+scenarios up through `test_config["scenario_ids"]` (a list of ids or "all").
+"""
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List
+
+from fastapi import HTTPException
+
+from common_code.blocking import FIRESTORE, run_blocking
+from config import get_test_runner_config
+from projects.projects import get_project_service, test_scenarios_collection
+from projects.projects_model import ScenarioCreate, ScenarioResponse, ScenarioUpdate
+from test_runner.scenario_runner import ScenarioError, ScenarioPlan
+
+
+def validate_scenario(data: Dict[str, Any]):
+    try:
+        ScenarioPlan(data["steps"], data.get("variables"), max_steps=get_test_runner_config().scenario_max_steps)
+    except ScenarioError as e:
+        raise HTTPException(400, detail=str(e))
+
+
+def _to_document(scenario) -> Dict[str, Any]:
+    data = scenario.dict(exclude_none=isinstance(scenario, ScenarioUpdate))
+    if data.get("base_url") is not None:
+        data["base_url"] = str(data["base_url"])
+    return data
+
+
+def _to_response(snapshot) -> ScenarioResponse:
+    return ScenarioResponse(**{**snapshot.to_dict(), "id": snapshot.id})
+
+
+async def _require_project(project_id: str, user_id: str):
+    if not await get_project_service(project_id, user_id):
+        raise HTTPException(404)
+
+
+async def _owned_scenario(project_id: str, scenario_id: str):
+    snapshot = await run_blocking(FIRESTORE, test_scenarios_collection.document(scenario_id).get)
+    if not snapshot.exists or snapshot.to_dict().get("project_id") != project_id:
+        raise HTTPException(404)
+    return snapshot
+
+
+def _project_scenarios(project_id: str) -> List:
+    return list(test_scenarios_collection.where("project_id", "==", project_id).stream())
+
+
+async def create_scenario_service(project_id: str, user_id: str, scenario: ScenarioCreate) -> ScenarioResponse:
+    await _require_project(project_id, user_id)
+    data = _to_document(scenario)
+    validate_scenario(data)
+    now = datetime.utcnow()
+    scenario_ref = test_scenarios_collection.document(str(uuid.uuid4()))
+    await run_blocking(FIRESTORE, scenario_ref.set, {**data, "project_id": project_id, "user_id": user_id, "created_at": now, "updated_at": now})
+    return _to_response(await run_blocking(FIRESTORE, scenario_ref.get))
+
+
+async def list_scenarios_service(project_id: str, user_id: str) -> List[ScenarioResponse]:
+    await _require_project(project_id, user_id)
+    return [_to_response(snapshot) for snapshot in await run_blocking(FIRESTORE, _project_scenarios, project_id)]
+
+
+async def get_scenario_service(project_id: str, scenario_id: str, user_id: str) -> ScenarioResponse:
+    await _require_project(project_id, user_id)
+    return _to_response(await _owned_scenario(project_id, scenario_id))
+
+
+async def update_scenario_service(project_id: str, scenario_id: str, user_id: str, scenario: ScenarioUpdate) -> ScenarioResponse:
+    await _require_project(project_id, user_id)
+    snapshot = await _owned_scenario(project_id, scenario_id)
+    update_data = _to_document(scenario)
+    validate_scenario({**snapshot.to_dict(), **update_data})
+    update_data["updated_at"] = datetime.utcnow()
+    await run_blocking(FIRESTORE, snapshot.reference.update, update_data)
+    return _to_response(await run_blocking(FIRESTORE, snapshot.reference.get))
+
+
+async def delete_scenario_service(project_id: str, scenario_id: str, user_id: str):
+    await _require_project(project_id, user_id)
+    snapshot = await _owned_scenario(project_id, scenario_id)
+    await run_blocking(FIRESTORE, snapshot.reference.delete)
@@ -0,0 +1,268 @@
+"""
+Recurring test runs.
+
+Schedules live in the top-level `test_schedules` collection with a cron expression, the
+`test_config` passed to the run and `next_run_at`, the jittered time of the next fire. Disabled
+schedules have no `next_run_at`, so the dispatcher only ever reads what is due: one indexed range
+query on `next_run_at`, oldest first, however many schedules exist.
+
+A due schedule is claimed in a transaction that pushes `next_run_at` out by a lease, so several
+instances never fire it twice; if an instance dies mid-run the lease expires and the schedule
+fires again. Runs go through `run_project_tests_service`. Afterwards the next fire time is
+computed from the cron expression, missed fires are skipped rather than caught up, and a stable
+per-schedule offset of up to `jitter_ratio` of the interval spreads schedules that share a cron
+expression (e.g. everyone's "0 * * * *"). The dispatcher's Firestore calls go through `run_blocking`, so a
+pass never stalls the requests served by the same event loop.
+
+    python -m projects.schedules   # fire everything that is due once
+"""
+import argparse
+import asyncio
+import hashlib
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Set, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from croniter import croniter
+from fastapi import HTTPException
+from google.cloud import firestore
+from google.api_core.exceptions import NotFound
+
+from common_code.blocking import FIRESTORE, run_blocking
+from config import TestScheduleConfig, get_test_schedule_config
+from logconfig import get_logger
+from projects.projects import db, test_schedules_collection, get_project_service, run_project_tests_service
+from projects.projects_model import TestScheduleCreate, TestScheduleResponse, TestScheduleUpdate
+
+logger = get_logger()
+
+_INTERVAL_SAMPLES = 10
+
+
+def _zone(tz_name: str) -> ZoneInfo:
+    try:
+        return ZoneInfo(tz_name)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise HTTPException(400, detail=f"Unknown timezone: {tz_name}")
+
+
+def next_fire(cron: str, tz_name: str, after: datetime) -> datetime:
+    """Next nominal fire time strictly after `after`, in UTC"""
+    local_after = after.astimezone(_zone(tz_name))
+    return croniter(cron, local_after).get_next(datetime).astimezone(timezone.utc)
+
+
+def validate_cron(cron: str, tz_name: str, config: Optional[TestScheduleConfig] = None):
+    config = config or get_test_schedule_config()
+    if len(cron.split()) != 5 or not croniter.is_valid(cron):
+        raise HTTPException(400, detail="cron must be a 5 field cron expression")
+    _zone(tz_name)
+    fire = next_fire(cron, tz_name, datetime.now(timezone.utc))
+    for _ in range(_INTERVAL_SAMPLES):
+        following = next_fire(cron, tz_name, fire)
+        if (following - fire).total_seconds() < config.min_interval_seconds:
+            raise HTTPException(400, detail=f"Schedules may not fire more often than every {config.min_interval_seconds} seconds")
+        fire = following
+
+
+def jitter_offset(schedule_id: str, interval: timedelta, config: Optional[TestScheduleConfig] = None) -> timedelta:
+    """Stable offset in [0, window) derived from the schedule id"""
+    config = config or get_test_schedule_config()
+    window = min(config.max_jitter_seconds, interval.total_seconds() * config.jitter_ratio)
+    fraction = int(hashlib.sha1(schedule_id.encode()).hexdigest()[:8], 16) / 0x100000000
+    return timedelta(seconds=window * fraction)
+
+
+def schedule_times(schedule_id: str, cron: str, tz_name: str, after: datetime, config: Optional[TestScheduleConfig] = None) -> Tuple[datetime, datetime]:
+    """(nominal fire time, jittered fire time) of the next fire after `after`"""
+    nominal = next_fire(cron, tz_name, after)
+    interval = next_fire(cron, tz_name, nominal) - nominal
+    return nominal, nominal + jitter_offset(schedule_id, interval, config)
+
+
+def _to_response(snapshot) -> TestScheduleResponse:
+    data = snapshot.to_dict()
+    return TestScheduleResponse(**{**data, "id": snapshot.id})
+
+
+async def _require_project(project_id: str, user_id: str):
+    if not await get_project_service(project_id, user_id):
+        raise HTTPException(404)
+
+
+async def _owned_schedule(project_id: str, schedule_id: str):
+    snapshot = await run_blocking(FIRESTORE, test_schedules_collection.document(schedule_id).get)
+    if not snapshot.exists or snapshot.to_dict().get("project_id") != project_id:
+        raise HTTPException(404)
+    return snapshot
+
+
+def _project_schedules(project_id: str) -> List:
+    return list(test_schedules_collection.where("project_id", "==", project_id).stream())
+
+
+async def create_schedule_service(project_id: str, user_id: str, schedule: TestScheduleCreate) -> TestScheduleResponse:
+    await _require_project(project_id, user_id)
+    validate_cron(schedule.cron, schedule.timezone)
+    schedule_id = str(uuid.uuid4())
+    now = datetime.now(timezone.utc)
+    data = {**schedule.dict(), "project_id": project_id, "user_id": user_id, "created_at": now, "updated_at": now}
+    if schedule.enabled:
+        data["scheduled_for"], data["next_run_at"] = schedule_times(schedule_id, schedule.cron, schedule.timezone, now)
+    schedule_ref = test_schedules_collection.document(schedule_id)
+    await run_blocking(FIRESTORE, schedule_ref.set, data)
+    return _to_response(await run_blocking(FIRESTORE, schedule_ref.get))
+
+
+async def list_schedules_service(project_id: str, user_id: str) -> List[TestScheduleResponse]:
+    await _require_project(project_id, user_id)
+    return [_to_response(snapshot) for snapshot in await run_blocking(FIRESTORE, _project_schedules, project_id)]
+
+
+async def update_schedule_service(project_id: str, schedule_id: str, user_id: str, schedule: TestScheduleUpdate) -> TestScheduleResponse:
+    await _require_project(project_id, user_id)
+    snapshot = await _owned_schedule(project_id, schedule_id)
+    current = {**snapshot.to_dict(), **schedule.dict(exclude_none=True)}
+    update_data = {**schedule.dict(exclude_none=True), "updated_at": datetime.now(timezone.utc)}
+    if current["enabled"]:
+        validate_cron(current["cron"], current["timezone"])
+        update_data["scheduled_for"], update_data["next_run_at"] = schedule_times(schedule_id, current["cron"], current["timezone"], update_data["updated_at"])
+    else:
+        update_data["next_run_at"] = firestore.DELETE_FIELD
+    await run_blocking(FIRESTORE, snapshot.reference.update, update_data)
+    return _to_response(await run_blocking(FIRESTORE, snapshot.reference.get))
+
+
+async def delete_schedule_service(project_id: str, schedule_id: str, user_id: str):
+    await _require_project(project_id, user_id)
+    snapshot = await _owned_schedule(project_id, schedule_id)
+    await run_blocking(FIRESTORE, snapshot.reference.delete)
+
+
+@firestore.transactional
+def _claim(transaction, schedule_ref, now: datetime, lease_until: datetime) -> Optional[Dict[str, Any]]:
+    snapshot = schedule_ref.get(transaction=transaction)
+    if not snapshot.exists:
+        return None
+    data = snapshot.to_dict()
+    due = data.get("next_run_at")
+    if due is None or due > now:
+        return None
+    transaction.update(schedule_ref, {"next_run_at": lease_until})
+    return data
+
+
+def _due_schedules(now: datetime, limit: int) -> List:
+    return list(test_schedules_collection.where("next_run_at", "<=", now).order_by("next_run_at").limit(limit).stream())
+
+
+class ScheduleDispatcher:
+
+    def __init__(self, config: Optional[TestScheduleConfig] = None):
+        self.config = config or get_test_schedule_config()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = asyncio.Event()
+        self._running: Set[asyncio.Task] = set()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        self._stopping.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+        # Let fires in progress finish, their leases would otherwise re-fire them elsewhere
+        if self._running:
+            await asyncio.gather(*self._running, return_exceptions=True)
+
+    async def _run(self):
+        while not self._stopping.is_set():
+            try:
+                claimed = await self.dispatch_due()
+            except Exception as e:
+                logger.exception("Schedule dispatch pass failed", exception=e)
+                claimed = 0
+            if claimed < self.config.batch_size:
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), self.config.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def dispatch_due(self, now: Optional[datetime] = None) -> int:
+        """Claims and starts due schedules, never more than there is free fire capacity for"""
+        now = now or datetime.now(timezone.utc)
+        capacity = min(self.config.batch_size, self.config.max_concurrency - len(self._running))
+        if capacity <= 0:
+            return 0
+        due = await run_blocking(FIRESTORE, _due_schedules, now, capacity)
+        claimed = 0
+        lease_until = now + timedelta(seconds=self.config.lease_seconds)
+        for snapshot in due:
+            schedule = await run_blocking(FIRESTORE, _claim, db.transaction(), snapshot.reference, now, lease_until)
+            if schedule is None:
+                continue
+            claimed += 1
+            task = asyncio.ensure_future(self._fire(snapshot.reference, schedule, now))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+        return claimed
+
+    async def _fire(self, schedule_ref, schedule: Dict[str, Any], now: datetime):
+        update: Dict[str, Any] = {"last_run_at": now}
+        try:
+            run = await run_project_tests_service(
+                schedule["project_id"],
+                schedule["user_id"],
+                schedule.get("test_config") or {},
+                trigger={"type": "schedule", "schedule_id": schedule_ref.id, "scheduled_for": schedule.get("scheduled_for")},
+            )
+            update.update({"last_run_id": run.id, "last_error": firestore.DELETE_FIELD})
+        except Exception as e:
+            detail = e.detail if isinstance(e, HTTPException) else str(e)
+            logger.warning("Scheduled test run failed", schedule_id=schedule_ref.id, project_id=schedule["project_id"], error=str(detail))
+            update["last_error"] = str(detail)
+
+        # Re-read, the schedule may have been edited, disabled or deleted during the run
+        snapshot = await run_blocking(FIRESTORE, schedule_ref.get)
+        if not snapshot.exists:
+            return
+        current = snapshot.to_dict()
+        if current.get("enabled"):
+            after = max(datetime.now(timezone.utc), current.get("scheduled_for") or now)
+            update["scheduled_for"], update["next_run_at"] = schedule_times(schedule_ref.id, current["cron"], current.get("timezone", "UTC"), after, self.config)
+        try:
+            await run_blocking(FIRESTORE, schedule_ref.update, update)
+        except NotFound:
+            pass
+
+
+_dispatcher: Optional[ScheduleDispatcher] = None
+
+
+def start_schedule_dispatcher():
+    global _dispatcher
+    if _dispatcher is None and get_test_schedule_config().enabled:
+        _dispatcher = ScheduleDispatcher()
+        _dispatcher.start()
+
+
+async def stop_schedule_dispatcher():
+    global _dispatcher
+    if _dispatcher is not None:
+        dispatcher, _dispatcher = _dispatcher, None
+        await dispatcher.stop()
+
+
+if __name__ == "__main__":
+    argparse.ArgumentParser(description="Fire due recurring test runs once").parse_args()
+
+    async def dispatch_once():
+        dispatcher = ScheduleDispatcher()
+        claimed = await dispatcher.dispatch_due()
+        await dispatcher.stop()
+        print({"fired": claimed})
+
+    asyncio.run(dispatch_once())
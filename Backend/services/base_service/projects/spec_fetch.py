@@ -0,0 +1,68 @@
+"""
+Conditional fetching of OpenAPI specs from a project's `openapi_url`.
+"""
+import hashlib
+import json
+import random
+from datetime import datetime, timedelta
+from typing import Any, Dict, NamedTuple, Optional
+
+import yaml
+from fastapi import HTTPException
+
+from common_code.outbound_http import CircuitOpenError, get_outbound_pool
+from config import SpecSyncConfig, get_spec_sync_config
+
+
+class SpecFetchResult(NamedTuple):
+    not_modified: bool
+    data: Optional[Dict[str, Any]]
+    etag: Optional[str]
+    last_modified: Optional[str]
+    spec_hash: Optional[str]
+
+
+def parse_spec(content: bytes) -> Optional[Dict[str, Any]]:
+    """Parses a JSON or YAML spec, returning None when it is neither"""
+    try:
+        return json.loads(content)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        pass
+    try:
+        data = yaml.safe_load(content)
+    except yaml.YAMLError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def next_sync_at(config: Optional[SpecSyncConfig] = None, now: Optional[datetime] = None) -> datetime:
+    """Next poll time, spread by +/- `jitter_ratio` so projects never poll in lockstep"""
+    config = config or get_spec_sync_config()
+    spread = config.interval_seconds * config.jitter_ratio
+    delay = config.interval_seconds + random.uniform(-spread, spread)
+    return (now or datetime.utcnow()) + timedelta(seconds=max(delay, 1))
+
+
+def compute_spec_hash(data: Dict[str, Any]) -> str:
+    """Hash of the canonical JSON form, so formatting-only changes do not count as changes"""
+    canonical = json.dumps(data, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+async def fetch_openapi_spec(url: str, etag: Optional[str] = None, last_modified: Optional[str] = None) -> SpecFetchResult:
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    try:
+        res = await get_outbound_pool().get(url, headers=headers)
+    except CircuitOpenError as e:
+        raise HTTPException(503, detail=str(e))
+    if res.status_code == 304:
+        return SpecFetchResult(True, None, etag, last_modified, None)
+    res.raise_for_status()
+    data = parse_spec(res.content)
+    if not data:
+        raise HTTPException(400, detail="OpenAPI URL did not return a JSON or YAML document")
+    return SpecFetchResult(False, data, res.headers.get("etag"), res.headers.get("last-modified"), compute_spec_hash(data))
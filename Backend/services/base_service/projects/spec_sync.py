@@ -0,0 +1,163 @@
+"""
+Scheduled sync of specs for projects with an `openapi_url`.
+
+Every project with a URL carries `spec_sync.next_sync_at`. The scheduler repeatedly reads the
+projects that are due (one indexed range query, oldest first), claims each one in a transaction
+by pushing `next_sync_at` out by a lease, so several instances never poll the same project, and
+polls the URL with `If-None-Match` / `If-Modified-Since`. The spec is re-imported only when the
+server reports a change and the canonical spec hash differs. Next poll times are jittered and
+polls are capped by a global semaphore. Firestore reads and writes go through `run_blocking`, so
+a sync pass never stalls the requests served by the same event loop.
+
+    python -m projects.spec_sync --backfill   # schedule projects created before the sync existed
+"""
+import argparse
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from google.cloud import firestore
+
+from common_code.blocking import FIRESTORE, run_blocking
+from config import SpecSyncConfig, get_spec_sync_config
+from logconfig import get_logger
+from projects.projects import db, projects_collection, apply_openapi_schema, record_spec_sync
+from projects.spec_fetch import fetch_openapi_spec, next_sync_at
+
+logger = get_logger()
+
+
+@firestore.transactional
+def _claim(transaction, project_ref, now: datetime, lease_until: datetime) -> bool:
+    snapshot = project_ref.get(transaction=transaction)
+    if not snapshot.exists:
+        return False
+    due = (snapshot.to_dict().get("spec_sync") or {}).get("next_sync_at")
+    if due is None or due > now:
+        return False
+    transaction.update(project_ref, {"spec_sync.next_sync_at": lease_until})
+    return True
+
+
+def _due_projects(now: datetime, limit: int):
+    return list(
+        projects_collection.where("spec_sync.next_sync_at", "<=", now)
+        .order_by("spec_sync.next_sync_at")
+        .limit(limit)
+        .stream()
+    )
+
+
+class SpecSyncScheduler:
+
+    def __init__(self, config: Optional[SpecSyncConfig] = None):
+        self.config = config or get_spec_sync_config()
+        self._semaphore = asyncio.Semaphore(self.config.max_concurrency)
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = asyncio.Event()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        self._stopping.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+
+    async def _run(self):
+        while not self._stopping.is_set():
+            try:
+                processed = await self.sync_due()
+            except Exception as e:
+                logger.exception("Spec sync pass failed", exception=e)
+                processed = 0
+            # A full batch means more projects are due, keep going without sleeping
+            if processed < self.config.batch_size:
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), self.config.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def sync_due(self, now: Optional[datetime] = None) -> int:
+        now = now or datetime.now(timezone.utc)
+        due = await run_blocking(FIRESTORE, _due_projects, now, self.config.batch_size)
+        await asyncio.gather(*(self._sync_project(snapshot.reference, now) for snapshot in due))
+        return len(due)
+
+    async def _sync_project(self, project_ref, now: datetime):
+        async with self._semaphore:
+            lease_until = now + timedelta(seconds=self.config.lease_seconds)
+            if not await run_blocking(FIRESTORE, _claim, db.transaction(), project_ref, now, lease_until):
+                return
+            project = (await run_blocking(FIRESTORE, project_ref.get)).to_dict()
+            url = project.get("openapi_url")
+            if not url:
+                await run_blocking(FIRESTORE, project_ref.update, {"spec_sync.next_sync_at": firestore.DELETE_FIELD})
+                return
+
+            state = project.get("spec_sync") or {}
+            try:
+                fetched = await fetch_openapi_spec(url, state.get("etag"), state.get("last_modified"))
+            except Exception as e:
+                logger.warning("Spec sync fetch failed", project_id=project_ref.id, url=url, error=str(e))
+                await run_blocking(FIRESTORE, project_ref.update, {
+                    "spec_sync.last_error": str(e),
+                    "spec_sync.last_checked_at": datetime.utcnow(),
+                    "spec_sync.next_sync_at": next_sync_at(self.config),
+                })
+                return
+
+            changed = not fetched.not_modified and fetched.spec_hash != state.get("spec_hash")
+            if changed:
+                await apply_openapi_schema(project_ref.id, project["user_id"], fetched.data)
+                logger.info("Spec changed, re-imported", project_id=project_ref.id)
+            await run_blocking(FIRESTORE, record_spec_sync, project_ref.id, fetched, changed, next_sync_at=next_sync_at(self.config))
+
+
+def backfill_spec_sync_schedule() -> int:
+    """Gives every project with an `openapi_url` but no schedule a jittered first poll time"""
+    config = get_spec_sync_config()
+    scheduled = 0
+    batch = db.batch()
+    for snapshot in projects_collection.select(["openapi_url", "spec_sync"]).stream():
+        data = snapshot.to_dict()
+        if not data.get("openapi_url") or (data.get("spec_sync") or {}).get("next_sync_at"):
+            continue
+        batch.update(snapshot.reference, {"spec_sync.next_sync_at": next_sync_at(config)})
+        scheduled += 1
+        if scheduled % 500 == 0:
+            batch.commit()
+            batch = db.batch()
+    batch.commit()
+    return scheduled
+
+
+_scheduler: Optional[SpecSyncScheduler] = None
+
+
+def start_spec_sync_scheduler():
+    global _scheduler
+    if _scheduler is None and get_spec_sync_config().enabled:
+        _scheduler = SpecSyncScheduler()
+        _scheduler.start()
+
+
+async def stop_spec_sync_scheduler():
+    global _scheduler
+    if _scheduler is not None:
+        scheduler, _scheduler = _scheduler, None
+        await scheduler.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scheduled OpenAPI spec sync")
+    parser.add_argument("--backfill", action="store_true", help="schedule projects that have no next_sync_at yet")
+    args = parser.parse_args()
+    if args.backfill:
+        print({"scheduled": backfill_spec_sync_schedule()})
+    else:
+        async def run_once():
+            print({"synced": await SpecSyncScheduler().sync_due()})
+        asyncio.run(run_once())
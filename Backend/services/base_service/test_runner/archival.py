@@ -0,0 +1,158 @@
+"""
+Cold archival of old test runs.
+
+Runs older than the retention window are written to object storage as gzip compressed NDJSON,
+one object per run, partitioned by project and date:
+
+    test_runs/project={project_id}/date={YYYY-MM-DD}/{run_id}.ndjson.gz
+
+The first line is the run document, every following line one result. Afterwards the results
+subcollection is deleted and the run document keeps only its summary plus an `archive` pointer,
+which `read_archived_results` uses to stream the results back. Runs are found with a
+`test_runs` collection group query (single-field index on `created_at` with collection group
+scope), which covers runs nested under projects and legacy top-level runs alike.
+
+    python -m test_runner.archival --retention-days 90
+"""
+import argparse
+import gzip
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+from google.cloud import firestore
+
+from common_code.object_storage import ObjectStorage, get_object_storage
+from config import get_archive_config
+from logconfig import get_logger
+from projects.layout import TESTS, TEST_RUNS, get_documents
+from test_runner.result_sink import RESULTS_SUBCOLLECTION
+
+logger = get_logger()
+
+db = firestore.Client()
+archival_state_ref = db.collection("archival_state").document("test_runs")
+
+ARCHIVE_PREFIX = "test_runs"
+RECORD_RUN = "run"
+RECORD_RESULT = "result"
+
+
+def _json_default(value: Any):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def archive_object_key(run_data: Dict[str, Any]) -> str:
+    created_at = run_data["created_at"]
+    return f"{ARCHIVE_PREFIX}/project={run_data['project_id']}/date={created_at:%Y-%m-%d}/{run_data['id']}.ndjson.gz"
+
+
+def write_run_archive(storage: ObjectStorage, key: str, run_data: Dict[str, Any], results: Iterable[Dict[str, Any]]) -> int:
+    """
+    Streams the run and its results into one compressed NDJSON object. Returns the number of
+    results written.
+    """
+    count = 0
+    raw = storage.open_write(key)
+    try:
+        with gzip.GzipFile(fileobj=raw, mode="wb") as compressed:
+            compressed.write(json.dumps({"type": RECORD_RUN, "data": run_data}, default=_json_default).encode() + b"\n")
+            for result in results:
+                compressed.write(json.dumps({"type": RECORD_RESULT, "data": result}, default=_json_default).encode() + b"\n")
+                count += 1
+    finally:
+        raw.close()
+    return count
+
+
+def _iter_records(storage: ObjectStorage, key: str) -> Iterator[Dict[str, Any]]:
+    raw = storage.open_read(key)
+    try:
+        with gzip.GzipFile(fileobj=raw, mode="rb") as compressed:
+            for line in compressed:
+                if line.strip():
+                    yield json.loads(line)
+    finally:
+        raw.close()
+
+
+def read_archived_results(key: str, storage: Optional[ObjectStorage] = None) -> Iterator[Dict[str, Any]]:
+    """Lazily decompresses and yields the results of an archived run"""
+    for record in _iter_records(storage or get_object_storage(), key):
+        if record.get("type") == RECORD_RESULT:
+            yield record["data"]
+
+
+def _iter_live_results(run_ref, run_data: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    legacy_result_ids = run_data.get("results")
+    if legacy_result_ids:
+        snapshots = get_documents(db, run_data["project_id"], TESTS, legacy_result_ids).values()
+    else:
+        snapshots = run_ref.collection(RESULTS_SUBCOLLECTION).stream()
+    for snapshot in snapshots:
+        if snapshot.exists:
+            yield {**snapshot.to_dict(), "id": snapshot.id}
+
+
+def archive_test_run(snapshot, storage: ObjectStorage) -> int:
+    run_data = {**snapshot.to_dict(), "id": snapshot.id}
+    key = archive_object_key(run_data)
+    count = write_run_archive(storage, key, run_data, _iter_live_results(snapshot.reference, run_data))
+
+    # Only the subcollection holds run-owned result documents; legacy ids point at test documents
+    writer = db.bulk_writer()
+    for result_ref in snapshot.reference.collection(RESULTS_SUBCOLLECTION).list_documents():
+        writer.delete(result_ref)
+    writer.update(snapshot.reference, {
+        "results": firestore.DELETE_FIELD,
+        "archive": {"key": key, "uri": storage.uri(key), "results_count": count, "archived_at": datetime.utcnow()},
+    })
+    writer.close()
+    return count
+
+
+def archive_old_test_runs(retention_days: Optional[int] = None, now: Optional[datetime] = None, storage: Optional[ObjectStorage] = None) -> Dict[str, int]:
+    """
+    Archives every run created before `now - retention_days`. Progress is kept as a
+    `created_at` watermark, so an interrupted job resumes where it stopped and each invocation
+    only scans runs it has not seen yet.
+    """
+    config = get_archive_config()
+    storage = storage or get_object_storage()
+    retention_days = config.retention_days if retention_days is None else retention_days
+    cutoff = (now or datetime.now(timezone.utc)) - timedelta(days=retention_days)
+    state = archival_state_ref.get()
+    watermark = state.to_dict().get("watermark") if state.exists else None
+
+    archived_runs = archived_results = 0
+    while True:
+        query = db.collection_group(TEST_RUNS).where("created_at", "<", cutoff)
+        if watermark is not None:
+            query = query.where("created_at", ">=", watermark)
+        page = list(query.order_by("created_at").limit(config.page_size).stream())
+        progressed = False
+        for snapshot in page:
+            run_data = snapshot.to_dict()
+            if "archive" not in run_data:
+                archived_results += archive_test_run(snapshot, storage)
+                archived_runs += 1
+                progressed = True
+            if watermark is None or run_data["created_at"] > watermark:
+                watermark = run_data["created_at"]
+                progressed = True
+        if page:
+            archival_state_ref.set({"watermark": watermark, "updated_at": datetime.utcnow()})
+        if len(page) < config.page_size or not progressed:
+            break
+
+    logger.info("Archived test runs", runs=archived_runs, results=archived_results, cutoff=cutoff.isoformat())
+    return {"archived_runs": archived_runs, "archived_results": archived_results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive test runs older than the retention window")
+    parser.add_argument("--retention-days", type=int, default=None)
+    args = parser.parse_args()
+    print(archive_old_test_runs(args.retention_days))
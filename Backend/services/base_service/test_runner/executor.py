@@ -0,0 +1,99 @@
+"""
+Test evaluation and run aggregation shared by the in-process and sharded execution paths.
+"""
+import math
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Union
+
+STATUS_PASSED = "passed"
+STATUS_FAILED = "failed"
+# Scenario steps that never ran because a step they depend on failed
+STATUS_SKIPPED = "skipped"
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+def evaluate_test(test_id: str, test_data: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Turns a stored test document into a `TestResult` dict. A test fails when it is missing, has
+    an error, or has any assertion that did not pass.
+    """
+    if test_data is None:
+        return {
+            "id": test_id, "endpoint_id": "", "method": "", "path": "", "status": STATUS_FAILED,
+            "response_time": 0.0, "status_code": 0, "assertions": [], "error": "Test not found",
+        }
+    assertions = test_data.get("assertions") or []
+    error = test_data.get("error")
+    passed = not error and all(assertion.get("passed", True) for assertion in assertions)
+    return {
+        "id": test_id,
+        "endpoint_id": test_data.get("endpoint_id", ""),
+        "method": test_data.get("method", ""),
+        "path": test_data.get("path", ""),
+        "status": STATUS_PASSED if passed else STATUS_FAILED,
+        "response_time": float(test_data.get("response_time") or 0.0),
+        "status_code": int(test_data.get("status_code") or 0),
+        "assertions": assertions,
+        "error": error,
+    }
+
+
+def execute_tests(db, collections: Union[str, Sequence[str]], test_ids: List[str], batch_size: int) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Loads test documents with one `get_all` round trip per batch and yields evaluated results
+    batch by batch, in the order of `test_ids`. With several collection paths, tests missing
+    from one are looked up in the next.
+    """
+    collection_refs = [db.collection(collections)] if isinstance(collections, str) else [db.collection(path) for path in collections]
+    for start in range(0, len(test_ids), batch_size):
+        batch = test_ids[start:start + batch_size]
+        snapshots = {}
+        for collection_ref in collection_refs:
+            missing = [test_id for test_id in batch if test_id not in snapshots]
+            if not missing:
+                break
+            snapshots.update((doc.id, doc) for doc in db.get_all([collection_ref.document(test_id) for test_id in missing]) if doc.exists)
+        results = []
+        for test_id in batch:
+            snapshot = snapshots.get(test_id)
+            results.append(evaluate_test(test_id, snapshot.to_dict() if snapshot is not None else None))
+        yield results
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class TestRunAggregator:
+    """
+    Folds streamed results (from any number of shards, in any order) into `TestRun` totals.
+    """
+
+    def __init__(self):
+        self.total = 0
+        self.passed = 0
+        self.response_times: List[float] = []
+
+    def add(self, result: Dict[str, Any]):
+        self.total += 1
+        if result.get("status") == STATUS_PASSED:
+            self.passed += 1
+        self.response_times.append(float(result.get("response_time") or 0.0))
+
+    def extend(self, results: Iterable[Dict[str, Any]]):
+        for result in results:
+            self.add(result)
+
+    def summary(self) -> Dict[str, Any]:
+        times = sorted(self.response_times)
+        return {
+            "total_tests": self.total,
+            "passed_tests": self.passed,
+            "failed_tests": self.total - self.passed,
+            "pass_rate": (self.passed / self.total * 100) if self.total else 0,
+            "latency_percentiles": {f"p{pct}": percentile(times, pct) for pct in PERCENTILES},
+        }
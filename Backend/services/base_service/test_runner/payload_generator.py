@@ -0,0 +1,708 @@
+"""
+Schema driven request data generation for project endpoints.
+
+Every endpoint schema (`parameters` and `requestBody`) is compiled once into a tree of small
+generator closures. Generating a request afterwards is just a walk over those closures with a
+seeded `random.Random`, so the schema dict is never inspected again on the hot path.
+
+    factory = get_payload_factory(endpoint)
+    for request in factory.stream(VARIANT_VALID, seed=42, count=1000):
+        ...
+"""
+import hashlib
+import json
+import random
+import re
+import string
+import threading
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional
+from urllib.parse import quote
+
+from cachetools import LRUCache
+
+from projects.projects_model import ProjectEndpoint
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+VARIANT_VALID = "valid"
+VARIANT_BOUNDARY = "boundary"
+VARIANT_INVALID = "invalid"
+VARIANTS = (VARIANT_VALID, VARIANT_BOUNDARY, VARIANT_INVALID)
+
+DEFAULT_STRING_LENGTH = 12
+DEFAULT_ARRAY_SPAN = 3
+DEFAULT_NUMBER_SPAN = 10_000
+MAX_DEPTH = 8
+MAX_FIT_ATTEMPTS = 20
+
+_ALPHABET = string.ascii_letters + string.digits
+_EPOCH = datetime(2020, 1, 1)
+_INT_FORMAT_BOUNDS = {
+    "int32": (-(2 ** 31), 2 ** 31 - 1),
+    "int64": (-(2 ** 63), 2 ** 63 - 1),
+}
+
+Generator = Callable[[random.Random], Any]
+
+
+class SchemaNotGeneratable(ValueError):
+    """Raised when no value satisfying the schema can be produced (for example an unsupported `pattern`)"""
+
+
+class CompiledSchema(NamedTuple):
+    valid: Generator
+    boundary: Generator
+    invalid: Generator
+
+
+class GeneratedRequest(NamedTuple):
+    method: str
+    path: str
+    path_params: Dict[str, Any]
+    query: Dict[str, Any]
+    headers: Dict[str, str]
+    cookies: Dict[str, str]
+    body: Any
+    variant: str
+
+
+# ---------------------------------------------------------------------------
+# Schema compilation
+# ---------------------------------------------------------------------------
+
+def compile_schema(schema: Optional[Dict[str, Any]], depth: int = 0) -> CompiledSchema:
+    """
+    Compiles a JSON schema (OpenAPI flavour) into valid, boundary and invalid value generators.
+    Unresolved `$ref`s and unknown types compile to a generic object. The valid and boundary
+    generators raise `SchemaNotGeneratable` rather than return a value outside the schema.
+    """
+    schema = schema or {}
+    if depth > MAX_DEPTH or "$ref" in schema:
+        return _compile_object({}, depth)
+
+    if "allOf" in schema:
+        return compile_schema(_merge_all_of(schema), depth)
+    options = schema.get("oneOf") or schema.get("anyOf")
+    if options:
+        return _compile_choice([compile_schema(option, depth + 1) for option in options])
+
+    if "enum" in schema and schema["enum"]:
+        compiled = _compile_enum(schema["enum"])
+    else:
+        compiler = _COMPILERS.get(_schema_type(schema), _compile_object)
+        compiled = compiler(schema, depth)
+
+    if schema.get("nullable"):
+        compiled = _with_nullable_boundary(compiled)
+    return compiled
+
+
+def schema_example(schema: Optional[Dict[str, Any]], rng: random.Random, depth: int = 0) -> Any:
+    """
+    Example value for a schema, preferring what the spec documents: the schema's own `example`,
+    `examples` or `default` at any depth, and a generated valid value where there is none.
+    Raises `SchemaNotGeneratable` like the valid generator.
+    """
+    schema = schema or {}
+    samples = _schema_samples(schema)
+    if samples:
+        return samples[0]
+    if depth > MAX_DEPTH or "$ref" in schema:
+        return {}
+    if "allOf" in schema:
+        return schema_example(_merge_all_of(schema), rng, depth)
+    options = schema.get("oneOf") or schema.get("anyOf")
+    if options:
+        return schema_example(options[0], rng, depth + 1)
+    if "enum" in schema and schema["enum"]:
+        return schema["enum"][0]
+
+    schema_type = _schema_type(schema)
+    if schema_type == "object" or schema_type not in _COMPILERS:
+        required = set(schema.get("required") or [])
+        value = {}
+        for name, prop in (schema.get("properties") or {}).items():
+            if not isinstance(prop, dict):
+                continue
+            try:
+                value[name] = schema_example(prop, rng, depth + 1)
+            except SchemaNotGeneratable:
+                if name in required:
+                    raise
+        return value
+    if schema_type == "array" and not schema.get("uniqueItems"):
+        item = schema.get("items")
+        return [schema_example(item, rng, depth + 1) for _ in range(max(int(schema.get("minItems", 0)), 1))]
+    return compile_schema(schema, depth).valid(rng)
+
+
+def _schema_type(schema: Dict[str, Any]) -> str:
+    schema_type = schema.get("type")
+    if isinstance(schema_type, list):
+        schema_type = next((t for t in schema_type if t != "null"), None)
+    if schema_type is None:
+        schema_type = "object" if "properties" in schema else "string"
+    return schema_type
+
+
+def _merge_all_of(schema: Dict[str, Any]) -> Dict[str, Any]:
+    merged: Dict[str, Any] = {k: v for k, v in schema.items() if k != "allOf"}
+    properties = dict(merged.get("properties", {}))
+    required = list(merged.get("required", []))
+    for part in schema["allOf"]:
+        if not isinstance(part, dict) or "$ref" in part:
+            continue
+        for key, value in part.items():
+            if key == "properties":
+                properties.update(value)
+            elif key == "required":
+                required.extend(value)
+            else:
+                merged.setdefault(key, value)
+    if properties:
+        merged["properties"] = properties
+        merged.setdefault("type", "object")
+    if required:
+        merged["required"] = required
+    return merged
+
+
+def _compile_choice(options: List[CompiledSchema]) -> CompiledSchema:
+    if len(options) == 1:
+        return options[0]
+
+    def valid(rng):
+        return rng.choice(options).valid(rng)
+
+    def boundary(rng):
+        return rng.choice(options).boundary(rng)
+
+    return CompiledSchema(valid, boundary, options[0].invalid)
+
+
+def _compile_enum(values: List[Any]) -> CompiledSchema:
+    values = list(values)
+    edges = [values[0], values[-1]]
+    outside = "__not_in_enum__"
+    while outside in values:
+        outside += "_"
+
+    def valid(rng):
+        return rng.choice(values)
+
+    def boundary(rng):
+        return rng.choice(edges)
+
+    def invalid(rng):
+        return outside
+
+    return CompiledSchema(valid, boundary, invalid)
+
+
+def _with_nullable_boundary(compiled: CompiledSchema) -> CompiledSchema:
+    inner = compiled.boundary
+
+    def boundary(rng):
+        return None if rng.random() < 0.5 else inner(rng)
+
+    return CompiledSchema(compiled.valid, boundary, compiled.invalid)
+
+
+def _random_text(rng: random.Random, length: int) -> str:
+    return "".join(rng.choices(_ALPHABET, k=length))
+
+
+_STRING_FORMATS: Dict[str, Generator] = {
+    "date-time": lambda rng: (_EPOCH + timedelta(seconds=rng.randrange(10 ** 8))).isoformat() + "Z",
+    "date": lambda rng: (_EPOCH + timedelta(days=rng.randrange(3650))).date().isoformat(),
+    "uuid": lambda rng: str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+    "email": lambda rng: f"{_random_text(rng, 8).lower()}@example.com",
+    "uri": lambda rng: f"https://example.com/{_random_text(rng, 8)}",
+    "url": lambda rng: f"https://example.com/{_random_text(rng, 8)}",
+    "hostname": lambda rng: f"{_random_text(rng, 8).lower()}.example.com",
+    "ipv4": lambda rng: ".".join(str(rng.randrange(256)) for _ in range(4)),
+    "byte": lambda rng: "".join(rng.choices(string.ascii_letters, k=8)) + "==",
+}
+
+
+def _schema_samples(schema: Dict[str, Any]) -> List[Any]:
+    """The schema's own `example`, `examples` and `default` values, in that order"""
+    samples = [schema["example"]] if "example" in schema else []
+    if isinstance(schema.get("examples"), list):
+        samples.extend(schema["examples"])
+    if "default" in schema:
+        samples.append(schema["default"])
+    return samples
+
+
+def _fitting(generator: Optional[Generator], fits: Callable[[Any], bool], samples: List[Any]) -> Generator:
+    """Retries `generator` until a value fits, then falls back to the schema's own samples"""
+    fallback = [sample for sample in samples if fits(sample)]
+
+    def generate(rng):
+        if generator is not None:
+            for _ in range(MAX_FIT_ATTEMPTS):
+                value = generator(rng)
+                if fits(value):
+                    return value
+        if fallback:
+            return rng.choice(fallback)
+        raise SchemaNotGeneratable("no generated or example value satisfies the schema")
+
+    return generate
+
+
+# Characters drawn for `.`, negated classes and `\w`/`\d`/`\s` style categories
+_PATTERN_CHARS = _ALPHABET + "_-.@ "
+_PATTERN_CATEGORIES = {
+    sre_parse.CATEGORY_DIGIT: string.digits,
+    sre_parse.CATEGORY_NOT_DIGIT: string.ascii_letters + "_-.@ ",
+    sre_parse.CATEGORY_SPACE: " ",
+    sre_parse.CATEGORY_NOT_SPACE: _ALPHABET + "_-.@",
+    sre_parse.CATEGORY_WORD: _ALPHABET + "_",
+    sre_parse.CATEGORY_NOT_WORD: "-.@ ",
+}
+_PATTERN_REPEATS = {sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT, getattr(sre_parse, "POSSESSIVE_REPEAT", None)}
+_PATTERN_GROUPS = {sre_parse.SUBPATTERN, getattr(sre_parse, "ATOMIC_GROUP", None)}
+
+
+class _UnsupportedPattern(Exception):
+    pass
+
+
+def _compile_pattern(pattern: str) -> Optional[Generator]:
+    """
+    Generator of strings matching a regular expression, or None when the pattern uses constructs
+    that cannot be generated directly (lookarounds, backreferences).
+    """
+    try:
+        return _pattern_sequence(sre_parse.parse(pattern))
+    except (re.error, _UnsupportedPattern):
+        return None
+
+
+def _pattern_sequence(items) -> Generator:
+    parts = [part for part in (_pattern_item(op, av) for op, av in items) if part is not None]
+
+    def generate(rng):
+        return "".join(part(rng) for part in parts)
+
+    return generate
+
+
+def _pattern_item(op, av) -> Optional[Generator]:
+    if op == sre_parse.LITERAL:
+        char = chr(av)
+        return lambda rng: char
+    if op in (sre_parse.ANY, sre_parse.NOT_LITERAL, sre_parse.IN):
+        choices = _pattern_chars(op, av)
+        if not choices:
+            raise _UnsupportedPattern(op)
+        return lambda rng: rng.choice(choices)
+    if op in _PATTERN_REPEATS:
+        low, high, items = av
+        high = min(high, low + DEFAULT_ARRAY_SPAN)
+        inner = _pattern_sequence(items)
+        return lambda rng: "".join(inner(rng) for _ in range(rng.randint(low, high)))
+    if op in _PATTERN_GROUPS:
+        return _pattern_sequence(av[-1])
+    if op == sre_parse.BRANCH:
+        branches = [_pattern_sequence(branch) for branch in av[1]]
+        return lambda rng: rng.choice(branches)(rng)
+    if op == sre_parse.AT:
+        return None
+    raise _UnsupportedPattern(op)
+
+
+def _pattern_chars(op, av) -> List[str]:
+    if op == sre_parse.ANY:
+        return list(_PATTERN_CHARS)
+    if op == sre_parse.NOT_LITERAL:
+        return [char for char in _PATTERN_CHARS if char != chr(av)]
+
+    negate = bool(av) and av[0][0] == sre_parse.NEGATE
+    members = set()
+    ranges = []
+    for kind, value in av:
+        if kind == sre_parse.LITERAL:
+            members.add(chr(value))
+        elif kind == sre_parse.RANGE:
+            ranges.append(value)
+        elif kind == sre_parse.CATEGORY:
+            members.update(_PATTERN_CATEGORIES.get(value, ""))
+        elif kind != sre_parse.NEGATE:
+            raise _UnsupportedPattern(kind)
+
+    def member(char):
+        return char in members or any(low <= ord(char) <= high for low, high in ranges)
+
+    if negate:
+        return [char for char in _PATTERN_CHARS if not member(char)]
+    for low, high in ranges:
+        members.update(chr(code) for code in range(low, min(high, low + 255) + 1))
+    return sorted(members)
+
+
+def _compile_string(schema: Dict[str, Any], depth: int) -> CompiledSchema:
+    min_length = int(schema.get("minLength", 0))
+    max_length = schema.get("maxLength")
+    upper = int(max_length) if max_length is not None else max(min_length, DEFAULT_STRING_LENGTH)
+    format_generator = _STRING_FORMATS.get(schema.get("format"))
+    try:
+        regex = re.compile(schema["pattern"]) if isinstance(schema.get("pattern"), str) else None
+    except re.error:
+        regex = None
+
+    if regex is not None or format_generator:
+        # Patterns and formats fix the shape of the value, so both variants draw from the same
+        # generator and keep only values that also respect the length bounds
+        def fits(value):
+            return (
+                isinstance(value, str)
+                and min_length <= len(value)
+                and (max_length is None or len(value) <= upper)
+                and (regex is None or regex.search(value) is not None)
+            )
+
+        generator = _compile_pattern(regex.pattern) if regex is not None else format_generator
+        valid = boundary = _fitting(generator, fits, _schema_samples(schema))
+    else:
+        def valid(rng):
+            return _random_text(rng, rng.randint(min_length, upper))
+
+        def boundary(rng):
+            return _random_text(rng, min_length if rng.random() < 0.5 else upper)
+
+    faults: List[Generator] = [lambda rng: rng.randint(0, DEFAULT_NUMBER_SPAN)]
+    if max_length is not None:
+        faults.append(lambda rng: _random_text(rng, upper + 1))
+    if min_length > 0:
+        faults.append(lambda rng: _random_text(rng, min_length - 1))
+    if format_generator:
+        faults.append(lambda rng: f"not-a-{schema['format']}")
+
+    def invalid(rng):
+        return rng.choice(faults)(rng)
+
+    return CompiledSchema(valid, boundary, invalid)
+
+
+def _numeric_bounds(schema: Dict[str, Any], integer: bool):
+    low = schema.get("minimum")
+    high = schema.get("maximum")
+    step = 1 if integer else 1e-6
+    # OpenAPI 3.0 uses boolean exclusive flags, 3.1 uses the bound itself
+    exclusive_min = schema.get("exclusiveMinimum")
+    exclusive_max = schema.get("exclusiveMaximum")
+    if isinstance(exclusive_min, bool):
+        if exclusive_min and low is not None:
+            low += step
+    elif exclusive_min is not None:
+        low = exclusive_min + step
+    if isinstance(exclusive_max, bool):
+        if exclusive_max and high is not None:
+            high -= step
+    elif exclusive_max is not None:
+        high = exclusive_max - step
+    declared = (low is not None, high is not None)
+
+    format_bounds = _INT_FORMAT_BOUNDS.get(schema.get("format")) if integer else None
+    if format_bounds:
+        low = format_bounds[0] if low is None else low
+        high = format_bounds[1] if high is None else high
+    return low, high, declared
+
+
+def _compile_number(schema: Dict[str, Any], depth: int, integer: bool = False) -> CompiledSchema:
+    low, high, (has_low, has_high) = _numeric_bounds(schema, integer)
+    # Keep "valid" values in a small, realistic window unless the schema says otherwise
+    if has_low:
+        valid_low = low
+    else:
+        valid_low = 0 if not has_high or high >= 0 else high - DEFAULT_NUMBER_SPAN
+    valid_high = high if has_high else valid_low + DEFAULT_NUMBER_SPAN
+    if high is not None:
+        valid_high = min(valid_high, high)
+    if integer:
+        valid_low, valid_high = int(valid_low), int(valid_high)
+    edges = [value for value in (low, high) if value is not None] or [0]
+    if integer:
+        edges = [int(value) for value in edges]
+
+    if integer:
+        def valid(rng):
+            return rng.randint(valid_low, valid_high)
+    else:
+        def valid(rng):
+            return round(rng.uniform(valid_low, valid_high), 6)
+
+    def boundary(rng):
+        return rng.choice(edges)
+
+    faults: List[Generator] = [lambda rng: "not-a-number"]
+    if has_low:
+        faults.append(lambda rng: low - 1)
+    if has_high:
+        faults.append(lambda rng: high + 1)
+    if integer:
+        faults.append(lambda rng: valid_low + 0.5)
+
+    def invalid(rng):
+        return rng.choice(faults)(rng)
+
+    return CompiledSchema(valid, boundary, invalid)
+
+
+def _compile_integer(schema: Dict[str, Any], depth: int) -> CompiledSchema:
+    return _compile_number(schema, depth, integer=True)
+
+
+def _compile_boolean(schema: Dict[str, Any], depth: int) -> CompiledSchema:
+    def valid(rng):
+        return rng.random() < 0.5
+
+    def invalid(rng):
+        return "not-a-boolean"
+
+    return CompiledSchema(valid, valid, invalid)
+
+
+def _compile_array(schema: Dict[str, Any], depth: int) -> CompiledSchema:
+    items = compile_schema(schema.get("items"), depth + 1)
+    min_items = int(schema.get("minItems", 0))
+    max_items = schema.get("maxItems")
+    upper = int(max_items) if max_items is not None else min_items + DEFAULT_ARRAY_SPAN
+    item_valid, item_boundary, item_invalid = items
+
+    if schema.get("uniqueItems"):
+        def distinct(rng, size, generators):
+            values, seen = [], set()
+            for _ in range(size * MAX_FIT_ATTEMPTS):
+                if len(values) == size:
+                    break
+                for generate in generators:
+                    value = generate(rng)
+                    key = json.dumps(value, sort_keys=True, default=str)
+                    if key not in seen:
+                        seen.add(key)
+                        values.append(value)
+                        break
+            if len(values) < min_items:
+                raise SchemaNotGeneratable(f"cannot generate {min_items} unique array items")
+            return values
+
+        def valid(rng):
+            return distinct(rng, rng.randint(min_items, upper), (item_valid,))
+
+        def boundary(rng):
+            size = min_items if rng.random() < 0.5 else upper
+            return distinct(rng, size, (item_boundary, item_valid))
+    else:
+        def valid(rng):
+            return [item_valid(rng) for _ in range(rng.randint(min_items, upper))]
+
+        def boundary(rng):
+            size = min_items if rng.random() < 0.5 else upper
+            return [item_boundary(rng) for _ in range(size)]
+
+    def invalid_item(rng):
+        values = [item_valid(rng) for _ in range(max(min_items, 1))]
+        values[rng.randrange(len(values))] = item_invalid(rng)
+        return values
+
+    faults: List[Generator] = [lambda rng: {"not": "an array"}, invalid_item]
+    if max_items is not None:
+        faults.append(lambda rng: [item_valid(rng) for _ in range(upper + 1)])
+    if min_items > 0:
+        faults.append(lambda rng: [item_valid(rng) for _ in range(min_items - 1)])
+
+    def invalid(rng):
+        return rng.choice(faults)(rng)
+
+    return CompiledSchema(valid, boundary, invalid)
+
+
+def _compile_object(schema: Dict[str, Any], depth: int) -> CompiledSchema:
+    properties = [
+        (name, compile_schema(prop, depth + 1))
+        for name, prop in (schema.get("properties") or {}).items()
+        if isinstance(prop, dict)
+    ]
+    required_names = set(schema.get("required") or [])
+    required = [(name, compiled) for name, compiled in properties if name in required_names]
+    optional = [(name, compiled) for name, compiled in properties if name not in required_names]
+
+    def valid(rng):
+        value = {name: compiled.valid(rng) for name, compiled in required}
+        for name, compiled in optional:
+            if rng.random() < 0.5:
+                value[name] = compiled.valid(rng)
+        return value
+
+    def boundary(rng):
+        if rng.random() < 0.5:
+            return {name: compiled.boundary(rng) for name, compiled in required}
+        return {name: compiled.boundary(rng) for name, compiled in properties}
+
+    def invalid(rng):
+        value = {name: compiled.valid(rng) for name, compiled in properties}
+        if required and rng.random() < 0.5:
+            del value[rng.choice(required)[0]]
+        elif properties:
+            name, compiled = rng.choice(properties)
+            value[name] = compiled.invalid(rng)
+        else:
+            return ["not", "an", "object"]
+        return value
+
+    return CompiledSchema(valid, boundary, invalid)
+
+
+_COMPILERS = {
+    "string": _compile_string,
+    "integer": _compile_integer,
+    "number": _compile_number,
+    "boolean": _compile_boolean,
+    "array": _compile_array,
+    "object": _compile_object,
+}
+
+
+# ---------------------------------------------------------------------------
+# Endpoint factories
+# ---------------------------------------------------------------------------
+
+def _render(value: Any) -> str:
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (list, tuple)):
+        return ",".join(_render(item) for item in value)
+    if isinstance(value, dict):
+        return json.dumps(value, separators=(",", ":"))
+    return str(value)
+
+
+class _CompiledParameter(NamedTuple):
+    name: str
+    location: str
+    required: bool
+    schema: CompiledSchema
+
+
+class EndpointPayloadFactory:
+    """
+    Precompiled request factory for a single endpoint. Instances are immutable and safe to share
+    between coroutines and threads; all randomness comes from the `random.Random` passed in.
+    """
+
+    def __init__(self, endpoint: ProjectEndpoint):
+        self.endpoint_id = endpoint.id
+        self.method = endpoint.method
+        self.path_template = endpoint.path
+        self.parameters = [
+            _CompiledParameter(
+                name=param.name,
+                location=param.in_field,
+                # Path parameters can never be omitted from the URL
+                required=param.required or param.in_field == "path",
+                schema=compile_schema({"type": param.type or "string", "format": param.schema_format}),
+            )
+            for param in endpoint.parameters or []
+        ]
+        self.body = compile_schema(endpoint.requestBody) if endpoint.requestBody else None
+        # Fault sites for the invalid variant: one index per parameter plus the body (-1)
+        self._fault_sites = list(range(len(self.parameters))) + ([-1] if self.body else [])
+
+    def generate(self, rng: random.Random, variant: str = VARIANT_VALID) -> GeneratedRequest:
+        if variant not in VARIANTS:
+            raise ValueError(f"Unknown variant '{variant}', expected one of {', '.join(VARIANTS)}")
+        fault = rng.choice(self._fault_sites) if variant == VARIANT_INVALID and self._fault_sites else None
+        value_variant = VARIANT_BOUNDARY if variant == VARIANT_BOUNDARY else VARIANT_VALID
+
+        buckets: Dict[str, Dict[str, Any]] = {"path": {}, "query": {}, "header": {}, "cookie": {}}
+        for index, param in enumerate(self.parameters):
+            if index == fault:
+                # Either drop a required parameter or send a malformed value
+                if param.required and param.location != "path" and rng.random() < 0.5:
+                    continue
+                value = param.schema.invalid(rng)
+            elif param.required or (variant != VARIANT_BOUNDARY and rng.random() < 0.5):
+                value = getattr(param.schema, value_variant)(rng)
+            else:
+                continue
+            bucket = buckets.get(param.location)
+            if bucket is not None:
+                bucket[param.name] = value
+
+        body = None
+        if self.body:
+            body = self.body.invalid(rng) if fault == -1 else getattr(self.body, value_variant)(rng)
+
+        path = self.path_template
+        for name, value in buckets["path"].items():
+            path = path.replace("{" + name + "}", quote(_render(value), safe=""))
+
+        return GeneratedRequest(
+            method=self.method,
+            path=path,
+            path_params=buckets["path"],
+            query=buckets["query"],
+            headers={name: _render(value) for name, value in buckets["header"].items()},
+            cookies={name: _render(value) for name, value in buckets["cookie"].items()},
+            body=body,
+            variant=variant,
+        )
+
+    def stream(self, variant: str = VARIANT_VALID, seed: Optional[int] = None, count: Optional[int] = None) -> Iterator[GeneratedRequest]:
+        """
+        Yields `count` requests (endlessly if `count` is None). The same seed always yields the
+        same sequence.
+        """
+        rng = random.Random(seed)
+        produced = 0
+        while count is None or produced < count:
+            yield self.generate(rng, variant)
+            produced += 1
+
+
+def endpoint_fingerprint(endpoint: ProjectEndpoint) -> str:
+    """
+    Stable hash of everything that shapes a request for the endpoint.
+    """
+    content = {
+        "path": endpoint.path,
+        "method": endpoint.method,
+        "parameters": [param.dict(by_alias=True) for param in endpoint.parameters or []],
+        "requestBody": endpoint.requestBody,
+    }
+    encoded = json.dumps(content, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+_factory_cache: LRUCache = LRUCache(maxsize=4096)
+_factory_cache_lock = threading.Lock()
+
+
+def get_payload_factory(endpoint: ProjectEndpoint) -> EndpointPayloadFactory:
+    """
+    Returns the compiled factory for the endpoint, compiling it on first use. Entries are keyed
+    by endpoint id and content fingerprint, so a schema re-import compiles a fresh factory.
+    """
+    key = (endpoint.id, endpoint_fingerprint(endpoint))
+    with _factory_cache_lock:
+        factory = _factory_cache.get(key)
+    if factory is None:
+        factory = EndpointPayloadFactory(endpoint)
+        with _factory_cache_lock:
+            _factory_cache[key] = factory
+    return factory
+
+
+def clear_payload_factory_cache():
+    with _factory_cache_lock:
+        _factory_cache.clear()
@@ -0,0 +1,134 @@
+"""
+Buffered persistence of test results.
+
+Results are written to `projects/{project_id}/test_runs/{run_id}/results/{test_id}` instead of being referenced from an
+unbounded id array on the run document. The sink buffers results and flushes them through a
+Firestore `BulkWriter` whenever the buffer reaches `batch_size` or `flush_interval` seconds have
+passed. `put` blocks while too many results are waiting to be written, which slows the executor
+down to the rate Firestore accepts.
+"""
+import asyncio
+import random
+import time
+from typing import Any, Dict, List, Optional
+
+from common_code.blocking import FIRESTORE_BULK, run_blocking
+from config import TestRunnerConfig, get_test_runner_config
+from logconfig import get_logger
+
+logger = get_logger()
+
+RESULTS_SUBCOLLECTION = "results"
+
+
+class ResultSinkError(Exception):
+    """Raised when results could not be persisted after all retries"""
+
+
+class ResultSink:
+
+    def __init__(self, db, run_ref, extra_fields: Optional[Dict[str, Any]] = None, config: Optional[TestRunnerConfig] = None):
+        config = config or get_test_runner_config()
+        self.db = db
+        self.results_ref = run_ref.collection(RESULTS_SUBCOLLECTION)
+        self.extra_fields = extra_fields or {}
+        self.batch_size = config.sink_batch_size
+        self.flush_interval = config.sink_flush_interval
+        self.max_pending = max(config.sink_max_pending, self.batch_size)
+        self.max_retries = config.sink_max_retries
+        self.written = 0
+        self._buffer: List[Dict[str, Any]] = []
+        self._in_flight = 0
+        self._changed = asyncio.Condition()
+        self._closed = False
+        self._error: Optional[BaseException] = None
+        self._flusher = asyncio.ensure_future(self._flush_loop())
+
+    @property
+    def pending(self) -> int:
+        return len(self._buffer) + self._in_flight
+
+    async def put(self, results: List[Dict[str, Any]]):
+        async with self._changed:
+            # Backpressure: wait for the writer to catch up before accepting more
+            await self._changed.wait_for(lambda: self._error is not None or self.pending + len(results) <= self.max_pending or self.pending == 0)
+            self._raise_on_error()
+            self._buffer.extend(results)
+            self._changed.notify_all()
+
+    async def close(self):
+        async with self._changed:
+            self._closed = True
+            self._changed.notify_all()
+        await self._flusher
+        self._raise_on_error()
+
+    def _raise_on_error(self):
+        if self._error is not None:
+            raise ResultSinkError(str(self._error)) from self._error
+
+    async def _flush_loop(self):
+        try:
+            while True:
+                async with self._changed:
+                    deadline = time.monotonic() + self.flush_interval
+                    while not self._closed and len(self._buffer) < self.batch_size:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        try:
+                            await asyncio.wait_for(self._changed.wait(), remaining)
+                        except asyncio.TimeoutError:
+                            break
+                    if not self._buffer:
+                        if self._closed:
+                            return
+                        continue
+                    batch, self._buffer = self._buffer[:self.batch_size], self._buffer[self.batch_size:]
+                    self._in_flight = len(batch)
+
+                await run_blocking(FIRESTORE_BULK, self._write_with_retries, batch)
+
+                async with self._changed:
+                    self.written += len(batch)
+                    self._in_flight = 0
+                    self._changed.notify_all()
+        except BaseException as e:
+            async with self._changed:
+                self._error = e
+                self._in_flight = 0
+                self._changed.notify_all()
+            if not isinstance(e, Exception):
+                raise
+
+    def _write_with_retries(self, batch: List[Dict[str, Any]]):
+        pending = {result["id"]: result for result in batch}
+        for attempt in range(self.max_retries + 1):
+            failed = self._write_once(list(pending.values()))
+            if not failed:
+                return
+            pending = {result_id: pending[result_id] for result_id in failed}
+            if attempt < self.max_retries:
+                # Exponential backoff with full jitter
+                delay = random.uniform(0, min(30.0, 0.5 * 2 ** attempt))
+                logger.warning("Retrying failed result writes", failed=len(pending), attempt=attempt + 1, delay=round(delay, 2))
+                time.sleep(delay)
+        raise ResultSinkError(f"Failed to persist {len(pending)} test results after {self.max_retries} retries")
+
+    def _write_once(self, results: List[Dict[str, Any]]) -> List[str]:
+        failed: List[str] = []
+
+        def on_error(failure, _writer) -> bool:
+            failed.append(failure.operation.reference.id)
+            return False
+
+        writer = self.db.bulk_writer()
+        writer.on_write_error(on_error)
+        try:
+            for result in results:
+                writer.set(self.results_ref.document(result["id"]), {**result, **self.extra_fields})
+            writer.close()
+        except Exception as e:
+            logger.warning("Bulk write of test results failed", error=str(e), results=len(results))
+            return [result["id"] for result in results]
+        return failed
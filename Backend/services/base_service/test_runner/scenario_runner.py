@@ -0,0 +1,342 @@
+"""
+Dependency-aware test scenarios.
+
+A scenario is a set of HTTP steps against the project's API where a step may depend on other
+steps and pull variables out of their responses:
+
+    {"id": "create", "method": "POST", "path": "/pets", "body": {"name": "rex"},
+     "extract": {"pet_id": "body.id"}}
+    {"id": "read", "method": "GET", "path": "/pets/{{pet_id}}", "depends_on": ["create"]}
+
+`ScenarioPlan` validates the graph once (unknown or cyclic dependencies, variables that no
+ancestor produces) and precomputes children and descendants. `run_scenario` then starts every
+step as soon as its last dependency passed, so independent branches run concurrently in
+topological order. When a step fails all of its descendants are marked skipped right away
+instead of waiting for the rest of the scenario. The outcome reports the critical path: the
+chain of steps, each gated by its slowest dependency, that determined the scenario's duration.
+"""
+import asyncio
+import re
+import time
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional, Set
+from urllib.parse import quote
+
+import httpx
+
+from common_code.outbound_http import get_outbound_pool
+from test_runner.executor import STATUS_FAILED, STATUS_PASSED, STATUS_SKIPPED
+
+_STEP_ID = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+_VARIABLE = re.compile(r"\{\{\s*([A-Za-z_][A-Za-z0-9_]*)\s*\}\}")
+_EXTRACT_ROOTS = ("status_code", "headers", "body")
+
+Sender = Callable[..., Awaitable[httpx.Response]]
+
+
+class ScenarioError(ValueError):
+    """Raised for scenario definitions that can not be executed"""
+
+
+class StepOutcome(NamedTuple):
+    step_id: str
+    result: Dict[str, Any]
+    extracted: Dict[str, Any]
+    started_at: Optional[float]
+    finished_at: Optional[float]
+
+    @property
+    def passed(self) -> bool:
+        return self.result["status"] == STATUS_PASSED
+
+
+class ScenarioOutcome(NamedTuple):
+    results: List[Dict[str, Any]]
+    summary: Dict[str, Any]
+
+
+def _variables_in(value: Any) -> Set[str]:
+    if isinstance(value, str):
+        return set(_VARIABLE.findall(value))
+    if isinstance(value, dict):
+        return set().union(*(_variables_in(item) for item in value.values())) if value else set()
+    if isinstance(value, list):
+        return set().union(*(_variables_in(item) for item in value)) if value else set()
+    return set()
+
+
+def render(value: Any, variables: Dict[str, Any], quote_values: bool = False) -> Any:
+    """
+    Substitutes `{{name}}` placeholders. A string that is exactly one placeholder takes the
+    variable's value as is, so numbers and objects keep their JSON type in bodies.
+    """
+    if isinstance(value, str):
+        whole = _VARIABLE.fullmatch(value)
+        if whole and not quote_values:
+            return variables[whole.group(1)]
+        return _VARIABLE.sub(lambda match: _to_text(variables[match.group(1)], quote_values), value)
+    if isinstance(value, dict):
+        return {key: render(item, variables, quote_values) for key, item in value.items()}
+    if isinstance(value, list):
+        return [render(item, variables, quote_values) for item in value]
+    return value
+
+
+def _to_text(value: Any, quote_value: bool) -> str:
+    text = str(value).lower() if isinstance(value, bool) else str(value)
+    return quote(text, safe="") if quote_value else text
+
+
+def render_fields(fields: Dict[str, Any], variables: Dict[str, Any]) -> Dict[str, Any]:
+    """Headers and query parameters: every value is text, whatever type a variable has"""
+    rendered = {}
+    for name, value in render(fields, variables).items():
+        rendered[name] = [_to_text(item, False) for item in value] if isinstance(value, list) else _to_text(value, False)
+    return rendered
+
+
+def extract(expression: str, response: httpx.Response) -> Any:
+    """
+    Evaluates `status_code`, `headers.<name>` or `body[.<key or index>...]` against a response.
+    Raises `LookupError` when the value is not there.
+    """
+    root, _, rest = expression.partition(".")
+    if root == "status_code":
+        return response.status_code
+    if root == "headers":
+        if rest not in response.headers:
+            raise LookupError(expression)
+        return response.headers[rest]
+    try:
+        value = response.json()
+    except ValueError:
+        raise LookupError(expression)
+    for segment in rest.split(".") if rest else []:
+        if isinstance(value, list) and segment.lstrip("-").isdigit():
+            index = int(segment)
+            if not -len(value) <= index < len(value):
+                raise LookupError(expression)
+            value = value[index]
+        elif isinstance(value, dict) and segment in value:
+            value = value[segment]
+        else:
+            raise LookupError(expression)
+    return value
+
+
+class ScenarioPlan:
+    """
+    Validated, precomputed dependency graph of a scenario's steps.
+    """
+
+    def __init__(self, steps: List[Dict[str, Any]], variables: Optional[Dict[str, Any]] = None, max_steps: Optional[int] = None):
+        if not steps:
+            raise ScenarioError("A scenario needs at least one step")
+        if max_steps is not None and len(steps) > max_steps:
+            raise ScenarioError(f"A scenario may have at most {max_steps} steps")
+        self.steps: Dict[str, Dict[str, Any]] = {}
+        for step in steps:
+            step_id = step.get("id") or ""
+            if not _STEP_ID.match(step_id):
+                raise ScenarioError(f"Invalid step id '{step_id}', use up to 64 letters, digits, '_' or '-'")
+            if step_id in self.steps:
+                raise ScenarioError(f"Duplicate step id '{step_id}'")
+            self.steps[step_id] = step
+
+        self.parents: Dict[str, List[str]] = {}
+        self.children: Dict[str, List[str]] = {step_id: [] for step_id in self.steps}
+        for step_id, step in self.steps.items():
+            parents = list(dict.fromkeys(step.get("depends_on") or []))
+            for parent in parents:
+                if parent not in self.steps:
+                    raise ScenarioError(f"Step '{step_id}' depends on unknown step '{parent}'")
+                if parent == step_id:
+                    raise ScenarioError(f"Step '{step_id}' depends on itself")
+                self.children[parent].append(step_id)
+            self.parents[step_id] = parents
+
+        self.order = self._topological_order()
+        self.ancestors: Dict[str, Set[str]] = {}
+        for step_id in self.order:
+            self.ancestors[step_id] = set().union(*({parent} | self.ancestors[parent] for parent in self.parents[step_id])) if self.parents[step_id] else set()
+        self.descendants: Dict[str, Set[str]] = {}
+        for step_id in reversed(self.order):
+            self.descendants[step_id] = set().union(*({child} | self.descendants[child] for child in self.children[step_id])) if self.children[step_id] else set()
+        self._check_variables(set(variables or {}))
+
+    def _topological_order(self) -> List[str]:
+        in_degree = {step_id: len(parents) for step_id, parents in self.parents.items()}
+        ready = [step_id for step_id, degree in in_degree.items() if degree == 0]
+        order = []
+        while ready:
+            step_id = ready.pop(0)
+            order.append(step_id)
+            for child in self.children[step_id]:
+                in_degree[child] -= 1
+                if in_degree[child] == 0:
+                    ready.append(child)
+        if len(order) != len(self.steps):
+            cyclic = sorted(step_id for step_id, degree in in_degree.items() if degree > 0)
+            raise ScenarioError(f"Dependency cycle between steps {', '.join(cyclic)}")
+        return order
+
+    def _check_variables(self, initial: Set[str]):
+        producers: Dict[str, str] = {}
+        for step_id, step in self.steps.items():
+            for name, expression in (step.get("extract") or {}).items():
+                if not re.fullmatch(r"[A-Za-z_][A-Za-z0-9_]*", name):
+                    raise ScenarioError(f"Invalid variable name '{name}' in step '{step_id}'")
+                if name in initial or name in producers:
+                    raise ScenarioError(f"Variable '{name}' is set more than once")
+                root, _, rest = expression.partition(".")
+                if root not in _EXTRACT_ROOTS or (root == "headers" and not rest):
+                    raise ScenarioError(f"Invalid extract expression '{expression}' in step '{step_id}'")
+                producers[name] = step_id
+        for step_id, step in self.steps.items():
+            used = _variables_in([step.get("path"), step.get("query"), step.get("headers"), step.get("body")])
+            for name in used - initial:
+                # Only an ancestor is guaranteed to have finished before the step starts
+                if producers.get(name) not in self.ancestors[step_id]:
+                    raise ScenarioError(f"Step '{step_id}' uses '{{{{{name}}}}}' which no step it depends on extracts")
+
+
+def critical_path(plan: ScenarioPlan, outcomes: Dict[str, StepOutcome]) -> List[str]:
+    """
+    Walks back from the last step to finish, always through the dependency that finished last,
+    i.e. the one the step had to wait for.
+    """
+    timed = {step_id: outcome for step_id, outcome in outcomes.items() if outcome.finished_at is not None}
+    if not timed:
+        return []
+    path = [max(timed, key=lambda step_id: timed[step_id].finished_at)]
+    while True:
+        parents = [parent for parent in plan.parents[path[-1]] if parent in timed]
+        if not parents:
+            break
+        path.append(max(parents, key=lambda parent: timed[parent].finished_at))
+    path.reverse()
+    return path
+
+
+async def _send_step(send: Sender, base_url: str, step: Dict[str, Any], variables: Dict[str, Any], result_id: str, clock: Callable[[], float]) -> StepOutcome:
+    method = step["method"].upper()
+    path = render(step["path"], variables, quote_values=True)
+    result = {
+        "id": result_id, "endpoint_id": step.get("endpoint_id") or "", "method": method, "path": path,
+        "status": STATUS_FAILED, "response_time": 0.0, "status_code": 0, "assertions": [], "error": None,
+    }
+    started_at = clock()
+    request = {"headers": render_fields(step.get("headers") or {}, variables), "params": render_fields(step.get("query") or {}, variables)}
+    if step.get("body") is not None:
+        request["json"] = render(step["body"], variables)
+    try:
+        response = await send(method, base_url.rstrip("/") + path, **request)
+    except Exception as e:
+        # Transport errors and open circuits, but also requests httpx refuses to build; the
+        # step fails instead of the whole run
+        finished_at = clock()
+        result.update(response_time=(finished_at - started_at) * 1000, error=f"{type(e).__name__}: {e}")
+        return StepOutcome(step["id"], result, {}, started_at, finished_at)
+    finished_at = clock()
+
+    expected = step.get("expect_status")
+    status_ok = response.status_code in expected if expected else 200 <= response.status_code < 300
+    assertions = [{"type": "status_code", "expected": expected or "2xx", "actual": response.status_code, "passed": status_ok}]
+    extracted = {}
+    for name, expression in (step.get("extract") or {}).items():
+        try:
+            extracted[name] = extract(expression, response)
+            assertions.append({"type": "extract", "variable": name, "expression": expression, "passed": True})
+        except LookupError:
+            assertions.append({"type": "extract", "variable": name, "expression": expression, "passed": False})
+    passed = all(assertion["passed"] for assertion in assertions)
+    result.update(
+        status=STATUS_PASSED if passed else STATUS_FAILED,
+        response_time=(finished_at - started_at) * 1000,
+        status_code=response.status_code,
+        assertions=assertions,
+    )
+    return StepOutcome(step["id"], result, extracted, started_at, finished_at)
+
+
+def _skipped(plan: ScenarioPlan, step_id: str, failed_step: str, result_id: str) -> StepOutcome:
+    step = plan.steps[step_id]
+    result = {
+        "id": result_id, "endpoint_id": step.get("endpoint_id") or "", "method": step["method"].upper(), "path": step["path"],
+        "status": STATUS_SKIPPED, "response_time": 0.0, "status_code": 0, "assertions": [],
+        "error": f"Skipped, depends on failed step '{failed_step}'",
+    }
+    return StepOutcome(step_id, result, {}, None, None)
+
+
+async def run_scenario(
+    scenario_id: str,
+    plan: ScenarioPlan,
+    base_url: str,
+    variables: Optional[Dict[str, Any]] = None,
+    max_parallel: Optional[int] = None,
+    send: Optional[Sender] = None,
+) -> ScenarioOutcome:
+    """
+    Executes the plan and returns one `TestResult` dict per step (ids are
+    `<scenario_id>:<step_id>`) plus a summary with the critical path. Step timings are in
+    milliseconds from the start of the scenario.
+    """
+    send = send or get_outbound_pool().request
+    limit = asyncio.Semaphore(max_parallel) if max_parallel else None
+    values = dict(variables or {})
+    origin = time.monotonic()
+    clock = lambda: time.monotonic() - origin
+    waiting = {step_id: len(parents) for step_id, parents in plan.parents.items()}
+    outcomes: Dict[str, StepOutcome] = {}
+    running: Dict[asyncio.Future, str] = {}
+
+    async def execute(step_id: str) -> StepOutcome:
+        if limit is None:
+            return await _send_step(send, base_url, plan.steps[step_id], values, f"{scenario_id}:{step_id}", clock)
+        async with limit:
+            return await _send_step(send, base_url, plan.steps[step_id], values, f"{scenario_id}:{step_id}", clock)
+
+    def launch(step_id: str):
+        running[asyncio.ensure_future(execute(step_id))] = step_id
+
+    for step_id in plan.order:
+        if waiting[step_id] == 0:
+            launch(step_id)
+    try:
+        while running:
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                step_id = running.pop(task)
+                outcome = outcomes[step_id] = task.result()
+                if not outcome.passed:
+                    # Nothing below a failed step can run, settle the whole subtree now
+                    for descendant in plan.descendants[step_id]:
+                        if descendant not in outcomes:
+                            outcomes[descendant] = _skipped(plan, descendant, step_id, f"{scenario_id}:{descendant}")
+                    continue
+                values.update(outcome.extracted)
+                for child in plan.children[step_id]:
+                    waiting[child] -= 1
+                    if waiting[child] == 0 and child not in outcomes:
+                        launch(child)
+    finally:
+        for task in running:
+            task.cancel()
+
+    path = critical_path(plan, outcomes)
+    statuses = [outcome.result["status"] for outcome in outcomes.values()]
+    summary = {
+        "scenario_id": scenario_id,
+        "status": STATUS_PASSED if all(status == STATUS_PASSED for status in statuses) else STATUS_FAILED,
+        "duration": clock() * 1000,
+        "steps_passed": statuses.count(STATUS_PASSED),
+        "steps_failed": statuses.count(STATUS_FAILED),
+        "steps_skipped": statuses.count(STATUS_SKIPPED),
+        "critical_path": path,
+        "critical_path_time": sum((outcomes[step_id].finished_at - outcomes[step_id].started_at) * 1000 for step_id in path),
+        "steps": {
+            step_id: {"started_at": outcome.started_at * 1000, "finished_at": outcome.finished_at * 1000}
+            for step_id, outcome in outcomes.items() if outcome.finished_at is not None
+        },
+    }
+    return ScenarioOutcome([outcomes[step_id].result for step_id in plan.order], summary)
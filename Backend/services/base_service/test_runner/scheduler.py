@@ -0,0 +1,197 @@
+"""
+Weighted fair scheduling of test runs onto the executor.
+
+A run is split into units of `scheduler_unit_size` tests and every unit needs one of
+`scheduler_slots` execution slots. Slots are handed out by start-time fair queuing: each flow
+(one user's runs in one project) carries a virtual finish tag that advances by
+`unit_size / weight` per unit, and the queued unit with the lowest start tag goes next. A user's
+weight comes from their plan and is split across the projects they are running concurrently,
+so a large run only ever gets its fair share while other tenants are waiting, and all the idle
+capacity otherwise.
+
+Runs of at most `small_run_threshold` tests go through a priority lane that is always served
+first, so smoke runs are not queued behind bulk work. `metrics()` reports queue depth per lane
+and plan and the slot wait-time distribution.
+"""
+import asyncio
+import heapq
+import itertools
+import time
+from collections import Counter, defaultdict, deque
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from config import TestRunnerConfig, get_test_runner_config
+from test_runner.executor import percentile
+
+LANE_PRIORITY = "priority"
+LANE_NORMAL = "normal"
+LANES = (LANE_PRIORITY, LANE_NORMAL)
+
+_WAIT_SAMPLES = 1000
+
+
+class RunTicket(NamedTuple):
+    user_id: str
+    project_id: str
+    plan: str
+    test_count: int
+
+
+class _Waiter:
+
+    __slots__ = ("start_tag", "seq", "lane", "plan", "enqueued_at", "future")
+
+    def __init__(self, start_tag: float, seq: int, lane: str, plan: str, future: asyncio.Future):
+        self.start_tag = start_tag
+        self.seq = seq
+        self.lane = lane
+        self.plan = plan
+        self.enqueued_at = time.monotonic()
+        self.future = future
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.start_tag, self.seq) < (other.start_tag, other.seq)
+
+
+class FairTestScheduler:
+
+    def __init__(self, config: Optional[TestRunnerConfig] = None):
+        self.config = config or get_test_runner_config()
+        self.slots = max(1, self.config.scheduler_slots)
+        self._lanes: Dict[str, List[_Waiter]] = {lane: [] for lane in LANES}
+        self._queued: Counter = Counter()
+        self._active = 0
+        self._virtual_time = 0.0
+        self._flow_finish: Dict[Tuple[str, str], float] = {}
+        self._user_projects: Dict[str, Counter] = defaultdict(Counter)
+        self._seq = itertools.count()
+        self._waits: deque = deque(maxlen=_WAIT_SAMPLES)
+        self._granted = 0
+        self._runs = 0
+
+    def lane_for(self, ticket: RunTicket) -> str:
+        return LANE_PRIORITY if ticket.test_count <= self.config.small_run_threshold else LANE_NORMAL
+
+    def weight_for(self, ticket: RunTicket) -> float:
+        weights = self.config.plan_weights
+        plan_weight = float(weights.get(ticket.plan, weights.get("free", 1)))
+        # A user's weight is shared by the projects they are currently running
+        return plan_weight / max(1, len(self._user_projects[ticket.user_id]))
+
+    async def acquire(self, ticket: RunTicket, cost: int):
+        flow = (ticket.user_id, ticket.project_id)
+        start_tag = max(self._virtual_time, self._flow_finish.get(flow, 0.0))
+        self._flow_finish[flow] = start_tag + cost / self.weight_for(ticket)
+        lane = self.lane_for(ticket)
+        waiter = _Waiter(start_tag, next(self._seq), lane, ticket.plan, asyncio.get_running_loop().create_future())
+        heapq.heappush(self._lanes[lane], waiter)
+        self._queued[(lane, ticket.plan)] += 1
+        self._dispatch()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Granted and cancelled at once, give the slot back
+                self.release()
+            elif waiter in self._lanes[lane]:
+                self._lanes[lane].remove(waiter)
+                heapq.heapify(self._lanes[lane])
+                self._queued[(lane, ticket.plan)] -= 1
+            raise
+
+    def release(self):
+        self._active -= 1
+        self._dispatch()
+
+    def _next_waiter(self) -> Optional[_Waiter]:
+        for lane in LANES:
+            heap = self._lanes[lane]
+            while heap:
+                waiter = heapq.heappop(heap)
+                self._queued[(lane, waiter.plan)] -= 1
+                # Cancelled before its task got to leave the queue
+                if not waiter.future.cancelled():
+                    return waiter
+        return None
+
+    def _dispatch(self):
+        while self._active < self.slots:
+            waiter = self._next_waiter()
+            if waiter is None:
+                break
+            self._virtual_time = max(self._virtual_time, waiter.start_tag)
+            self._active += 1
+            self._granted += 1
+            self._waits.append(time.monotonic() - waiter.enqueued_at)
+            waiter.future.set_result(None)
+        # Flows that fell behind the virtual clock carry no state worth keeping
+        if len(self._flow_finish) > 1024:
+            self._flow_finish = {flow: tag for flow, tag in self._flow_finish.items() if tag > self._virtual_time}
+
+    async def run(self, ticket: RunTicket, test_ids: List[str], worker: Callable[[int, List[str]], Awaitable[Any]], max_parallel: Optional[int] = None):
+        """
+        Runs `worker(unit_index, unit_test_ids)` for every unit of the run, each while holding a
+        slot. At most `max_parallel` units of this run execute at once.
+        """
+        unit_size = max(1, self.config.scheduler_unit_size)
+        units = [test_ids[start:start + unit_size] for start in range(0, len(test_ids), unit_size)]
+        run_limit = asyncio.Semaphore(max_parallel) if max_parallel else None
+
+        async def execute(index: int, unit: List[str]):
+            if run_limit is not None:
+                await run_limit.acquire()
+            try:
+                # Units beyond max_parallel wait on run_limit before queueing here, so the flow's tags
+                # reflect at most max_parallel units and no slot sits idle behind the run's own limit
+                await self.acquire(ticket, len(unit))
+                try:
+                    await worker(index, unit)
+                finally:
+                    self.release()
+            finally:
+                if run_limit is not None:
+                    run_limit.release()
+
+        self._runs += 1
+        self._user_projects[ticket.user_id][ticket.project_id] += 1
+        tasks = [asyncio.ensure_future(execute(index, unit)) for index, unit in enumerate(units)]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        finally:
+            self._runs -= 1
+            projects = self._user_projects[ticket.user_id]
+            projects[ticket.project_id] -= 1
+            if projects[ticket.project_id] <= 0:
+                del projects[ticket.project_id]
+            if not projects:
+                del self._user_projects[ticket.user_id]
+
+    def metrics(self) -> Dict[str, Any]:
+        waits = sorted(self._waits)
+        queued_by_plan: Counter = Counter()
+        for (_, plan), count in self._queued.items():
+            queued_by_plan[plan] += count
+        return {
+            "slots": self.slots,
+            "active": self._active,
+            "runs_in_progress": self._runs,
+            "queued": {lane: sum(count for (queued_lane, _), count in self._queued.items() if queued_lane == lane) for lane in LANES},
+            "queued_by_plan": {plan: count for plan, count in queued_by_plan.items() if count},
+            "granted_total": self._granted,
+            "wait_seconds": {f"p{pct}": round(percentile(waits, pct), 4) for pct in (50, 95, 99)},
+        }
+
+
+_scheduler: Optional[FairTestScheduler] = None
+
+
+def get_test_run_scheduler() -> FairTestScheduler:
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = FairTestScheduler()
+    return _scheduler
@@ -0,0 +1,68 @@
+"""
+Change-based test selection.
+
+Every endpoint document carries a `content_hash` of what a test of it depends on (the request
+shape from `endpoint_fingerprint` plus the documented responses), refreshed on each schema
+import. Every test document records in `endpoint_hash` the hash of its endpoint when it last
+ran. A test is affected when the two differ: its endpoint was added, changed or removed since
+the test last ran. `test_ids: "affected"` runs the affected tests plus a seeded sample of the
+rest, so a run after a small spec change touches a small fraction of the suite while drift in
+unchanged endpoints still gets noticed.
+"""
+import hashlib
+import json
+import math
+import random
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from projects.projects_model import ProjectEndpoint
+from test_runner.payload_generator import endpoint_fingerprint
+
+SELECT_ALL = "all"
+SELECT_AFFECTED = "affected"
+# Recorded for tests whose endpoint no longer exists, so they are only picked up once
+REMOVED_ENDPOINT = ""
+
+
+class TestRef(NamedTuple):
+    test_id: str
+    endpoint_id: Optional[str]
+    endpoint_hash: Optional[str]
+
+
+def endpoint_content_hash(endpoint: ProjectEndpoint) -> str:
+    content = {"request": endpoint_fingerprint(endpoint), "responses": endpoint.responses}
+    encoded = json.dumps(content, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+def current_hash(test: TestRef, endpoint_hashes: Dict[str, str]) -> str:
+    return endpoint_hashes.get(test.endpoint_id or "", REMOVED_ENDPOINT)
+
+
+def is_affected(test: TestRef, endpoint_hashes: Dict[str, str]) -> bool:
+    return test.endpoint_hash is None or current_hash(test, endpoint_hashes) != test.endpoint_hash
+
+
+def select_affected(tests: List[TestRef], endpoint_hashes: Dict[str, str], sample_rate: float, seed: Any = None) -> Tuple[List[str], Dict[str, Any]]:
+    """
+    Returns the ids of the affected tests followed by a sample of `sample_rate` of the others,
+    and selection stats for the run document.
+    """
+    affected = [test.test_id for test in tests if is_affected(test, endpoint_hashes)]
+    unaffected = [test.test_id for test in tests if not is_affected(test, endpoint_hashes)]
+    sample_size = min(len(unaffected), math.ceil(len(unaffected) * max(0.0, sample_rate)))
+    sampled = random.Random(seed).sample(unaffected, sample_size)
+    stats = {
+        "mode": SELECT_AFFECTED,
+        "total_tests": len(tests),
+        "affected_tests": len(affected),
+        "sampled_tests": len(sampled),
+        "sample_rate": sample_rate,
+    }
+    return affected + sampled, stats
+
+
+def stale_tests(tests: List[TestRef], endpoint_hashes: Dict[str, str]) -> Dict[str, str]:
+    """Tests whose recorded hash differs from their endpoint's, with the hash to record"""
+    return {test.test_id: current_hash(test, endpoint_hashes) for test in tests if is_affected(test, endpoint_hashes)}
@@ -0,0 +1,285 @@
+"""
+Multi-process sharded test execution.
+
+A run's test ids are split into shards and executed in a spawn-based process pool, so a CPU
+heavy run is no longer capped at the single core of the uvicorn worker. Every worker streams its
+results back in batches over one shared queue; a reader thread in the parent routes the batches
+to the run they belong to, where they are folded into a `TestRunAggregator` (and handed to the
+run's `ResultSink`) as they arrive. The reader never waits on a run: batches go to the run's
+inbox without blocking, so a run with a slow sink only delays itself. Its backlog, at most the
+run's own results, waits in its inbox (logged once it passes `shard_inbox_size` batches) while
+other runs keep receiving theirs.
+
+A worker process that dies (OOM, segfault) breaks the whole pool. As soon as that is noticed, the
+pool, its queue and reader thread are replaced, and the tests a crashed shard had not reported on
+are resubmitted once before they are written off as failures.
+"""
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from config import TestRunnerConfig, get_test_runner_config
+from logconfig import get_logger
+from test_runner.executor import TestRunAggregator, evaluate_test, execute_tests
+from test_runner.result_sink import ResultSink
+
+logger = get_logger()
+
+# Legacy location of test documents, for callers that do not pass their project's collections
+TEST_RESULTS_COLLECTION = "test_results"
+
+_MESSAGE_RESULTS = "results"
+_MESSAGE_DONE = "done"
+_MESSAGE_CRASHED = "crashed"
+_MESSAGE_CANCELLED = "cancelled"
+# A shard whose worker died is retried once, a test that kills every worker must not loop
+_MAX_SHARD_ATTEMPTS = 2
+
+# Worker process state, set up by `_init_worker`
+_worker_queue = None
+_worker_db = None
+_worker_batch_size = 100
+
+
+def shard_test_ids(test_ids: List[str], shard_count: int) -> List[List[str]]:
+    """Splits test ids into at most `shard_count` contiguous, evenly sized shards"""
+    shard_count = max(1, min(shard_count, len(test_ids)))
+    size, remainder = divmod(len(test_ids), shard_count)
+    shards, start = [], 0
+    for index in range(shard_count):
+        end = start + size + (1 if index < remainder else 0)
+        shards.append(test_ids[start:end])
+        start = end
+    return [shard for shard in shards if shard]
+
+
+def _init_worker(queue, batch_size: int):
+    global _worker_queue, _worker_batch_size
+    _worker_queue = queue
+    _worker_batch_size = batch_size
+
+
+def _get_worker_db():
+    # gRPC channels are not fork safe, so every worker builds its own client
+    global _worker_db
+    if _worker_db is None:
+        from google.cloud import firestore
+        _worker_db = firestore.Client()
+    return _worker_db
+
+
+def _run_shard(run_id: str, shard_index: int, test_ids: List[str], collections: Sequence[str] = (TEST_RESULTS_COLLECTION,)) -> int:
+    executed = 0
+    try:
+        for results in execute_tests(_get_worker_db(), collections, test_ids, _worker_batch_size):
+            _worker_queue.put((run_id, shard_index, _MESSAGE_RESULTS, results))
+            executed += len(results)
+    finally:
+        _worker_queue.put((run_id, shard_index, _MESSAGE_DONE, executed))
+    return executed
+
+
+class _WorkerPool:
+    """
+    One process pool with the queue its workers report on and the thread reading that queue.
+    Notices about shards whose worker never reported back are held until the pool is retired,
+    so they are routed behind everything its workers got out.
+    """
+
+    def __init__(self, config: TestRunnerConfig, route: Callable[[Any], None]):
+        context = multiprocessing.get_context("spawn")
+        # Puts write straight to the pipe, with no feeder thread, so a shard's messages are all
+        # out by the time its future completes, even if its worker is killed right after
+        self.queue = context.SimpleQueue()
+        self.pool = ProcessPoolExecutor(
+            max_workers=config.max_workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(self.queue, config.read_batch_size),
+        )
+        self._route = route
+        self._notices: List[Any] = []
+        self._notices_lock = threading.Lock()
+        self._reader = threading.Thread(target=self._read_results, name="shard-results-reader", daemon=True)
+        self._reader.start()
+
+    def submit(self, *args) -> Future:
+        return self.pool.submit(_run_shard, *args)
+
+    def notify(self, message):
+        with self._notices_lock:
+            self._notices.append(message)
+
+    def _read_results(self):
+        while True:
+            try:
+                message = self.queue.get()
+            except (EOFError, OSError):
+                # Every writer is closed, or a killed worker left half a message behind
+                return
+            except Exception as e:
+                logger.warning("Dropping unreadable shard message", error=str(e))
+                continue
+            self._route(message)
+
+    def retire(self):
+        # Joining the pool waits until its workers are gone and it has failed or cancelled all of
+        # its futures, so every notice is in before they are routed
+        self.pool.shutdown(wait=True, cancel_futures=True)
+        # The parent never writes to the queue; closing its end lets the reader drain what the
+        # workers sent and stop at EOF, instead of waiting on a pipe or lock a dead worker left behind
+        self.queue._writer.close()
+        self._reader.join(timeout=5)
+        with self._notices_lock:
+            notices, self._notices = self._notices, []
+        for message in notices:
+            self._route(message)
+        self.queue.close()
+
+
+class ShardedTestExecutor:
+    """
+    Owns the worker pool and routes its results to the runs. One instance is shared by all runs.
+    """
+
+    def __init__(self, config: Optional[TestRunnerConfig] = None):
+        self.config = config or get_test_runner_config()
+        self._runs: Dict[str, Any] = {}
+        self._runs_lock = threading.Lock()
+        self._pool_lock = threading.Lock()
+        self._workers = _WorkerPool(self.config, self._route)
+
+    def _route(self, message):
+        run_id = message[0]
+        with self._runs_lock:
+            listener = self._runs.get(run_id)
+        if listener is None:
+            logger.warning("Dropping shard results for unknown run", run_id=run_id)
+            return
+        loop, inbox = listener
+        try:
+            loop.call_soon_threadsafe(inbox.put_nowait, message)
+        except RuntimeError:
+            # The run's event loop is gone
+            pass
+
+    def _submit(self, *args) -> Tuple[Future, _WorkerPool]:
+        """Submits a shard, replacing the pool first if a dead worker has broken it"""
+        with self._pool_lock:
+            workers = self._workers
+        try:
+            return workers.submit(*args), workers
+        except BrokenProcessPool:
+            workers = self._replace_broken(workers)
+            return workers.submit(*args), workers
+
+    def _replace_broken(self, broken: _WorkerPool) -> _WorkerPool:
+        with self._pool_lock:
+            # Every future of a broken pool fails, only the first to notice replaces it
+            if self._workers is broken:
+                logger.warning("Shard worker pool is broken, starting a new one")
+                self._workers = _WorkerPool(self.config, self._route)
+                threading.Thread(target=broken.retire, name="shard-pool-retire", daemon=True).start()
+            return self._workers
+
+    async def run(self, run_id: str, test_ids: List[str], aggregator: TestRunAggregator, sink: Optional[ResultSink] = None, shard_count: Optional[int] = None, collections: Sequence[str] = (TEST_RESULTS_COLLECTION,)) -> TestRunAggregator:
+        shards = shard_test_ids(test_ids, shard_count or self.config.max_workers)
+        loop = asyncio.get_running_loop()
+        inbox: asyncio.Queue = asyncio.Queue()
+        with self._runs_lock:
+            self._runs[run_id] = (loop, inbox)
+
+        received = [0] * len(shards)
+        attempts = [1] * len(shards)
+        pending = set(range(len(shards)))
+        backlog_logged = False
+
+        def shard_finished(workers: _WorkerPool, shard_index: int, future: Future):
+            # Errors raised in `_run_shard` are reported by its own "done" message. A worker process
+            # that died never sends one, so its pool holds a notice that is routed once the pool is
+            # retired, behind everything the worker got out before it died. Only the tests without
+            # results are then resubmitted or written off
+            if future.cancelled():
+                workers.notify((run_id, shard_index, _MESSAGE_CANCELLED, "cancelled"))
+            elif isinstance(future.exception(), BrokenProcessPool):
+                workers.notify((run_id, shard_index, _MESSAGE_CRASHED, str(future.exception())))
+                self._replace_broken(workers)
+
+        def submit(shard_index: int, shard_test_ids: List[str]):
+            future, workers = self._submit(run_id, shard_index, shard_test_ids, list(collections))
+            future.add_done_callback(lambda f: shard_finished(workers, shard_index, f))
+
+        try:
+            for shard_index, shard in enumerate(shards):
+                submit(shard_index, shard)
+
+            while pending:
+                _, shard_index, kind, payload = await inbox.get()
+                if not backlog_logged and inbox.qsize() > self.config.shard_inbox_size:
+                    backlog_logged = True
+                    logger.warning("Shard results are piling up behind the result sink", run_id=run_id, batches=inbox.qsize())
+                if kind == _MESSAGE_RESULTS:
+                    if shard_index not in pending:
+                        logger.warning("Dropping results of a settled shard", run_id=run_id, shard=shard_index, results=len(payload))
+                        continue
+                    aggregator.extend(payload)
+                    received[shard_index] += len(payload)
+                    if sink is not None:
+                        await sink.put(payload)
+                elif shard_index in pending:
+                    remaining = shards[shard_index][received[shard_index]:]
+                    if kind == _MESSAGE_CRASHED and remaining and attempts[shard_index] < _MAX_SHARD_ATTEMPTS:
+                        attempts[shard_index] += 1
+                        logger.warning("Test shard crashed, resubmitting its remaining tests", run_id=run_id, shard=shard_index, tests=len(remaining), error=str(payload))
+                        submit(shard_index, remaining)
+                        continue
+                    pending.discard(shard_index)
+                    if kind != _MESSAGE_DONE:
+                        logger.warning("Test shard failed", run_id=run_id, shard=shard_index, error=str(payload))
+                    # Tests a failed shard never reported on count as failures
+                    missing = []
+                    for test_id in remaining:
+                        result = evaluate_test(test_id, None)
+                        result["error"] = "Shard execution failed"
+                        missing.append(result)
+                    aggregator.extend(missing)
+                    if sink is not None and missing:
+                        await sink.put(missing)
+        finally:
+            with self._runs_lock:
+                self._runs.pop(run_id, None)
+        return aggregator
+
+    def shutdown(self):
+        with self._pool_lock:
+            workers = self._workers
+        workers.retire()
+
+
+_executor: Optional[ShardedTestExecutor] = None
+
+
+def should_shard(test_config: Dict[str, Any], test_count: int) -> bool:
+    mode = test_config.get("execution")
+    if mode == "sharded":
+        return True
+    if mode == "inline":
+        return False
+    return test_count >= get_test_runner_config().shard_threshold
+
+
+def get_sharded_executor() -> ShardedTestExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ShardedTestExecutor()
+    return _executor
+
+
+def shutdown_sharded_executor():
+    global _executor
+    if _executor is not None:
+        executor, _executor = _executor, None
+        executor.shutdown()
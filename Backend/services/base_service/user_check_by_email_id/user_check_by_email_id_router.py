@@ -1,11 +1,12 @@
 from fastapi import APIRouter
+from common_code.fast_response import ValidatedModelRoute
 from user_check_by_email_id.user_check_by_email_id import check_user_or_not
 from pydantic import BaseModel
 
 class CheckUserExistsOrNot(BaseModel):
     is_exists:bool
 
-router=APIRouter()
+router=APIRouter(route_class=ValidatedModelRoute)
 
 @router.get(
     "/",
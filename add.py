@@ -1,13 +1,19 @@
 from google.cloud import firestore
+from importlib.metadata import version
+from pathlib import Path
+import sys
 import time
 
+# The catalog version helpers live in the API service package
+sys.path.insert(0, str(Path(__file__).resolve().parent / "Backend" / "services" / "base_service"))
+from aimodels.aimodels import bump_ai_models_version
+
 # Try to get the version directly from the module, if available
 try:
     firestore_version = firestore.__version__
 except AttributeError:
-    # Fallback: use pkg_resources to get the version info
-    import pkg_resources
-    firestore_version = pkg_resources.get_distribution("google-cloud-firestore").version
+    # Fallback: read the installed distribution's metadata
+    firestore_version = version("google-cloud-firestore")
 
 print("Firestore library version used:", firestore_version)
 
@@ -16,7 +22,10 @@ db = firestore.Client()
 
 def add_ai_model(model_id, name, model_type, is_free, description, metadata=None):
     """
-    Adds a new AI model to the 'aimodels' collection.
+    Adds a new AI model to the 'aimodels' collection and bumps the catalog version, so the
+    `/aimodels` ETag changes and clients refetch.
+    To seed or update many models, use `python -m aimodels.catalog_sync <manifest>` from
+    Backend/services/base_service instead.
     """
     aimodels_ref = db.collection('aimodels')
     model_ref = aimodels_ref.document(model_id)
@@ -33,6 +42,7 @@ def add_ai_model(model_id, name, model_type, is_free, description, metadata=None
     }
     
     model_ref.set(model_data)
+    bump_ai_models_version()
     print(f"AI Model '{name}' added with ID: {model_id}")
 
 def add_dummy_subcollection_data(model_id):
@@ -49,9 +59,11 @@ def add_dummy_subcollection_data(model_id):
         {'dummy_field': 'dummy_value_2', 'timestamp': int(time.time())},
     ]
     
+    # One batch commit, each document() call generates an auto-ID
+    batch = db.batch()
     for data in dummy_documents:
-        # Using add() to generate an auto-ID for each document
-        subcollection_ref.add(data)
+        batch.set(subcollection_ref.document(), data)
+    batch.commit()
     
     print(f"Dummy subcollection data added to model ID: {model_id}")
 